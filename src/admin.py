@@ -0,0 +1,46 @@
+"""
+Hidden performance panel for the web front-end
+
+Function:
+
+    render_panel()
+"""
+
+import pandas as pd
+import streamlit as st
+
+import cache
+import metrics
+import warmup
+
+
+def render_panel():
+    """
+    Displays per-search latency percentiles, cache counters and metric exports in web browser.
+
+    :return: void
+    """
+    '# Search performance'
+    stats = metrics.summary()
+    if not stats:
+        st.write(f"No searches recorded yet.")
+    else:
+        rows = []
+        for family, s in stats.items():
+            row = {'search': family, 'count': s['count'], 'avg rows': round(s['rows'] / s['count'], 1),
+                   'cache hit rate': f"{s['cache_hits'] / max(1, s['cache_hits'] + s['cache_misses']):.0%}"}
+            for phase in metrics.PHASES:
+                for q in metrics.QUANTILES:
+                    row[f"{phase} p{int(q * 100)} (ms)"] = round(s[phase][q] * 1000, 1)
+            rows.append(row)
+        st.dataframe(pd.DataFrame(rows).set_index('search'))
+
+    '## Startup warm-up'
+    st.write({stage: f"{seconds:.2f}s" for stage, seconds in warmup.timings().items()} or "Not finished yet.")
+
+    '## Result cache'
+    st.write(cache.get_cache().stats())
+
+    '## Export'
+    st.download_button('Prometheus text', metrics.to_prometheus(), file_name='searches.prom', mime='text/plain')
+    st.download_button('JSON lines', metrics.to_jsonl(), file_name='searches.jsonl', mime='application/json')
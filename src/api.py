@@ -0,0 +1,269 @@
+"""
+Headless HTTP JSON API over the search engine, for CRM integrations
+
+Serves the searches of the web front-end as GET endpoints returning JSON. Input is validated by the
+same engine.py builders, and the same named statements in queries.STATEMENTS run on an asyncpg
+pool, so many requests are served concurrently by one process. Paged searches run their count and
+page statements at the same time on two connections; /projects also returns the number of
+buildings per property type, class and status in the city or ZIP code ("facets"), queried alongside.
+When one of these queries fails, the others are cancelled rather than left running.
+
+Each request has a time budget. When it runs out, or the client disconnects, the running query is
+cancelled on the server rather than left to finish. statement_timeout is set on every pooled
+connection as a backstop. Connection parameters come from the [postgresql] section of
+database.ini, and the API is tuned from an optional [api] section:
+
+    [api]
+    minconn = 1                   ; connections opened at startup
+    maxconn = 10                  ; hard upper bound on open connections
+    timeout = 10                  ; seconds a request may spend in the database
+
+Usage (from src/):
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+
+e.g. GET /projects?state=NY&city=new%20york&property_type=Office&page=2&page_size=25
+
+Functions:
+
+    query(Request, string, tuple, float)
+    run_search(Request, Search, int, int)
+"""
+
+import asyncio
+import decimal
+from contextlib import asynccontextmanager
+from typing import List
+
+import asyncpg
+from fastapi import FastAPI, HTTPException, Query, Request
+
+import db
+import engine
+import limits
+import refdata
+import typeahead
+import watermarks
+from queries import STATEMENTS, family, typed_sql
+from constants import STATES, PAGE_SIZES
+
+API_DEFAULTS = {'minconn': 1, 'maxconn': 10, 'timeout': 10.0}
+# Seconds between checks for a client that has gone away while its query runs
+DISCONNECT_POLL = 0.25
+# asyncpg prepares statements without PREPARE's type list, so every parameter is cast in place instead
+TYPED_SQL = {name: typed_sql(name) for name in STATEMENTS}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    settings = db.get_settings('api', API_DEFAULTS)
+    config = dict(db.get_config())
+    if 'dbname' in config:
+        config['database'] = config.pop('dbname')
+    if 'port' in config:
+        config['port'] = int(config['port'])
+    app.state.timeout = settings['timeout']
+    # Load the reference data before serving, so no request blocks the event loop on it
+    await asyncio.get_running_loop().run_in_executor(None, refdata.get)
+    refdata.start_schedule()
+    typeahead.start()
+    watermarks.start()
+    app.state.pool = await asyncpg.create_pool(
+        min_size=settings['minconn'], max_size=settings['maxconn'],
+        server_settings={'statement_timeout': str(int(settings['timeout'] * 1000))}, **config)
+    try:
+        yield
+    finally:
+        await app.state.pool.close()
+
+
+app = FastAPI(title='Real estate search', lifespan=lifespan)
+
+
+def _bind(name, params):
+    values = []
+    for arg_type, value in zip(STATEMENTS[name].arg_types, params):
+        if isinstance(value, tuple):
+            value = list(value)
+        elif arg_type == 'numeric':
+            value = decimal.Decimal(str(value))
+        values.append(value)
+    return values
+
+
+async def _gather(*coroutines):
+    # Like asyncio.gather, but a query that fails cancels its siblings instead of leaving them running on the pool
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Wait for the cancelled queries to hand their connections back before the error is answered
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def query(request, name, params, deadline):
+    """
+    Runs a named statement on a pooled connection, cancelling it on the server if the deadline
+    passes or the client disconnects first.
+
+    :param request: A fastapi Request object, watched for the client disconnecting
+    :param name: A string object naming an entry of queries.STATEMENTS
+    :param params: A tuple of parameter values in $1..$n order; tuples are bound as arrays
+    :param deadline: A float object, the event loop time by which the query must finish
+    :return: A list of dictionary objects, one per row
+    """
+    loop = asyncio.get_running_loop()
+    search_family = family(name)
+    try:
+        limits.check(search_family, params)
+    except limits.SearchTooBroad as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    # The family's statement timeout, unless the request's own budget runs out first
+    budget = deadline - loop.time()
+    if limits.timeout(search_family) > 0:
+        budget = min(budget, limits.timeout(search_family))
+
+    async def fetch():
+        async with request.app.state.pool.acquire() as conn:
+            # asyncpg sends a cancel request to the server when a query times out or its task is cancelled
+            return await conn.fetch(TYPED_SQL[name], *_bind(name, params), timeout=max(0.0, budget))
+
+    task = asyncio.ensure_future(fetch())
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL)
+            if done:
+                return [dict(row) for row in task.result()]
+            if await request.is_disconnected():
+                raise HTTPException(status_code=499, detail='client closed request')
+    except (asyncio.TimeoutError, asyncpg.QueryCanceledError):
+        # QueryCanceledError: statement_timeout fired on the server
+        limits.record_timeout(search_family, params)
+        raise HTTPException(status_code=504, detail=limits.TOO_BROAD)
+    finally:
+        task.cancel()
+        # The connection goes back to the pool once the cancelled query has been stopped on the server
+        await asyncio.wait({task})
+
+
+async def run_search(request, search, page, page_size):
+    """
+    :param request: A fastapi Request object
+    :param search: An engine.Search object, or None if a required field is missing
+    :param page: An integer object, the page to return, starting at 1
+    :param page_size: An integer object, the number of properties or companies per page
+    :return: A dictionary object holding the total (paged searches only) and the result rows
+    """
+    if search is None:
+        raise HTTPException(status_code=422, detail='a required search field is missing')
+    deadline = asyncio.get_running_loop().time() + request.app.state.timeout
+    if not engine.paged(search):
+        return {'results': await query(request, search.name, search.params, deadline)}
+    counted, rows = await _gather(
+        query(request, f'{search.name}_count', search.params, deadline),
+        query(request, f'{search.name}_page', search.params + (page_size, (page - 1) * page_size), deadline))
+    return {'total': counted[0]['total'], 'page': page, 'page_size': page_size, 'results': rows}
+
+
+def _build(builder, *args):
+    try:
+        return builder(*args)
+    except engine.InvalidSearch as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+PAGE = Query(1, ge=1)
+PAGE_SIZE = Query(PAGE_SIZES[1], ge=1, le=max(PAGE_SIZES))
+
+
+@app.get('/projects')
+async def projects(request: Request, state: str, city: str, zip: str = '',
+                   property_type: List[str] = Query(None), property_class: List[str] = Query(None),
+                   status: List[str] = Query(None), page: int = PAGE, page_size: int = PAGE_SIZE):
+    if state not in STATES:
+        raise HTTPException(status_code=422, detail='unknown state')
+    search = _build(engine.projects, state, city, zip, property_type, property_class, status)
+    if search is None:
+        return await run_search(request, search, page, page_size)
+    # Buildings per type, class and status in the city or ZIP code, queried alongside the count and page
+    location = search.params[:2] + (search.params[5] if search.name == 'projects_zip' else 0,)
+    deadline = asyncio.get_running_loop().time() + request.app.state.timeout
+    found, rows = await _gather(run_search(request, search, page, page_size),
+                                query(request, 'project_facets', location, deadline))
+    found['facets'] = {facet: {} for facet in ('type', 'class', 'status')}
+    for row in rows:
+        found['facets'][row['facet']][row['value']] = row['buildings']
+    return found
+
+
+@app.get('/projects/near')
+async def projects_near(request: Request, lat: float = Query(..., ge=-90, le=90),
+                        lon: float = Query(..., ge=-180, le=180), miles: float = Query(..., gt=0, le=engine.MAX_MILES),
+                        property_type: List[str] = Query(None), property_class: List[str] = Query(None),
+                        status: List[str] = Query(None), page: int = PAGE, page_size: int = PAGE_SIZE):
+    # Takes coordinates only; addresses are geocoded by the caller
+    search = _build(engine.nearby, (lat, lon), miles, property_type, property_class, status)
+    return await run_search(request, search, page, page_size)
+
+
+@app.get('/projects/in-box')
+async def projects_in_box(request: Request, south: float, west: float, north: float, east: float,
+                          property_type: List[str] = Query(None), property_class: List[str] = Query(None),
+                          status: List[str] = Query(None), page: int = PAGE, page_size: int = PAGE_SIZE):
+    search = _build(engine.in_box, south, west, north, east, property_type, property_class, status)
+    return await run_search(request, search, page, page_size)
+
+
+@app.get('/project-details')
+async def project_details(request: Request, street_address: str, city: str, state: str, zip: str):
+    search = _build(engine.project_details, street_address, city, state, zip)
+    return await run_search(request, search, 1, 1)
+
+
+@app.get('/developers')
+async def developers(request: Request, region: List[str] = Query([]), property_type: List[str] = Query([]),
+                     min_projects: int = Query(0, ge=0), name: str = '', page: int = PAGE,
+                     page_size: int = PAGE_SIZE):
+    search = _build(engine.developers, region or engine.regions(), property_type, min_projects, name)
+    return await run_search(request, search, page, page_size)
+
+
+@app.get('/architects')
+async def architects(request: Request, property_type: List[str] = Query([]), min_projects: int = Query(0, ge=0),
+                     name: str = '', page: int = PAGE, page_size: int = PAGE_SIZE):
+    search = _build(engine.architects, property_type, min_projects, name)
+    return await run_search(request, search, page, page_size)
+
+
+@app.get('/engineers')
+async def engineers(request: Request, property_type: List[str] = Query([]), min_projects: int = Query(0, ge=0),
+                    name: str = '', page: int = PAGE, page_size: int = PAGE_SIZE):
+    search = _build(engine.engineers, property_type, min_projects, name)
+    return await run_search(request, search, page, page_size)
+
+
+@app.get('/contractors')
+async def contractors(request: Request, min_space: float = Query(0.0, ge=0), min_projects: int = Query(0, ge=0),
+                      name: str = '', page: int = PAGE, page_size: int = PAGE_SIZE):
+    search = _build(engine.contractors, min_space, min_projects, name)
+    return await run_search(request, search, page, page_size)
+
+
+@app.get('/lenders')
+async def lenders(request: Request, amount: float = Query(0.0, ge=0), rate: float = Query(0.0, ge=0, le=100),
+                  ltc: float = Query(0.0, ge=0, le=100), min_projects: int = Query(0, ge=0), name: str = '',
+                  page: int = PAGE, page_size: int = PAGE_SIZE):
+    search = _build(engine.lenders, amount, rate, ltc, min_projects, name)
+    return await run_search(request, search, page, page_size)
+
+
+@app.get('/suggest')
+async def suggest(kind: str = Query(..., pattern='^(company|street|address)$'), q: str = '',
+                  limit: int = Query(None, ge=1, le=100)):
+    # Served from the in-process typeahead indexes, without a database round trip
+    if kind == 'address':
+        return typeahead.suggest_address(q, limit)
+    return typeahead.suggest(kind, q, limit)
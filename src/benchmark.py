@@ -0,0 +1,254 @@
+"""
+Offline benchmark of every search path in the web front-end
+
+Runs each search of project.py against the database in database.ini (typically one loaded with
+synthetic.py) through the engine calls the page makes, and times its phases separately: executing
+the statements (or, for lenders, matching the in-memory index), fetching the rows into a DataFrame,
+and collecting the records for display. Paged searches are timed step by step as the page runs them:
+the total (with the filter counts of Projects), the map clusters of map searches and the first
+page; a project team is timed as a whole, its roles running at once. The result cache is emptied
+before every run, so every run reaches the database; the lender index is kept, as the app keeps it.
+Searches run under the [timeouts] limits of the app, so a search that times out stops the benchmark.
+
+Parameters are picked from the loaded data (the largest and smallest city, a real address, a
+building with coordinates for the map searches, which are skipped when no building has any), so the
+same data set always produces the same searches. The report is printed and written as JSON;
+passing an earlier report as --baseline adds the change in median time per search.
+
+Usage (from src/):
+
+    python benchmark.py --repeat 5 --out after.json --baseline before.json
+
+Functions:
+
+    sample_cases(connection)
+    run_case(Search, int)
+    run(int)
+    compare(dictionary, dictionary)
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import time
+
+import psycopg2
+
+import cache
+import db
+import engine
+import lending
+import metrics
+import queries
+from constants import PROPERTY_TYPES, PROPERTY_CLASSES, STATUSES, REGIONS
+
+PHASES = ('db', 'fetch', 'transform', 'total')
+PAGE_SIZE = 25
+# Half the height and width in degrees of the map area searched around the sample building
+BOX_DEGREES = 0.25
+
+
+def sample_cases(conn):
+    """
+    Builds the searches to time from the loaded data, with the engine's builders as the front-end does.
+
+    :param conn: A PooledConnection object
+    :return: A list of (label, search) pairs; search is an engine.Search object, or a dictionary of role -> Search
+             object for a project team
+    """
+    with conn.cursor() as cur:
+        # Buildings without a class never match the property class filter
+        cur.execute("""SELECT state, LOWER(city), MIN(zip), COUNT(*) FROM Buildings WHERE property_class IS NOT NULL
+                       GROUP BY state, LOWER(city) ORDER BY COUNT(*) DESC, 1, 2;""")
+        cities = cur.fetchall()
+        cur.execute("""SELECT B.street_num, LOWER(B.street_name), LOWER(B.city), B.state, B.zip
+                       FROM Buildings B JOIN Projects P ON P.b_id = B.building_id
+                       ORDER BY B.building_id LIMIT 1;""")
+        address = cur.fetchone()
+    conn.rollback()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""SELECT latitude, longitude FROM Buildings WHERE latitude IS NOT NULL
+                           ORDER BY building_id LIMIT 1;""")
+            location = cur.fetchone()
+    except psycopg2.Error:
+        # Before migration 0004 buildings have no coordinates
+        location = None
+    conn.rollback()
+    if not cities or not address:
+        raise RuntimeError("the database holds no projects; load a data set with synthetic.py first")
+
+    (large_state, large_city, large_zip, _), (small_state, small_city, _, _) = cities[0], cities[-1]
+    filters = (PROPERTY_TYPES, PROPERTY_CLASSES, STATUSES)
+    st_num, st_name, city, state, zipcode = address
+    cases = [
+        ('projects, largest city', engine.projects(large_state, large_city, '', *filters)),
+        ('projects, smallest city', engine.projects(small_state, small_city, '', *filters)),
+        ('projects by zip', engine.projects(large_state, large_city, f'{large_zip:05d}', *filters)),
+        ('project details', engine.project_details(f'{st_num} {st_name}', city, state, f'{zipcode:05d}')),
+        ('developers', engine.developers(REGIONS)),
+        ('developers by name', engine.developers(REGIONS, name='summit')),
+        ('developers by type', engine.developers(REGIONS, ['Office'])),
+        ('architects', engine.architects()),
+        ('architects by type', engine.architects(['Office'])),
+        ('engineers', engine.engineers()),
+        ('engineers by type', engine.engineers(['Office'])),
+        ('contractors', engine.contractors()),
+        ('contractors, 5M+ sqft', engine.contractors(5, 1)),
+        ('lenders', engine.lenders(50.0, 5.0, 70.0)),
+        ('project team', engine.team(['Office'], REGIONS)),
+    ]
+    if location:
+        lat, lon = location
+        cases += [
+            ('projects near a building', engine.nearby((lat, lon), 5, *filters)),
+            ('projects in a map area', engine.in_box(lat - BOX_DEGREES, lon - BOX_DEGREES, lat + BOX_DEGREES,
+                                                     lon + BOX_DEGREES, *filters)),
+        ]
+    return cases
+
+
+def _count(search):
+    found = engine.count(search)
+    if f'{search.name}_summary' in queries.STATEMENTS:
+        # The Projects filter counts come with the total, as on the page
+        engine.facets(search)
+    return found
+
+
+def _steps(search):
+    # The engine calls project.py makes to show a search, each returning the number of entries it found
+    if isinstance(search, dict):
+        return {'team': lambda: len(engine.build_team(search).ranked)}
+    if not engine.paged(search):
+        return {'full': lambda: len(engine.records(search))}
+    steps = {'count': lambda: _count(search)}
+    if engine.mapped(search):
+        steps['clusters'] = lambda: int(engine.clusters(search)['buildings'].sum())
+    steps['page'] = lambda: len(engine.records(search, 1, PAGE_SIZE))
+    return steps
+
+
+def _empty_cache():
+    # Every run reaches the database, but lenders are matched against the index the app keeps in memory
+    index = lending.get_index()
+    result_cache = cache.get_cache()
+    result_cache.clear()
+    result_cache.put(('lender_index',), index, 'lender_terms', queries.STATEMENTS['lender_terms'].tables)
+
+
+def _time_step(step):
+    _empty_cache()
+    with metrics.search('benchmark') as trace:
+        found = step()
+    return {phase: trace[phase] for phase in PHASES}, found
+
+
+def run_case(search, repeat=5):
+    """
+    Times one search, step by step as the front-end runs it.
+
+    Every step runs once untimed first, so preparing its statements on the pooled connections is not counted.
+    A team's roles are traced in their own threads, so only its total time is reported.
+
+    :param search: An engine.Search object, or a dictionary of role -> Search object for a project team
+    :param repeat: An integer object, the number of timed runs per step
+    :return: A dictionary object mapping each step ('full', 'count', 'clusters', 'page' or 'team') to the entries
+             it found and per-phase {min, median, max} seconds
+    """
+    result = {}
+    for step_name, step in _steps(search).items():
+        _time_step(step)
+        runs = []
+        for _ in range(repeat):
+            timings, found = _time_step(step)
+            runs.append(timings)
+        result[step_name] = {'found': found}
+        for phase in PHASES:
+            values = [r[phase] for r in runs]
+            result[step_name][phase] = {'min': min(values), 'median': statistics.median(values), 'max': max(values)}
+    return result
+
+
+def _describe(conn):
+    with conn.cursor() as cur:
+        cur.execute("SHOW server_version;")
+        version = cur.fetchone()[0]
+        counts = {}
+        for table in ('Buildings', 'Companies', 'Projects', 'Used_as', 'Specializes_in', 'Owned_by',
+                      'Recieved_award'):
+            cur.execute(f"SELECT COUNT(*) FROM {table};")
+            counts[table] = cur.fetchone()[0]
+    conn.rollback()
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit, 'server_version': version,
+            'rows': counts}
+
+
+def run(repeat=5):
+    """
+    Times every search.
+
+    :param repeat: An integer object, the number of timed runs per step
+    :return: A dictionary object holding 'meta' (data set and code version) and 'results' per search label
+    """
+    with db.connection() as conn:
+        report = {'meta': _describe(conn), 'results': {}}
+        cases = sample_cases(conn)
+    report['meta']['repeat'] = repeat
+    # The searches take their own connections from the pool
+    for label, search in cases:
+        report['results'][label] = run_case(search, repeat)
+    return report
+
+
+def compare(report, baseline):
+    """
+    :param report: A dictionary object returned by run()
+    :param baseline: A dictionary object returned by an earlier run()
+    :return: A dictionary object mapping (label, step) to the relative change in median total time
+    """
+    changes = {}
+    for label, steps in report['results'].items():
+        for step, timing in steps.items():
+            before = baseline['results'].get(label, {}).get(step)
+            if before and before['total']['median'] > 0:
+                changes[(label, step)] = timing['total']['median'] / before['total']['median'] - 1
+    return changes
+
+
+def _print(report, changes):
+    meta = report['meta']
+    print(f"commit {meta['commit'] or '-'}, PostgreSQL {meta['server_version']}, "
+          f"{', '.join(f'{n:,} {t}' for t, n in meta['rows'].items())}; median of {meta['repeat']} runs in ms")
+    header = f"{'search':26} {'step':8} {'found':>8}" + ''.join(f"{p:>10}" for p in PHASES)
+    print(header + (f"{'vs base':>10}" if changes else ''))
+    for label, steps in report['results'].items():
+        for step, timing in steps.items():
+            line = f"{label:26} {step:8} {timing['found']:>8,}"
+            line += ''.join(f"{timing[p]['median'] * 1000:>10.2f}" for p in PHASES)
+            if (label, step) in changes:
+                line += f"{changes[(label, step)]:>+10.1%}"
+            print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time every search against the configured database.')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per statement')
+    parser.add_argument('--out', default='benchmark.json', help='where to write the JSON report')
+    parser.add_argument('--baseline', help='an earlier JSON report to compare against')
+    args = parser.parse_args()
+
+    result = run(args.repeat)
+    with open(args.out, 'w') as f:
+        json.dump(result, f, indent=2)
+    comparison = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparison = compare(result, json.load(f))
+    _print(result, comparison)
@@ -0,0 +1,211 @@
+"""
+Bounded, process-wide cache of query results
+
+Entries are evicted least-recently-used once their combined size passes a byte budget, and
+expire after a time-to-live chosen per query family. Cached results are returned as-is (no copy
+and no mutation check), so callers must treat them as read-only. Every entry records the tables
+it was read from, so a data change can drop just the results that depend on those tables.
+Concurrent misses for the same key are coalesced into a single load.
+
+The cache is tuned from an optional [cache] section of database.ini:
+
+    [cache]
+    max_mb = 256                  ; byte budget for all cached results
+    ttl = 300                     ; default time-to-live (seconds)
+    ttl_developer_regions = 3600  ; per-family override, ttl_<family> = seconds
+
+Functions:
+
+    get_cache()
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import db
+
+CACHE_DEFAULTS = {'max_mb': 256.0, 'ttl': 300.0}
+FAMILY_TTLS = {'developer_regions': 3600.0}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _deep_sizeof(value, seen):
+    # Each object is counted once, however many records share it (e.g. interned strings)
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in value)
+    elif isinstance(value, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in value.items())
+    else:
+        # Result records (see results.py) keep their values in __slots__
+        for cls in type(value).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                size += _deep_sizeof(getattr(value, name, None), seen)
+    return size
+
+
+def _sizeof(value):
+    if hasattr(value, 'memory_usage'):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if hasattr(value, 'nbytes'):
+        # numpy arrays, and indexes built from query results (e.g. lending.LenderIndex)
+        return int(value.nbytes)
+    return _deep_sizeof(value, set())
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache bounded by total size in bytes, with per-family expiry and table tags.
+    """
+
+    def __init__(self, max_bytes, default_ttl, ttls=None):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = self.coalesced = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Looks up a cached result, counting the hit or miss.
+
+        :param key: A hashable object identifying the query
+        :return: The cached object, or None when absent or expired
+        """
+        with self._lock:
+            return self._get(key)
+
+    def load(self, key, loader, family, tables=()):
+        """
+        Returns a cached result, or runs loader and caches its result. Concurrent calls for a key
+        that is already loading wait for that load instead of running loader again (single-flight).
+
+        :param key: A hashable object identifying the query
+        :param loader: A function taking no arguments and returning the object to cache
+        :param family: A string object naming the query family, which selects the time-to-live
+        :param tables: An iterable of the table names the result is read from
+        :return: A (value, outcome) pair; outcome is 'hit', 'coalesced' (waited for another load) or 'miss'
+        """
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                return value, 'hit'
+            flight = self._loading.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._loading[key] = {'done': threading.Event(), 'value': None, 'error': None}
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight['done'].wait()
+            if flight['error'] is not None:
+                raise flight['error']
+            return flight['value'], 'coalesced'
+        try:
+            flight['value'] = loader()
+            self.put(key, flight['value'], family, tables)
+        except Exception as e:
+            flight['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._loading[key]
+            flight['done'].set()
+        return flight['value'], 'miss'
+
+    def put(self, key, value, family, tables=()):
+        """
+        Stores a result, evicting the least recently used entries to stay within the byte budget.
+
+        :param key: A hashable object identifying the query
+        :param value: The object to cache
+        :param family: A string object naming the query family, which selects the time-to-live
+        :param tables: An iterable of the table names the result was read from
+        :return: void
+        """
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttls.get(family, self.default_ttl)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size, expires, frozenset(t.lower() for t in tables))
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tables):
+        """
+        Drops every cached result read from any of the given tables.
+
+        :param tables: Table names, matched case-insensitively
+        :return: An integer object counting the dropped entries
+        """
+        changed = {t.lower() for t in tables}
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[3] & changed]
+            for key in stale:
+                self._drop(key)
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        :return: A dictionary object of entry count, bytes used, loads in flight and hit/miss/eviction counters
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'expirations': self.expirations, 'invalidations': self.invalidations,
+                    'coalesced': self.coalesced, 'loading': len(self._loading)}
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[1]
+
+
+def get_cache():
+    """
+    Returns the process-wide result cache, creating it from the config file on first use.
+
+    :return: A ResultCache object
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                settings = db.get_settings('cache', CACHE_DEFAULTS)
+                ttls = dict(FAMILY_TTLS)
+                ttls.update({key[len('ttl_'):]: float(value) for key, value in settings.items()
+                             if key.startswith('ttl_')})
+                _cache = ResultCache(int(settings['max_mb'] * 1024 * 1024), settings['ttl'], ttls)
+    return _cache
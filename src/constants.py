@@ -11,4 +11,7 @@ STATUSES = ['completed', 'under construction', 'planned']
 REGIONS = ['National', 'New England', 'Mid-Atlantic', 'Midwest', 'S.Atlantic', 'S.Central', 'West']
 DESIGNER_TYPES = ['Architect', 'Architect-Engineer']
 SIZES = [' Any', '>= 5', '>= 10', '>= 15', '>= 20']
-OPTIONS = ['Select an option', 'Projects', 'Project details', 'Lead Generation']
+PAGE_SIZES = [10, 25, 50, 100]
+DEBOUNCE_SECONDS = 0.4
+OPTIONS = ['Select an option', 'Projects', 'Projects on a map', 'Project details', 'Lead Generation']
+MAP_MODES = ['Near a location', 'In a map area']
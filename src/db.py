@@ -0,0 +1,345 @@
+"""
+Pooled connections to the database shared by every Streamlit session
+
+The pool is created lazily on first use and lives for the whole server process, so all
+sessions (and Streamlit's script threads) reuse the same long-lived connections.
+
+Connection parameters are read from the [postgresql] section of database.ini. The pool
+itself is tuned from an optional [pool] section:
+
+    [pool]
+    minconn = 1                   ; connections opened when the pool is created
+    maxconn = 10                  ; hard upper bound on open connections, all kept open once used
+    timeout = 30                  ; seconds to wait for a free connection
+    health_check_interval = 30    ; ping connections idle for longer than this (seconds)
+
+Searches can be spread over read replicas, each described by its own section in the format of
+[postgresql] and pooled like it. Only connections checked out with read_only=True go to a
+replica; everything else, and reads while no replica is available, go to the primary:
+
+    [routing]
+    replicas = replica1, replica2 ; config sections of the read replicas
+    strategy = round_robin        ; or least_latency, the lowest recent time per checkout
+    retry_interval = 30           ; seconds a failing replica is left out
+
+Functions:
+
+    get_config(file, string)
+    get_settings(string, dict, file)
+    get_router()
+    get_pool(string)
+    connection(bool)
+    close_pool()
+"""
+
+import atexit
+import logging
+import threading
+import time
+from configparser import ConfigParser
+from contextlib import contextmanager
+from functools import lru_cache
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+POOL_DEFAULTS = {'minconn': 1, 'maxconn': 10, 'timeout': 30.0, 'health_check_interval': 30.0}
+ROUTING_DEFAULTS = {'replicas': '', 'strategy': 'round_robin', 'retry_interval': 30.0}
+PRIMARY = 'postgresql'
+# Weight of the newest sample in a replica's latency average
+LATENCY_WEIGHT = 0.2
+
+logger = logging.getLogger(__name__)
+
+_pools = {}
+_router = None
+_pool_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_config(filename='database.ini', section='postgresql'):
+    parser = ConfigParser()
+    parser.read(filename)
+    return {k: v for k, v in parser.items(section)}
+
+
+def get_settings(section, defaults, filename='database.ini'):
+    """
+    Reads an optional tuning section of the config file, falling back to defaults.
+
+    Values are converted to the type of their default. Keys missing from defaults are kept as strings.
+
+    :param section: A string object naming the config section
+    :param defaults: A dictionary object of setting names to default values
+    :param filename: A string object naming the config file
+    :return: A dictionary object
+    """
+    parser = ConfigParser()
+    parser.read(filename)
+    settings = dict(defaults)
+    if parser.has_section(section):
+        for key, value in parser.items(section):
+            settings[key] = type(defaults[key])(value) if key in defaults else value
+    return settings
+
+
+def _pool_settings(filename='database.ini'):
+    settings = get_settings('pool', POOL_DEFAULTS, filename)
+    if settings['maxconn'] < settings['minconn']:
+        raise ValueError("pool maxconn must be greater than or equal to minconn")
+    return {key: settings[key] for key in POOL_DEFAULTS}
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """A psycopg2 connection that remembers which named statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class ConnectionLost(psycopg2.OperationalError):
+    """Raised when the server drops a connection while it is checked out of the pool."""
+
+
+class _IdlePool(pg_pool.ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool that keeps every connection returned to it open for reuse, up to maxconn.
+
+    psycopg2 closes a returned connection once minconn are idle, so concurrent sessions would keep
+    opening new backends and lose the statements prepared on them.
+    """
+
+    def _putconn(self, conn, key=None, close=False):
+        if self.closed:
+            raise pg_pool.PoolError("connection pool is closed")
+        if key is None:
+            key = self._rused.get(id(conn))
+            if key is None:
+                raise pg_pool.PoolError("trying to put unkeyed connection")
+        status = None if conn.closed else conn.info.transaction_status
+        if close or status in (None, psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN):
+            # Closed by the caller, or the server is gone
+            conn.close()
+        else:
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self._pool.append(conn)
+        # A connection put back after closeall() is no longer tracked
+        if not self.closed or key in self._used:
+            del self._used[key]
+            del self._rused[id(conn)]
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections with health checks.
+
+    Checking out blocks (up to `timeout` seconds) instead of failing when every connection is
+    in use, and returned connections stay open for the next checkout. Connections that have been
+    idle for longer than `health_check_interval` are pinged before being handed out, and closed or
+    unresponsive connections are replaced transparently.
+    """
+
+    def __init__(self, db_info, minconn, maxconn, timeout, health_check_interval):
+        self._pool = _IdlePool(minconn, maxconn, connection_factory=PooledConnection, **db_info)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1;')
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise pg_pool.PoolError(f"no database connection available after {self.timeout}s")
+        try:
+            # Every pooled connection may be stale, so try at most maxconn + 1 times before giving up
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                self._discard(conn)
+            raise psycopg2.OperationalError("unable to obtain a healthy database connection")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, broken=False):
+        try:
+            if broken or conn.closed:
+                self._discard(conn)
+            elif conn.status != psycopg2.extensions.STATUS_READY and not self._reset(conn):
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _reset(conn):
+        try:
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        try:
+            self._pool.putconn(conn, close=True)
+        except pg_pool.PoolError:
+            pass
+
+    def closeall(self):
+        self._pool.closeall()
+        self._last_used.clear()
+
+
+class Router:
+    """
+    Picks the server a read-only connection is taken from: a read replica chosen round-robin or
+    by lowest recent latency, falling back to the primary when every replica is unavailable.
+    A replica that fails to hand out a connection is skipped for retry_interval seconds.
+    """
+
+    def __init__(self, replicas, strategy, retry_interval):
+        if strategy not in ('round_robin', 'least_latency'):
+            raise ValueError("routing strategy must be round_robin or least_latency")
+        self.replicas = list(replicas)
+        self.strategy = strategy
+        self.retry_interval = retry_interval
+        self.latency = dict.fromkeys(self.replicas, 0.0)
+        self._down_until = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def candidates(self):
+        """
+        :return: A list of config section names to try in order, ending with the primary
+        """
+        now = time.monotonic()
+        with self._lock:
+            up = [r for r in self.replicas if self._down_until.get(r, 0.0) <= now]
+            if self.strategy == 'least_latency':
+                up.sort(key=self.latency.get)
+            elif up:
+                start = self._next % len(up)
+                up = up[start:] + up[:start]
+                self._next += 1
+        return up + [PRIMARY]
+
+    def record(self, section, seconds):
+        # Exponentially weighted, so the ranking follows a replica that slows down or recovers
+        if section in self.latency:
+            with self._lock:
+                self.latency[section] += LATENCY_WEIGHT * (seconds - self.latency[section])
+
+    def failed(self, section):
+        with self._lock:
+            self._down_until[section] = time.monotonic() + self.retry_interval
+
+
+def get_router():
+    """
+    Returns the process-wide read router, created from the [routing] section of the config file on first use.
+
+    :return: A Router object
+    """
+    global _router
+    if _router is None:
+        with _pool_lock:
+            if _router is None:
+                settings = get_settings('routing', ROUTING_DEFAULTS)
+                replicas = [r.strip() for r in settings['replicas'].split(',') if r.strip()]
+                _router = Router(replicas, settings['strategy'], settings['retry_interval'])
+    return _router
+
+
+def get_pool(section=PRIMARY):
+    """
+    Returns the process-wide connection pool of a server, creating it on first use.
+
+    :param section: A string object naming the config section of the server, the primary by default
+    :return: A ConnectionPool object
+    """
+    conn_pool = _pools.get(section)
+    if conn_pool is None:
+        with _pool_lock:
+            conn_pool = _pools.get(section)
+            if conn_pool is None:
+                conn_pool = _pools[section] = ConnectionPool(get_config(section=section), **_pool_settings())
+    return conn_pool
+
+
+def _checkout(read_only):
+    if not read_only:
+        return PRIMARY, get_pool().getconn()
+    router = get_router()
+    for section in router.candidates():
+        if section == PRIMARY:
+            return section, get_pool().getconn()
+        try:
+            return section, get_pool(section).getconn()
+        except (psycopg2.OperationalError, pg_pool.PoolError):
+            logger.warning("read replica %s unavailable, skipping it for %.0fs", section, router.retry_interval)
+            router.failed(section)
+
+
+@contextmanager
+def connection(read_only=False):
+    """
+    Checks a connection out of the pool for the duration of a with-block.
+
+    The transaction is committed when the block exits normally and rolled back otherwise.
+    A connection that was lost while in use is discarded rather than returned to the pool,
+    and ConnectionLost is raised so the caller can safely retry on a fresh connection.
+
+    :param read_only: A boolean object; True takes the connection from a read replica when any is configured
+    :return: A PooledConnection object
+    """
+    section, conn = _checkout(read_only)
+    conn_pool = get_pool(section)
+    start = time.monotonic()
+    try:
+        yield conn
+        conn.commit()
+        get_router().record(section, time.monotonic() - start)
+    except Exception as e:
+        if conn.closed:
+            if section != PRIMARY:
+                get_router().failed(section)
+            raise ConnectionLost(str(e)) from e
+        ConnectionPool._reset(conn)
+        raise
+    finally:
+        conn_pool.putconn(conn, broken=bool(conn.closed))
+
+
+def close_pool():
+    """
+    Closes every pooled connection. The next call to get_pool() opens a new pool for that server.
+
+    :return: void
+    """
+    with _pool_lock:
+        for conn_pool in _pools.values():
+            conn_pool.closeall()
+        _pools.clear()
+
+
+atexit.register(close_pool)
@@ -0,0 +1,419 @@
+"""
+Search engine shared by the web front-end and the HTTP API
+
+Each search path of the front-end has a builder here that validates and normalizes the user's input
+into a Search: the named statement in queries.STATEMENTS, its parameters in $1..$n order, and the
+helper.transform processing option. Builders return None while a required field is still empty and
+raise InvalidSearch with a message meant for the user when the input cannot be searched. Running a
+Search is up to the caller: count(), page(), fetch() and records() run it synchronously through the pooled,
+cached query_db(), or for lenders through the in-memory index of lending.py; records() caches only the
+records it collects, not their rows. api.py runs the same statements on an asyncpg pool.
+
+Functions:
+
+    projects(string, string, string, list, list, list)
+    project_details(string, string, string, string)
+    nearby(string, float, list, list, list)
+    in_box(float, float, float, float, list, list, list)
+    developers(tuple, list, int, string)
+    architects(list, int, string)
+    engineers(list, int, string)
+    contractors(float, int, string)
+    lenders(float, float, float, int, string)
+    team(list, list, int, string)
+    paged(Search)
+    mapped(Search)
+    regions()
+    facets(Search)
+    count(Search)
+    page(Search, int, int)
+    fetch(Search)
+    records(Search, int, int)
+    top(Search, int)
+    clusters(Search, int)
+    build_team(dictionary, int)
+"""
+
+import logging
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cache
+import geocode
+import limits
+import metrics
+import refdata
+import results
+from queries import STATEMENTS, family, fetch_db, query_db
+
+Search = namedtuple('Search', ['name', 'params', 'cat'])
+# One role of a team search: its best members, how many companies it found, how long it took, and the
+# message to show instead when it was refused or failed
+TeamRole = namedtuple('TeamRole', ['role', 'members', 'found', 'seconds', 'error'])
+# A team search: (role, record) pairs ranked across roles, the TeamRole of each role, and the wall time
+Team = namedtuple('Team', ['ranked', 'roles', 'seconds'])
+
+METERS_PER_MILE = 1609.344
+METERS_PER_DEGREE = 111320.0
+MAX_MILES = 100
+# Results maps group the properties found into about this many grid cells across
+CLUSTER_CELLS = 40
+TEAM_ROLES = ('Developer', 'Architect', 'Engineer', 'Contractor', 'Lender')
+# Members of each role a team search lists
+TEAM_SIZE = 5
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidSearch(ValueError):
+    """Raised when a search cannot run as entered; the message is meant for the user."""
+
+
+def _query(name, params, cached=True):
+    # Lender matches come from memory, every other search from the database
+    if family(name) == 'lenders':
+        # Imported on first use, as it brings in numpy and pandas (see warmup.py)
+        import lending
+        return lending.query(name, params)
+    return query_db(name, params) if cached else fetch_db(name, params)
+
+
+def _zipcode(zipcode):
+    zipcode = str(zipcode).strip()
+    if len(zipcode) != 5 or not zipcode.isdigit():
+        raise InvalidSearch("zipcode must be 5 numeric digits.")
+    return int(zipcode)
+
+
+def _name_pattern(name):
+    # An empty name matches every company
+    return f"%{name.strip().lower() if name and name.strip() else '_'}%"
+
+
+def _filters(property_types, property_classes, statuses):
+    ref = refdata.get() if None in (property_types, property_classes, statuses) else None
+    return (tuple(ref.property_types if property_types is None else property_types),
+            tuple(ref.property_classes if property_classes is None else property_classes),
+            tuple(ref.statuses if statuses is None else statuses))
+
+
+def projects(state, city, zipcode='', property_types=None, property_classes=None, statuses=None):
+    """
+    :param state: A string object, the two letter state code (required)
+    :param city: A string object (required)
+    :param zipcode: A string object; when set, only properties in that ZIP code are listed
+    :param property_types: A list of the property types to include, every known type if None
+    :param property_classes: A list of the property classes to include, every known class if None
+    :param statuses: A list of the project statuses to include, every known status if None
+    :return: A Search object, or None while a required field is empty
+    """
+    if not (state and city):
+        return None
+    params = (state, city.strip().lower()) + _filters(property_types, property_classes, statuses)
+    if zipcode:
+        return Search('projects_zip', params + (_zipcode(zipcode),), 'p')
+    return Search('projects', params, 'p')
+
+
+def nearby(center, miles, property_types=None, property_classes=None, statuses=None):
+    """
+    :param center: A string object ('latitude, longitude', a ZIP code, or a street address followed by its ZIP
+                   code) or a (latitude, longitude) pair (required)
+    :param miles: A number, the search radius in miles
+    :param property_types: A list of the property types to include, every known type if None
+    :param property_classes: A list of the property classes to include, every known class if None
+    :param statuses: A list of the project statuses to include, every known status if None
+    :return: A Search object listing properties by distance, or None while the center is empty
+    """
+    if not center:
+        return None
+    if not 0 < miles <= MAX_MILES:
+        raise InvalidSearch(f"distance must be between 0 and {MAX_MILES} miles.")
+    location = geocode.locate(center) if isinstance(center, str) else tuple(center)
+    if location is None:
+        raise InvalidSearch("Location not found. Enter 'latitude, longitude', a ZIP code, "
+                            "or a street address followed by its ZIP code.")
+    params = (float(location[0]), float(location[1]), miles * METERS_PER_MILE)
+    return Search('projects_near', params + _filters(property_types, property_classes, statuses), 'p')
+
+
+def in_box(south, west, north, east, property_types=None, property_classes=None, statuses=None):
+    """
+    :param south: A number, the latitude of the southern edge of the map viewport
+    :param west: A number, the longitude of the western edge
+    :param north: A number, the latitude of the northern edge
+    :param east: A number, the longitude of the eastern edge
+    :param property_types: A list of the property types to include, every known type if None
+    :param property_classes: A list of the property classes to include, every known class if None
+    :param statuses: A list of the project statuses to include, every known status if None
+    :return: A Search object
+    """
+    if not (-90 <= south < north <= 90 and -180 <= west < east <= 180):
+        raise InvalidSearch("The map viewport must have its southern edge below the northern one "
+                            "and its western edge left of the eastern one.")
+    params = (float(south), float(west), float(north), float(east))
+    return Search('projects_in_box', params + _filters(property_types, property_classes, statuses), 'p')
+
+
+def project_details(street_address, city, state, zipcode):
+    """
+    :param street_address: A string object, the street number followed by the street name
+    :param city: A string object
+    :param state: A string object, the two letter state code
+    :param zipcode: A string object
+    :return: A Search object, or None while a field is empty
+    """
+    if not (street_address and city and state and zipcode):
+        return None
+    parts = street_address.strip().split(" ", 1)
+    if len(parts) < 2 or not parts[0].isdigit():
+        raise InvalidSearch("Invalid street address format. Street number must be numeric.")
+    st_num, st_name = parts
+    st_name = ' '.join(st_name.strip().split())
+    st_name = re.sub(r'[^\w\s]', '', st_name).lower()
+    return Search('project_details', (int(st_num), f'%{st_name}%', city.strip().lower(), state, _zipcode(zipcode)),
+                  'pd')
+
+
+def developers(regions, property_types=(), num_of_projects=0, name=''):
+    """
+    :param regions: A list of the regional focuses to include; pass regions() when none is selected
+    :param property_types: A list of property types, any of which the developer must specialize in (any if empty)
+    :param num_of_projects: An integer object, the minimum number of projects in the database
+    :param name: A string object, part of the developer's name
+    :return: A Search object
+    """
+    params = (tuple(regions), _name_pattern(name), num_of_projects)
+    if property_types:
+        return Search('developers_by_type', params + (tuple(property_types),), 'd')
+    return Search('developers', params, 'd')
+
+
+def architects(property_types=(), num_of_projects=0, name=''):
+    """
+    :param property_types: A list of property types, any of which the architect must specialize in (any if empty)
+    :param num_of_projects: An integer object, the minimum number of projects in the database
+    :param name: A string object, part of the architect's name
+    :return: A Search object
+    """
+    params = (_name_pattern(name), num_of_projects)
+    if property_types:
+        return Search('architects_by_type', params + (tuple(property_types),), 'a')
+    return Search('architects', params, 'a')
+
+
+def engineers(property_types=(), num_of_projects=0, name=''):
+    """
+    :param property_types: A list of property types, any of which the engineer must have worked on (any if empty)
+    :param num_of_projects: An integer object, the minimum number of projects in the database
+    :param name: A string object, part of the engineering company's name
+    :return: A Search object
+    """
+    params = (_name_pattern(name), num_of_projects)
+    if property_types:
+        return Search('engineers_by_type', params + (tuple(property_types),), 'e')
+    return Search('engineers', params, 'e')
+
+
+def contractors(space=0.0, num_of_projects=0, name=''):
+    """
+    :param space: A number, the minimum space completed over the previous 5 years in millions of square feet
+    :param num_of_projects: An integer object, the minimum number of projects in the database
+    :param name: A string object, part of the contractor's name
+    :return: A Search object
+    """
+    return Search('contractors', (space, _name_pattern(name), num_of_projects), 'c')
+
+
+def lenders(loan_amt=0.0, loan_rate=0.0, loan_ltc=0.0, num_of_projects=0, name=''):
+    """
+    :param loan_amt: A number, the loan size in $mm, 0 for any
+    :param loan_rate: A number, the rate in %, 0 for any
+    :param loan_ltc: A number, the loan to cost ratio in %, 0 for any
+    :param num_of_projects: An integer object, the minimum number of projects in the database
+    :param name: A string object, part of the lender's name
+    :return: A Search object listing the matching lenders by closeness of fit (see lending.py)
+    """
+    return Search('lenders', (loan_amt, loan_rate, loan_ltc, _name_pattern(name), num_of_projects), 'l')
+
+
+def team(property_types=(), region=(), num_of_projects=0, name=''):
+    """
+    One search per role of a project team, sharing the filters each role's search has.
+
+    :param property_types: A list of property types, any of which developers and designers must have worked on
+    :param region: A list of the regional focuses developers may have (any if empty)
+    :param num_of_projects: An integer object, the minimum number of projects in the database
+    :param name: A string object, part of the company's name
+    :return: A dictionary object mapping each of TEAM_ROLES to a Search object
+    """
+    return dict(zip(TEAM_ROLES, (developers(region or regions(), property_types, num_of_projects, name),
+                                 architects(property_types, num_of_projects, name),
+                                 engineers(property_types, num_of_projects, name),
+                                 contractors(0.0, num_of_projects, name),
+                                 lenders(0.0, 0.0, 0.0, num_of_projects, name))))
+
+
+def paged(search):
+    """
+    :param search: A Search object
+    :return: A boolean object, True if the search has _count and _page statements
+    """
+    return f'{search.name}_page' in STATEMENTS
+
+
+def mapped(search):
+    """
+    :param search: A Search object
+    :return: A boolean object, True if the search has a _clusters statement for drawing its results on a map
+    """
+    return f'{search.name}_clusters' in STATEMENTS
+
+
+def regions():
+    """
+    :return: A tuple of every regional focus developers have, for developer searches without a region
+    """
+    return tuple(refdata.get().regions)
+
+
+def facets(search):
+    """
+    Counts the buildings in the city or ZIP code of a Projects search per property type, property class and
+    status, from the project_facets rollup. They come with the search's total (see count()), so after a page
+    has been shown they are read from the result cache.
+
+    :param search: A Search object returned by projects()
+    :return: A dictionary object mapping 'type', 'class' and 'status' to dictionaries of value -> buildings
+    """
+    counts = {'type': {}, 'class': {}, 'status': {}}
+    found = _query(f'{search.name}_summary', search.params)
+    for facet, value, buildings in zip(found['facet'], found['value'], found['buildings']):
+        if facet in counts:
+            counts[facet][value] = int(buildings)
+    return counts
+
+
+def count(search):
+    """
+    :param search: A Search object with paged statements
+    :return: An integer object, the number of properties or companies found
+    """
+    if f'{search.name}_summary' in STATEMENTS:
+        # The total of a Projects search is fetched with the building counts facets() reads
+        found = _query(f'{search.name}_summary', search.params)
+        return int(found['buildings'][found['facet'] == 'total'].iloc[0])
+    return int(_query(f'{search.name}_count', search.params)['total'][0])
+
+
+def page(search, number, size):
+    """
+    :param search: A Search object with paged statements
+    :param number: An integer object, the page to fetch, starting at 1
+    :param size: An integer object, the number of properties or companies per page
+    :return: A pandas DataFrame object holding every row of the entries on that page
+    """
+    return _query(f'{search.name}_page', search.params + (size, (number - 1) * size))
+
+
+def fetch(search):
+    """
+    :param search: A Search object
+    :return: A pandas DataFrame object holding every row found
+    """
+    return _query(search.name, search.params)
+
+
+def records(search, number=None, size=None):
+    """
+    Collected results, cached in place of the rows they are collected from, so a page seen before is
+    neither queried nor collected again.
+
+    :param search: A Search object
+    :param number: An integer object, the page to collect, starting at 1, or None for every result
+    :param size: An integer object, the number of properties or companies per page
+    :return: A list of records (see results.py), shared with other sessions and not to be modified
+    """
+    if number is None:
+        return _records(search, search.name, search.params)
+    return _records(search, f'{search.name}_page', search.params + (size, (number - 1) * size))
+
+
+def top(search, size):
+    """
+    :param search: A Search object with a _top statement (see queries.RANKED)
+    :param size: An integer object, the number of companies to collect
+    :return: A list of records of the companies with the most projects, most first, shared with other sessions
+             and not to be modified
+    """
+    return _records(search, f'{search.name}_top', search.params + (size,))
+
+
+def _records(search, name, params):
+    def load():
+        # Only the records are cached; the rows are not kept once collected
+        metrics.add('cache_misses', 1)
+        data = _query(name, params, cached=False)
+        metrics.add('rows', len(data))
+        start = time.perf_counter()
+        collected = results.collect(data, search.cat) if not data.empty else []
+        metrics.add('transform', time.perf_counter() - start)
+        return collected
+
+    collected, outcome = cache.get_cache().load(('records', name, params), load, family(name), STATEMENTS[name].tables)
+    if outcome != 'miss':
+        metrics.add('cache_hits', 1)
+    return collected
+
+
+def clusters(search, cells=CLUSTER_CELLS):
+    """
+    Groups the properties found into a grid on the server, so the map gets at most about cells x cells points.
+
+    :param search: A Search object with a _clusters statement
+    :param cells: An integer object, the number of grid cells across the searched area
+    :return: A pandas DataFrame object with latitude, longitude, buildings (the number of properties in the cell)
+             and size (a radius in meters for drawing the cell, proportional to the square root of buildings)
+    """
+    if search.name == 'projects_near':
+        extent = 2 * search.params[2] / METERS_PER_DEGREE
+    else:
+        south, west, north, east = search.params[:4]
+        extent = max(north - south, east - west)
+    cell = max(extent / cells, 1e-6)
+    found = query_db(f'{search.name}_clusters', search.params + (cell,))
+    # The cached result is shared, so the size column goes on a copy
+    return found.assign(size=cell * METERS_PER_DEGREE / 2 * (found['buildings'] / found['buildings'].max()) ** 0.5)
+
+
+def _team_role(role, search, size):
+    # Each role runs in its own thread, under its own trace, so the performance panel times it like a single search
+    with metrics.search(family(search.name), search.params) as trace:
+        try:
+            members, found, error = top(search, size), count(search), None
+        except limits.SearchTooBroad as e:
+            members, found, error = [], 0, str(e)
+        except Exception:
+            # One failing role leaves the others listed
+            logger.exception("team search for %ss failed", role)
+            members, found, error = [], 0, "an error occured"
+    return TeamRole(role, members, found, trace['total'], error)
+
+
+def build_team(searches, size=TEAM_SIZE):
+    """
+    Runs the searches of every role at once on a thread pool, so a team takes as long as its slowest role.
+
+    :param searches: A dictionary object mapping roles to Search objects, as returned by team()
+    :param size: An integer object, the number of members listed per role, those with the most projects
+    :return: A Team object; ranked lists every member by number of projects, most first
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(searches), thread_name_prefix='team') as pool:
+        roles = list(pool.map(lambda item: _team_role(*item, size), searches.items()))
+    order = list(searches)
+    ranked = sorted(((r.role, member) for r in roles for member in r.members),
+                    key=lambda pair: (-pair[1].num_projects, order.index(pair[0]), pair[1].name))
+    return Team(ranked, {r.role: r for r in roles}, time.perf_counter() - start)
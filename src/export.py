@@ -0,0 +1,134 @@
+"""
+Bulk export of every row a search finds, as CSV or Parquet
+
+Exports never build a DataFrame. CSV is written by the server itself through COPY ... TO STDOUT,
+and Parquet is written batch by batch from a named (server-side) cursor, so memory stays bounded by
+one batch however many rows the search finds. Parquet needs the optional pyarrow package; without it
+only CSV is offered. Rows come in the search's display order. An export runs under the statement
+timeout and circuit breaker of limits.py, as the 'export' family. The app writes an export to a
+temporary file and then hands the whole file to the browser, so it refuses exports larger than
+max_mb. The batch size and the limit can be set in an optional [export] section of database.ini:
+
+    [export]
+    batch_size = 10000            ; rows fetched from the server cursor at a time
+    max_mb = 100                  ; largest export the app offers for download
+
+Functions:
+
+    formats()
+    max_bytes()
+    write(Search, string, file)
+"""
+
+import importlib.util
+import uuid
+
+import psycopg2
+import psycopg2.extensions
+
+import db
+import limits
+from queries import STATEMENTS, family, typed_sql
+
+# pyarrow is imported by the first Parquet export rather than with this module
+pa = pq = None
+
+EXPORT_DEFAULTS = {'batch_size': 10000, 'max_mb': 100}
+# Format name -> (file extension, MIME type)
+FORMATS = {'CSV': ('csv', 'text/csv'), 'Parquet': ('parquet', 'application/vnd.apache.parquet')}
+
+# Parquet wants floats rather than Decimal objects for numeric columns
+DEC2FLOAT = psycopg2.extensions.new_type(psycopg2.extensions.DECIMAL.values, 'DEC2FLOAT',
+                                         lambda value, cur: float(value) if value is not None else None)
+
+
+def formats():
+    """
+    :return: A list of the format names available in this environment
+    """
+    return [name for name in FORMATS if name != 'Parquet' or importlib.util.find_spec('pyarrow') is not None]
+
+
+def max_bytes():
+    """
+    :return: An integer object, the size in bytes of the largest export the app offers for download
+    """
+    return db.get_settings('export', EXPORT_DEFAULTS)['max_mb'] * 2 ** 20
+
+
+def _query(cur, search):
+    statement = STATEMENTS[search.name]
+    values = {f'p{n}': list(p) if isinstance(p, tuple) else p for n, p in enumerate(search.params, start=1)}
+    sql = cur.mogrify(typed_sql(search.name, pyformat=True), values).decode()
+    if statement.key:
+        sql = f"SELECT * FROM ({sql}) results ORDER BY {statement.order}, {statement.key}"
+    return sql
+
+
+def _arrow_type(type_code):
+    # Column types from cursor.description OIDs; anything not listed is exported as text
+    if type_code in (20, 21, 23):
+        return pa.int64()
+    if type_code in (700, 701, 1700):
+        return pa.float64()
+    if type_code == 16:
+        return pa.bool_()
+    if type_code == 1082:
+        return pa.date32()
+    if type_code in (1114, 1184):
+        return pa.timestamp('us')
+    if type_code in (1009, 1015):
+        return pa.list_(pa.string())
+    return pa.string()
+
+
+def _write_parquet(conn, search, file, batch_size):
+    global pa, pq
+    if pa is None:
+        import pyarrow
+        import pyarrow.parquet
+        pa, pq = pyarrow, pyarrow.parquet
+    # A named cursor keeps the result on the server and hands it over one batch at a time
+    with conn.cursor(name=f'export_{uuid.uuid4().hex}') as cur:
+        psycopg2.extensions.register_type(DEC2FLOAT, cur)
+        cur.itersize = batch_size
+        cur.execute(_query(cur, search))
+        rows = cur.fetchmany(batch_size)
+        schema = pa.schema([(column.name, _arrow_type(column.type_code)) for column in cur.description])
+        text = [i for i, field in enumerate(schema) if field.type == pa.string()]
+        with pq.ParquetWriter(file, schema) as writer:
+            while rows:
+                columns = [list(column) for column in zip(*rows)]
+                for i in text:
+                    columns[i] = [None if v is None else str(v) for v in columns[i]]
+                writer.write_table(pa.table(columns, schema=schema))
+                rows = cur.fetchmany(batch_size)
+
+
+def write(search, fmt, file):
+    """
+    Writes every row a search finds to a file.
+
+    :param search: An engine.Search object
+    :param fmt: A string object, one of formats()
+    :param file: A binary file object open for writing
+    :return: void
+    """
+    if fmt not in formats():
+        raise ValueError(f"unsupported export format {fmt}")
+    batch_size = db.get_settings('export', EXPORT_DEFAULTS)['batch_size']
+    # Refused while the search itself is, and timed (and refused after timing out) as an export
+    limits.check(family(search.name), search.params)
+    limits.check('export', (search.name, search.params))
+    try:
+        with db.connection(read_only=True) as conn:
+            limits.apply(conn, 'export')
+            if fmt == 'CSV':
+                with conn.cursor() as cur:
+                    # The server formats the CSV and psycopg2 copies it to the file as it arrives
+                    cur.copy_expert(f"COPY ({_query(cur, search)}) TO STDOUT WITH (FORMAT csv, HEADER)", file)
+            else:
+                _write_parquet(conn, search, file, batch_size)
+    except psycopg2.extensions.QueryCanceledError as e:
+        limits.record_timeout('export', (search.name, search.params))
+        raise limits.SearchTooBroad() from e
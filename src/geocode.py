@@ -0,0 +1,142 @@
+"""
+Offline geocoding of building addresses, for searches by distance and map viewport
+
+Coordinates are never looked up while a user waits. Geocoded addresses are imported into
+geocode_cache from a CSV file (street_num, street_name, zip, latitude, longitude and an optional
+source column), e.g. the output of a batch geocoder, and ZIP code centroids into zip_centroids from
+the Census Bureau's ZCTA gazetteer file. locate_buildings() then copies coordinates onto Buildings,
+using the ZIP code centroid for addresses that have not been geocoded, so every building with a
+known ZIP code can be found on the map, if only approximately.
+
+Usage (from src/, against the database in database.ini):
+
+    python geocode.py --zips 2020_Gaz_zcta_national.txt --addresses geocoded.csv
+
+Functions:
+
+    import_zip_centroids(string)
+    import_geocodes(string, string)
+    locate_buildings()
+    locate(string)
+"""
+
+import argparse
+import csv
+import re
+
+from psycopg2.extras import execute_values
+
+import db
+import watermarks
+from queries import query_db
+
+LAT_LON = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+# The street is what comes before the first comma; a city and state after it are left out of the match
+ADDRESS = re.compile(r'^\s*(?:(\d+)\s+([^,]*?)(?:\s*,.*?)?[\s,]+)?(\d{5})\s*$')
+
+
+def _upsert(sql, rows):
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, sql, rows, page_size=1000)
+    return len(rows)
+
+
+def import_zip_centroids(path):
+    """
+    Loads ZIP code centroids, replacing those already loaded.
+
+    :param path: A string object, the path of a Census ZCTA gazetteer file (tab separated, GEOID/INTPTLAT/INTPTLONG)
+    :return: An integer object, the number of ZIP codes loaded
+    """
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f, delimiter='\t')
+        # The last header of the gazetteer files carries trailing whitespace
+        reader.fieldnames = [name.strip() for name in reader.fieldnames]
+        rows = [(int(row['GEOID']), float(row['INTPTLAT']), float(row['INTPTLONG'])) for row in reader]
+    return _upsert("""INSERT INTO zip_centroids (zip, latitude, longitude) VALUES %s
+                      ON CONFLICT (zip) DO UPDATE SET latitude = EXCLUDED.latitude,
+                      longitude = EXCLUDED.longitude""", rows)
+
+
+def import_geocodes(path, source='import'):
+    """
+    Loads geocoded addresses, replacing those already loaded.
+
+    :param path: A string object, the path of a CSV file with street_num, street_name, zip, latitude and
+                 longitude columns
+    :param source: A string object recorded for rows without a source column
+    :return: An integer object, the number of addresses loaded
+    """
+    with open(path, newline='') as f:
+        rows = [(int(row['street_num']), row['street_name'].strip(), int(row['zip']), float(row['latitude']),
+                 float(row['longitude']), row.get('source') or source) for row in csv.DictReader(f)]
+    return _upsert("""INSERT INTO geocode_cache (street_num, street_name, zip, latitude, longitude, source)
+                      VALUES %s
+                      ON CONFLICT (street_num, street_name, zip) DO UPDATE SET latitude = EXCLUDED.latitude,
+                      longitude = EXCLUDED.longitude, source = EXCLUDED.source, geocoded_at = now()""", rows)
+
+
+def locate_buildings():
+    """
+    Copies coordinates onto buildings from geocode_cache, falling back to the ZIP code centroid for
+    buildings that are still not located. Only rows whose coordinates change are updated.
+
+    :return: A (geocoded, approximated) pair of integer objects counting the buildings updated
+    """
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""UPDATE Buildings B SET latitude = G.latitude, longitude = G.longitude
+                           FROM geocode_cache G
+                           WHERE G.street_num = B.street_num AND G.street_name = B.street_name AND G.zip = B.zip
+                           AND (B.latitude, B.longitude) IS DISTINCT FROM (G.latitude, G.longitude);""")
+            geocoded = cur.rowcount
+            cur.execute("""UPDATE Buildings B SET latitude = Z.latitude, longitude = Z.longitude
+                           FROM zip_centroids Z
+                           WHERE B.zip = Z.zip AND (B.latitude IS NULL OR B.longitude IS NULL);""")
+            approximated = cur.rowcount
+            if geocoded or approximated:
+                watermarks.bump(cur, ['Buildings'])
+            return geocoded, approximated
+
+
+def locate(text):
+    """
+    :param text: A string object, 'latitude, longitude', a ZIP code, or a street address followed by its ZIP code,
+                 optionally with the city and state between them ('350 Fifth Avenue, New York, NY 10118')
+    :return: A (latitude, longitude) pair of float objects, or None when the location is unknown
+    """
+    match = LAT_LON.match(text)
+    if match:
+        latitude, longitude = float(match.group(1)), float(match.group(2))
+        if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            return latitude, longitude
+        return None
+    match = ADDRESS.match(text)
+    if not match:
+        return None
+    street_num, street_name, zipcode = match.groups()
+    if street_num:
+        street_name = re.sub(r'[^\w\s]', '', ' '.join(street_name.split())).lower()
+        found = query_db('address_location', (int(street_num), f'%{street_name}%', int(zipcode)))
+    else:
+        found = query_db('address_location', (None, None, int(zipcode)))
+    if found.empty:
+        return None
+    return float(found['latitude'][0]), float(found['longitude'][0])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import geocoded addresses and locate buildings.')
+    parser.add_argument('--zips', help='Census ZCTA gazetteer file of ZIP code centroids')
+    parser.add_argument('--addresses', help='CSV file of geocoded addresses')
+    parser.add_argument('--source', default='import', help='source recorded for the geocoded addresses')
+    args = parser.parse_args()
+
+    if args.zips:
+        print(f"zip centroids    {import_zip_centroids(args.zips):>12,}")
+    if args.addresses:
+        print(f"addresses        {import_geocodes(args.addresses, args.source):>12,}")
+    geocoded, approximated = locate_buildings()
+    print(f"geocoded         {geocoded:>12,}")
+    print(f"approximated     {approximated:>12,}")
@@ -0,0 +1,179 @@
+"""
+Incremental loads of changed records, instead of reloading the database wholesale
+
+Each batch is a CSV file with a header row naming the columns it carries, for one table of the ER
+schema. It is copied (COPY) into a temporary staging table of the batch's columns, then merged
+on the table's primary key: rows whose columns differ are updated, identical rows are left alone
+and new rows are inserted. A batch may carry only some columns of existing rows, while new rows
+need every column their table requires. Link tables (every column in the key) only gain rows.
+All batches of a load run in one transaction, in foreign key order, together with a bump of the
+change watermark of every table that actually changed, so the app processes drop
+only the cached results read from those tables (see watermarks.py). The materialized views whose
+source tables changed are refreshed afterwards (see stats.py), and new buildings are located on the map.
+
+Usage (from src/, against the database in database.ini), e.g. with a directory of Buildings.csv,
+Companies.csv, Projects.csv, Awards.csv, ... files:
+
+    python ingest.py changes/
+
+Functions:
+
+    stage(cursor, string, file)
+    merge(cursor, string, list)
+    ingest(list, bool)
+"""
+
+import argparse
+import csv
+import os
+import time
+
+from psycopg2 import sql
+
+import db
+import geocode
+import stats
+import watermarks
+
+# Primary key of every table, in an order that loads referenced rows before the rows referencing them
+KEYS = {
+    'Buildings': ('building_id',),
+    'Property_types': ('name',),
+    'Companies': ('fed_id',),
+    'Developers': ('fed_id',),
+    'Designers': ('fed_id',),
+    'Contractors': ('fed_id',),
+    'Lenders': ('fed_id',),
+    'Used_as': ('b_id', 'type_name'),
+    'Specializes_in': ('fed_id', 'type_name'),
+    'Owned_by': ('b_id', 'fed_id'),
+    'Mortgage': ('b_id', 'mortgage_id'),
+    'Designed_by': ('b_id', 'fed_id'),
+    'Built_by': ('b_id', 'fed_id'),
+    'Financed_by': ('b_id', 'fed_id'),
+    'Projects': ('b_id', 'designer_id', 'lender_id', 'contractor_id', 'developer_id'),
+    'Awards': ('name', 'organization'),
+    'Recieved_award': ('b_id', 'designer_id', 'lender_id', 'contractor_id', 'developer_id', 'award_name',
+                       'award_org', 'award_year'),
+}
+
+
+def _staging(table):
+    return sql.Identifier(f'stage_{table.lower()}')
+
+
+def stage(cur, table, file):
+    """
+    Copies a CSV batch into a temporary staging table with the target table's types for the batch's columns.
+
+    Only the batch's columns are staged, without the target table's constraints, so a batch that updates
+    some columns of existing rows loads; the merge into the target table enforces its constraints.
+
+    :param cur: A psycopg2 cursor object
+    :param table: A string object, a key of KEYS
+    :param file: A text file object positioned at the CSV header row
+    :return: A list of the column names the batch carries
+    """
+    columns = next(csv.reader([file.readline()]))
+    staging = _staging(table)
+    names = sql.SQL(', ').join(map(sql.Identifier, columns))
+    cur.execute(sql.SQL("CREATE TEMP TABLE {} AS SELECT {} FROM {} WITH NO DATA;").format(
+        staging, names, sql.Identifier(table.lower())))
+    cur.copy_expert(sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(staging, names).as_string(cur), file)
+    return columns
+
+
+def merge(cur, table, columns):
+    """
+    Upserts the staged rows of a table into it.
+
+    :param cur: A psycopg2 cursor object
+    :param table: A string object, a key of KEYS
+    :param columns: A list of the staged column names, including the whole primary key
+    :return: An integer object, the number of rows inserted or updated
+    """
+    key = KEYS[table]
+    missing = set(key) - set(columns)
+    if missing:
+        raise ValueError(f"{table} batch lacks key column(s) {', '.join(sorted(missing))}")
+    values = [c for c in columns if c not in key]
+    target = sql.Identifier(table.lower())
+    # DISTINCT ON keeps one row per key, as a row cannot be updated twice in one statement
+    staged = sql.SQL("(SELECT DISTINCT ON ({key}) {names} FROM {staging}) S").format(
+        key=sql.SQL(', ').join(map(sql.Identifier, key)), names=sql.SQL(', ').join(map(sql.Identifier, columns)),
+        staging=_staging(table))
+    matches = sql.SQL(' AND ').join(sql.SQL("T.{column} = S.{column}").format(column=sql.Identifier(c)) for c in key)
+    count = 0
+    if values:
+        # Existing rows are updated apart from the inserts, so a batch of some columns of them loads
+        current, incoming = (sql.SQL(', ').join(sql.SQL(side + '.{}').format(sql.Identifier(c)) for c in values)
+                             for side in ('T', 'S'))
+        cur.execute(sql.SQL("""UPDATE {table} T SET ({values}) = ROW({incoming}) FROM {staged}
+                               WHERE {matches} AND ({current}) IS DISTINCT FROM ({incoming});""").format(
+            table=target, values=sql.SQL(', ').join(map(sql.Identifier, values)), incoming=incoming, staged=staged,
+            matches=matches, current=current))
+        count = cur.rowcount
+    # New rows must carry every column their table requires
+    cur.execute(sql.SQL("""INSERT INTO {table} ({columns})
+                           SELECT {names} FROM {staged}
+                           WHERE NOT EXISTS (SELECT 1 FROM {table} T WHERE {matches})
+                           ON CONFLICT ({key}) DO NOTHING;""").format(
+        table=target, columns=sql.SQL(', ').join(map(sql.Identifier, columns)),
+        names=sql.SQL(', ').join(sql.SQL('S.{}').format(sql.Identifier(c)) for c in columns),
+        staged=staged, matches=matches, key=sql.SQL(', ').join(map(sql.Identifier, key))))
+    return count + cur.rowcount
+
+
+def ingest(batches, locate=True):
+    """
+    Loads CSV batches in one transaction and records which tables changed.
+
+    :param batches: A list of (table, path) pairs; table is a key of KEYS, path a CSV file with a header row
+    :param locate: A boolean object; False skips locating new buildings (e.g. where earthdistance is unavailable)
+    :return: A dictionary object mapping table names to rows inserted or updated
+    """
+    unknown = [table for table, _ in batches if table not in KEYS]
+    if unknown:
+        raise ValueError(f"unknown table(s) {', '.join(unknown)}")
+    order = list(KEYS)
+    counts = {}
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            for table, path in sorted(batches, key=lambda batch: order.index(batch[0])):
+                with open(path, newline='') as f:
+                    columns = stage(cur, table, f)
+                counts[table] = counts.get(table, 0) + merge(cur, table, columns)
+                cur.execute(sql.SQL("DROP TABLE {};").format(_staging(table)))
+            changed = [table for table, count in counts.items() if count]
+            if 'Buildings' in changed:
+                # Rows loaded with explicit ids leave the sequence behind
+                cur.execute("SELECT setval('buildings_building_id_seq', GREATEST(MAX(building_id), 1)) FROM Buildings;")
+            watermarks.bump(cur, changed)
+    if changed:
+        # ANALYZE runs in an ordinary transaction of its own, after the load is committed
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                for table in changed:
+                    cur.execute(sql.SQL("ANALYZE {};").format(sql.Identifier(table.lower())))
+    stale = [view for view, sources in stats.VIEWS.items() if sources & {table.lower() for table in changed}]
+    if stale:
+        stats.refresh(views=stale)
+    if locate and 'Buildings' in changed:
+        geocode.locate_buildings()
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Upsert changed records from CSV files named after their tables.')
+    parser.add_argument('directory', help='directory of <Table>.csv files, e.g. Buildings.csv')
+    parser.add_argument('--no-locate', action='store_true', help='do not locate new buildings on the map')
+    args = parser.parse_args()
+
+    tables = {table.lower(): table for table in KEYS}
+    found = [(tables[os.path.splitext(filename)[0].lower()], os.path.join(args.directory, filename))
+             for filename in sorted(os.listdir(args.directory))
+             if filename.lower().endswith('.csv') and os.path.splitext(filename)[0].lower() in tables]
+    start = time.perf_counter()
+    for table, count in ingest(found, not args.no_locate).items():
+        print(f"{table:16} {count:>12,}")
+    print(f"loaded in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,144 @@
+"""
+Lender matching from an in-memory index of every lender's terms
+
+The Lenders search asks for a loan amount, a rate and a loan-to-cost ratio, each of which may be
+left at 0 to match any lender. A lender matches when the amount lies within its loan size range,
+the rate within its rate range and the LTC at or below its maximum; a lender missing one of those
+terms only matches searches that leave that criterion open. Matches are ranked by closeness, how
+far the request sits from the middle of each of the lender's ranges (see the lenders statement in
+queries.py, which answers the same search in SQL for the API and exports).
+
+The terms are held in numpy arrays, with the lenders ordered by their minimum loan size so an
+amount narrows the candidates with one binary search before the remaining criteria are checked as
+vectorized masks. The index is built from the lender_terms statement and kept in the result cache
+under the same tables, so it is rebuilt after its data changes like any cached search.
+
+Functions:
+
+    get_index()
+    query(string, tuple)
+"""
+
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+import cache
+import metrics
+from queries import STATEMENTS, fetch_db
+
+# Columns of the lenders statement, in its order
+COLUMNS = ['fed_id', 'name', 'email', 'phone_number', 'num_employees', 'revenue', 'min_loan', 'max_loan',
+           'min_rate', 'max_rate', 'max_ltc', 'num_proj', 'closeness']
+TERMS = ('min_loan', 'max_loan', 'min_rate', 'max_rate', 'max_ltc')
+
+
+def _fit(value, low, high):
+    # 0 with the value in the middle of [low, high], 1 at either end; a range of one value fits exactly
+    half = (high - low) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(half > 0, np.abs(value - (low + high) / 2) / half, 0.0)
+
+
+def _like(pattern):
+    # SQL LIKE, as the lenders statement matches LOWER(name) against it
+    return re.compile(''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern), re.S)
+
+
+class LenderIndex:
+    """Lender terms as float arrays (NaN where missing), ordered by minimum loan size."""
+
+    def __init__(self, terms):
+        """
+        :param terms: A pandas DataFrame object, the result of the lender_terms statement
+        """
+        rows = terms.astype({term: 'float64' for term in TERMS}).sort_values(['min_loan', 'fed_id'])
+        rows = rows.reset_index(drop=True)
+        self.terms = {term: rows[term].to_numpy(copy=True) for term in TERMS}
+        self.names = rows['name'].str.lower().to_numpy()
+        # Each lender's place in fed_id order, which breaks ties in closeness as in the lenders statement
+        self.fed_rank = np.argsort(np.argsort(rows['fed_id'].to_numpy().astype(str), kind='stable'))
+        self.num_proj = rows['num_proj'].to_numpy()
+        # The lenders statement's output, with missing terms shown as -1
+        self.output = rows.fillna({term: -1.0 for term in TERMS})
+
+    @property
+    def nbytes(self):
+        # What the result cache counts against its budget
+        arrays = list(self.terms.values()) + [self.names, self.fed_rank, self.num_proj]
+        return int(self.output.memory_usage(index=True, deep=True).sum() + sum(a.nbytes for a in arrays))
+
+    def match(self, amount=0.0, rate=0.0, ltc=0.0, name='%_%', num_of_projects=0):
+        """
+        :param amount: A number, the loan size in $mm, 0 for any
+        :param rate: A number, the rate in %, 0 for any
+        :param ltc: A number, the loan to cost ratio in %, 0 for any
+        :param name: A string object, a LIKE pattern the lower-cased lender name must match
+        :param num_of_projects: An integer object, the minimum number of projects in the database
+        :return: A (positions, closeness) pair of numpy arrays, the matching rows of self.output best first
+        """
+        t = self.terms
+        # Lenders whose minimum loan size is at most the amount form a prefix of the index
+        end = np.searchsorted(t['min_loan'], amount, side='right') if amount else len(self.output)
+        found = np.arange(end)
+        mask = self.num_proj[found] >= num_of_projects
+        if amount:
+            mask &= t['max_loan'][found] >= amount
+        if rate:
+            mask &= (t['min_rate'][found] <= rate) & (t['max_rate'][found] >= rate)
+        if ltc:
+            mask &= t['max_ltc'][found] >= ltc
+        found = found[mask]
+        if name != '%_%':
+            like = _like(name)
+            found = found[np.fromiter((like.fullmatch(n) is not None for n in self.names[found]), bool, len(found))]
+
+        closeness = np.zeros(len(found))
+        if amount:
+            closeness += _fit(amount, t['min_loan'][found], t['max_loan'][found])
+        if rate:
+            closeness += _fit(rate, t['min_rate'][found], t['max_rate'][found])
+        if ltc:
+            closeness += _fit(ltc, 0.0, t['max_ltc'][found])
+        closeness /= max(bool(amount) + bool(rate) + bool(ltc), 1)
+        order = np.lexsort((self.fed_rank[found], closeness))
+        return found[order], closeness[order]
+
+
+def get_index():
+    """
+    :return: A LenderIndex object of every lender, shared with other sessions and not to be modified
+    """
+    index, _ = cache.get_cache().load(('lender_index',), lambda: LenderIndex(fetch_db('lender_terms')),
+                                      'lender_terms', STATEMENTS['lender_terms'].tables)
+    return index
+
+
+def query(name, params):
+    """
+    Answers the lenders statement or its _page, _count or _top variant from the index, in the shape fetch_db would.
+
+    :param name: A string object, 'lenders', 'lenders_page', 'lenders_count' or 'lenders_top'
+    :param params: A tuple of parameter values in $1..$n order
+    :return: A pandas DataFrame object
+    """
+    index = get_index()
+    start = time.perf_counter()
+    positions, closeness = index.match(*params[:5])
+    if name == 'lenders_count':
+        found = pd.DataFrame({'total': [len(positions)]})
+    else:
+        if name == 'lenders_page':
+            limit, offset = params[5:]
+            positions, closeness = positions[offset:offset + limit], closeness[offset:offset + limit]
+        elif name == 'lenders_top':
+            # Most projects first, then in fed_id order, as in the lenders_top statement
+            order = np.lexsort((index.fed_rank[positions], -index.num_proj[positions]))[:params[5]]
+            positions, closeness = positions[order], closeness[order]
+        found = index.output.iloc[positions].assign(closeness=closeness).reset_index(drop=True)[COLUMNS]
+    # Matching stands in for the database phase
+    metrics.add('db', time.perf_counter() - start)
+    metrics.add('rows', len(found))
+    return found
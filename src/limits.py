@@ -0,0 +1,115 @@
+"""
+Statement timeouts per search family, and a circuit breaker for searches that keep timing out
+
+Every search statement runs under a statement_timeout chosen by its family, so one runaway query
+cannot hold a backend for long. A search that times out is refused for breaker_cooldown seconds
+instead of being run again, with a message asking the user to narrow it, and a family whose
+searches time out breaker_failures times within breaker_window seconds is refused as a whole for
+breaker_cooldown seconds, leaving the database to the other searches. Exports run under the
+'export' family's limits, after their search's family is checked. The limits are set in an
+optional [timeouts] section of database.ini:
+
+    [timeouts]
+    default = 30                  ; seconds a search statement may run, 0 disables the limit
+    engineers = 10                ; per-family override, <family> = seconds
+    export = 300                  ; seconds an export of every result may run
+    breaker_failures = 3
+    breaker_window = 60
+    breaker_cooldown = 30
+
+Functions:
+
+    timeout(string)
+    apply(connection, string)
+    check(string, tuple)
+    record_timeout(string, tuple)
+"""
+
+import threading
+import time
+from collections import deque
+
+import db
+
+TIMEOUT_DEFAULTS = {'default': 30.0, 'export': 300.0,
+                    'breaker_failures': 3, 'breaker_window': 60.0, 'breaker_cooldown': 30.0}
+TOO_BROAD = "This search is too broad to finish in time. Add filters or a name and try again."
+
+_settings = None
+_refused = {}
+_timeouts = {}
+_open_until = {}
+_lock = threading.Lock()
+
+
+class SearchTooBroad(Exception):
+    """Raised when a search timed out or its family's circuit is open; the message is meant for the user."""
+
+    def __init__(self, message=TOO_BROAD):
+        super().__init__(message)
+
+
+def _get_settings():
+    global _settings
+    if _settings is None:
+        _settings = db.get_settings('timeouts', TIMEOUT_DEFAULTS)
+    return _settings
+
+
+def timeout(family):
+    """
+    :param family: A string object naming a query family, e.g. 'engineers'
+    :return: A float object, the seconds a statement of that family may run, 0 for no limit
+    """
+    settings = _get_settings()
+    return float(settings.get(family, settings['default']))
+
+
+def apply(conn, family):
+    """
+    Sets the family's statement_timeout for the rest of the connection's current transaction.
+
+    :param conn: A psycopg2 connection object
+    :param family: A string object naming a query family
+    :return: void
+    """
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL statement_timeout = %s;", (int(timeout(family) * 1000),))
+
+
+def check(family, params):
+    """
+    Refuses a search that recently timed out, or any search of a family whose circuit is open.
+
+    :param family: A string object naming a query family
+    :param params: A tuple of the search's parameter values
+    :return: void
+    """
+    now = time.monotonic()
+    with _lock:
+        if _open_until.get(family, 0.0) > now or _refused.get((family, params), 0.0) > now:
+            raise SearchTooBroad()
+
+
+def record_timeout(family, params):
+    """
+    Records a timed out search, opening its family's circuit once too many have timed out.
+
+    :param family: A string object naming a query family
+    :param params: A tuple of the search's parameter values
+    :return: void
+    """
+    settings = _get_settings()
+    now = time.monotonic()
+    with _lock:
+        _refused[(family, params)] = now + settings['breaker_cooldown']
+        # Forget refusals that have run out, so the map stays as small as the set of recent offenders
+        for key in [key for key, until in _refused.items() if until <= now]:
+            del _refused[key]
+        recent = _timeouts.setdefault(family, deque())
+        recent.append(now)
+        while recent and recent[0] < now - settings['breaker_window']:
+            recent.popleft()
+        if len(recent) >= settings['breaker_failures']:
+            _open_until[family] = now + settings['breaker_cooldown']
+            recent.clear()
@@ -0,0 +1,178 @@
+"""
+Latency and row-count instrumentation for searches
+
+A search is traced from the moment its statement is chosen until its page has been rendered:
+
+    with metrics.search('projects', params):
+        ...  # query_db() and helper.transform() add their timings to the current trace
+
+Each finished trace records the query family, a hash of the parameters, time spent in the database
+(execute), fetching rows into a DataFrame, transforming and rendering, the row count and whether the
+result came from the cache. Traces are kept in a bounded in-memory window, summarized per family as
+p50/p95/p99, and can be exported in the Prometheus text format or as JSON lines. An optional
+[metrics] section of database.ini writes them to disk as they are recorded:
+
+    [metrics]
+    window = 10000                ; traces kept in memory
+    jsonl_file = searches.jsonl   ; append every trace as one JSON line
+    prometheus_file = searches.prom
+    prometheus_interval = 15      ; seconds between rewrites of prometheus_file
+
+Functions:
+
+    search(string, tuple)
+    add(string, float)
+    summary()
+    to_prometheus()
+    to_jsonl()
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import db
+
+METRICS_DEFAULTS = {'window': 10000, 'jsonl_file': '', 'prometheus_file': '', 'prometheus_interval': 15.0}
+PHASES = ('total', 'db', 'fetch', 'transform', 'render')
+QUANTILES = (0.5, 0.95, 0.99)
+
+_local = threading.local()
+_lock = threading.Lock()
+_traces = None
+_settings = None
+_last_prometheus_write = 0.0
+
+
+def _window():
+    global _traces, _settings
+    if _traces is None:
+        with _lock:
+            if _traces is None:
+                _settings = db.get_settings('metrics', METRICS_DEFAULTS)
+                _traces = deque(maxlen=_settings['window'])
+    return _traces
+
+
+@contextmanager
+def search(family, params=()):
+    """
+    Traces one search. Nested calls join the outer trace.
+
+    :param family: A string object naming the search, e.g. 'projects'
+    :param params: A tuple of the search parameters, only a hash of which is kept
+    :return: A dictionary object, the trace being filled in
+    """
+    if getattr(_local, 'trace', None) is not None:
+        yield _local.trace
+        return
+    trace = {'family': family, 'params_hash': hashlib.sha1(repr(params).encode()).hexdigest()[:12],
+             'timestamp': time.time(), 'db': 0.0, 'fetch': 0.0, 'transform': 0.0, 'render': 0.0,
+             'rows': 0, 'cache_hits': 0, 'cache_misses': 0}
+    _local.trace = trace
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        _local.trace = None
+        trace['total'] = time.perf_counter() - start
+        _record(trace)
+
+
+def add(field, value):
+    """
+    Adds to a field of the current thread's trace; a no-op outside of search().
+
+    :param field: A string object, one of db, fetch, transform, render, rows, cache_hits or cache_misses
+    :param value: A number to add
+    :return: void
+    """
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace[field] += value
+
+
+def _record(trace):
+    global _last_prometheus_write
+    traces = _window()
+    with _lock:
+        traces.append(trace)
+    if _settings['jsonl_file']:
+        with _lock, open(_settings['jsonl_file'], 'a') as f:
+            f.write(json.dumps(trace) + '\n')
+    if _settings['prometheus_file'] and time.time() - _last_prometheus_write >= _settings['prometheus_interval']:
+        _last_prometheus_write = time.time()
+        text = to_prometheus()
+        # Write then rename, so a scraper never reads a half-written file
+        with open(_settings['prometheus_file'] + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(_settings['prometheus_file'] + '.tmp', _settings['prometheus_file'])
+
+
+def _quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def summary():
+    """
+    Summarizes the traces in the window per family.
+
+    :return: A dictionary object mapping family to count, rows, cache hits/misses and per-phase
+             {'sum', 0.5, 0.95, 0.99} latencies in seconds
+    """
+    with _lock:
+        traces = list(_window())
+    families = {}
+    for trace in traces:
+        families.setdefault(trace['family'], []).append(trace)
+    out = {}
+    for family, group in sorted(families.items()):
+        out[family] = {'count': len(group), 'rows': sum(t['rows'] for t in group),
+                       'cache_hits': sum(t['cache_hits'] for t in group),
+                       'cache_misses': sum(t['cache_misses'] for t in group)}
+        for phase in PHASES:
+            ordered = sorted(t[phase] for t in group)
+            out[family][phase] = {'sum': sum(ordered), **{q: _quantile(ordered, q) for q in QUANTILES}}
+    return out
+
+
+def to_prometheus():
+    """
+    Exports the per-family summary in the Prometheus text exposition format. Values cover the
+    traces currently in the window, so they are all exposed as gauges.
+
+    :return: A string object
+    """
+    stats = summary()
+    lines = ['# HELP realestate_search_seconds Search latency quantiles by phase over the recent window.',
+             '# TYPE realestate_search_seconds gauge']
+    for family, s in stats.items():
+        for phase in PHASES:
+            for q in QUANTILES:
+                lines.append(f'realestate_search_seconds{{family="{family}",phase="{phase}",quantile="{q}"}} '
+                             f'{s[phase][q]:.6f}')
+    lines += ['# HELP realestate_search_window_searches Searches in the recent window.',
+              '# TYPE realestate_search_window_searches gauge']
+    lines += [f'realestate_search_window_searches{{family="{family}"}} {s["count"]}' for family, s in stats.items()]
+    lines += ['# HELP realestate_search_window_rows Rows returned by the database in the recent window.',
+              '# TYPE realestate_search_window_rows gauge']
+    lines += [f'realestate_search_window_rows{{family="{family}"}} {s["rows"]}' for family, s in stats.items()]
+    lines += ['# HELP realestate_search_window_cache_lookups Result cache lookups by outcome in the recent window.',
+              '# TYPE realestate_search_window_cache_lookups gauge']
+    for family, s in stats.items():
+        lines.append(f'realestate_search_window_cache_lookups{{family="{family}",result="hit"}} {s["cache_hits"]}')
+        lines.append(f'realestate_search_window_cache_lookups{{family="{family}",result="miss"}} {s["cache_misses"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def to_jsonl():
+    """
+    :return: A string object, every trace in the window as one JSON object per line
+    """
+    with _lock:
+        traces = list(_window())
+    return ''.join(json.dumps(trace) + '\n' for trace in traces)
@@ -0,0 +1,172 @@
+"""
+Versioned schema migrations and an index-usage check for the search statements
+
+Migrations are the numbered .sql files in src/migrations (e.g. 0001_search_indexes.sql). Each one
+runs in its own transaction and is recorded in the schema_migrations table, so running this module
+again only applies the files added since.
+
+Usage:
+
+    python migrate.py            apply pending migrations
+    python migrate.py --check    EXPLAIN every search and report full scans of the hot tables
+
+Functions:
+
+    available()
+    applied(connection)
+    migrate()
+    check_indexes(bool)
+"""
+
+import argparse
+import os
+import re
+import sys
+
+import psycopg2
+
+import db
+import queries
+from constants import PROPERTY_TYPES, PROPERTY_CLASSES, STATUSES, REGIONS
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Arbitrary but realistic parameters; a plan's shape, not its rows, is what the check looks at
+SAMPLE_PARAMS = {
+    'projects': ('NY', 'new york', tuple(PROPERTY_TYPES), tuple(PROPERTY_CLASSES), tuple(STATUSES)),
+    'projects_zip': ('NY', 'new york', tuple(PROPERTY_TYPES), tuple(PROPERTY_CLASSES), tuple(STATUSES), 10001),
+    'project_facets': ('NY', 'new york', 0),
+    'projects_near': (40.7484, -73.9857, 8046.72, tuple(PROPERTY_TYPES), tuple(PROPERTY_CLASSES), tuple(STATUSES)),
+    'projects_in_box': (40.70, -74.02, 40.80, -73.93, tuple(PROPERTY_TYPES), tuple(PROPERTY_CLASSES), tuple(STATUSES)),
+    'project_details': (350, '%fifth avenue%', 'new york', 'NY', 10118),
+    'developers': (tuple(REGIONS), '%realty%', 0),
+    'developers_by_type': (tuple(REGIONS), '%realty%', 0, ('Office',)),
+    'architects': ('%design%', 0),
+    'architects_by_type': ('%design%', 0, ('Office',)),
+    'engineers': ('%engineering%', 0),
+    'engineers_by_type': ('%engineering%', 0, ('Office',)),
+    'contractors': (0, '%construction%', 0),
+    'lenders': (50, 5.0, 60.0, '%capital%', 0),
+}
+
+# Tables the searches filter on; a full scan of these means an index is missing or unusable
+HOT_TABLES = {'buildings', 'companies'}
+
+
+def available():
+    """
+    :return: A list of (version, name, path) tuples for every migration file, in version order
+    """
+    found = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r'^(\d+)_(\w+)\.sql$', filename)
+        if match:
+            found.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return sorted(found)
+
+
+def applied(conn):
+    """
+    :param conn: A psycopg2 connection object
+    :return: A set object of the versions already applied
+    """
+    with conn.cursor() as cur:
+        cur.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                         version integer primary key,
+                         name varchar(64) not null,
+                         applied_at timestamp not null default now()
+                       );""")
+        cur.execute("SELECT version FROM schema_migrations;")
+        return {row[0] for row in cur.fetchall()}
+
+
+def migrate():
+    """
+    Applies every pending migration in version order.
+
+    :return: A list of the (version, name) pairs applied
+    """
+    done = []
+    with db.connection() as conn:
+        # Serialize concurrent deploys for the whole run, across the per-migration transactions
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(hashtext('schema_migrations'));")
+        try:
+            current = applied(conn)
+            conn.commit()
+            for version, name, path in available():
+                if version in current:
+                    continue
+                with open(path) as f:
+                    script = f.read()
+                with conn.cursor() as cur:
+                    cur.execute(script)
+                    cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);", (version, name))
+                conn.commit()
+                done.append((version, name))
+        finally:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(hashtext('schema_migrations'));")
+    return done
+
+
+def _scans(plan, found):
+    relation = plan.get('Relation Name')
+    if relation:
+        # Without an index condition an index scan visits the whole table just like a sequential scan
+        full = plan['Node Type'] == 'Seq Scan' or ('Index Name' in plan and 'Index Cond' not in plan)
+        found.append((relation.lower(), plan.get('Index Name'), full))
+    elif 'Index Name' in plan:
+        # Bitmap index scans name the index but leave the table to their parent Bitmap Heap Scan
+        found.append((None, plan['Index Name'], False))
+    for child in plan.get('Plans', []):
+        _scans(child, found)
+    return found
+
+
+def check_indexes(forbid_seqscan=True):
+    """
+    EXPLAINs every search statement and reports the indexes used and the tables read in full.
+
+    A table counts as read in full when it is scanned sequentially or through an index without an
+    index condition. With forbid_seqscan the planner is told to avoid sequential scans wherever it
+    can, so a remaining full scan shows that no index can serve the predicate, even on a small
+    development database.
+
+    :param forbid_seqscan: A boolean object; when True runs the check with enable_seqscan off
+    :return: A dictionary object mapping statement names to {'indexes': set, 'full_scans': set}
+    """
+    report = {}
+    # A fresh session, so no cached generic plan from the pool hides the effect of enable_seqscan
+    conn = psycopg2.connect(connection_factory=db.PooledConnection, **db.get_config())
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SET enable_seqscan = {'off' if forbid_seqscan else 'on'};")
+        for name, params in SAMPLE_PARAMS.items():
+            scans = _scans(queries.explain(conn, name, params), [])
+            report[name] = {'indexes': {index for _, index, _ in scans if index},
+                            'full_scans': {relation for relation, _, full in scans if full}}
+        conn.rollback()
+    finally:
+        conn.close()
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply schema migrations or check index usage.')
+    parser.add_argument('--check', action='store_true', help='EXPLAIN the searches instead of migrating')
+    args = parser.parse_args()
+
+    if not args.check:
+        for version, name in migrate():
+            print(f"applied {version:04d}_{name}")
+        sys.exit(0)
+
+    failed = False
+    for name, result in check_indexes().items():
+        unindexed = result['full_scans'] & HOT_TABLES
+        failed = failed or bool(unindexed)
+        print(f"{'FAIL' if unindexed else 'ok  '} {name}: indexes {sorted(result['indexes']) or '-'}"
+              f"{f', full scans of {sorted(unindexed)}' if unindexed else ''}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,26 @@
+-- Indexes for the predicates every search filters on.
+--
+-- Company and street name searches match LOWER(col) LIKE '%...%', which no B-tree can serve, so
+-- they get trigram GIN indexes. City lookups always come with a state (and sometimes a ZIP).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS companies_lower_name_trgm_idx ON Companies USING gin (LOWER(name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS buildings_lower_street_name_trgm_idx ON Buildings USING gin (LOWER(street_name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS buildings_state_lower_city_zip_idx ON Buildings (state, LOWER(city), zip);
+
+-- Foreign key columns that are not the leading column of a primary key
+CREATE INDEX IF NOT EXISTS projects_developer_id_idx ON Projects (developer_id, b_id);
+CREATE INDEX IF NOT EXISTS projects_designer_id_idx ON Projects (designer_id, b_id);
+CREATE INDEX IF NOT EXISTS projects_contractor_id_idx ON Projects (contractor_id, b_id);
+CREATE INDEX IF NOT EXISTS projects_lender_id_idx ON Projects (lender_id, b_id);
+CREATE INDEX IF NOT EXISTS used_as_type_name_idx ON Used_as (type_name, b_id);
+CREATE INDEX IF NOT EXISTS specializes_in_type_name_idx ON Specializes_in (type_name, fed_id);
+CREATE INDEX IF NOT EXISTS owned_by_fed_id_idx ON Owned_by (fed_id);
+
+ANALYZE Companies;
+ANALYZE Buildings;
+ANALYZE Projects;
+ANALYZE Used_as;
+ANALYZE Specializes_in;
+ANALYZE Owned_by;
@@ -0,0 +1,29 @@
+-- Project counts per company and role, overall (type_name '*') and per property type.
+--
+-- Every developer, designer, contractor and lender gets an overall row, with a count of 0 when it
+-- has no projects yet, so the searches can inner join the view and filter the count by index.
+-- Refresh with stats.refresh() after loading projects; the unique index allows CONCURRENTLY.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS company_project_stats AS
+WITH roles AS (
+  SELECT D.fed_id, 'developer' AS role, P.b_id
+  FROM Developers D LEFT OUTER JOIN Projects P ON P.developer_id = D.fed_id
+  UNION ALL
+  SELECT D.fed_id, 'designer' AS role, P.b_id
+  FROM Designers D LEFT OUTER JOIN Projects P ON P.designer_id = D.fed_id
+  UNION ALL
+  SELECT C.fed_id, 'contractor' AS role, P.b_id
+  FROM Contractors C LEFT OUTER JOIN Projects P ON P.contractor_id = C.fed_id
+  UNION ALL
+  SELECT L.fed_id, 'lender' AS role, P.b_id
+  FROM Lenders L LEFT OUTER JOIN Projects P ON P.lender_id = L.fed_id
+)
+SELECT R.fed_id, R.role::varchar(10) AS role,
+       (CASE WHEN GROUPING(U.type_name) = 1 THEN '*' ELSE U.type_name END)::varchar(64) AS type_name,
+       COUNT(DISTINCT R.b_id) AS num_proj
+FROM roles R LEFT OUTER JOIN Used_as U ON U.b_id = R.b_id
+GROUP BY GROUPING SETS ((R.fed_id, R.role), (R.fed_id, R.role, U.type_name))
+HAVING GROUPING(U.type_name) = 1 OR U.type_name IS NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS company_project_stats_pkey ON company_project_stats (fed_id, role, type_name);
+CREATE INDEX IF NOT EXISTS company_project_stats_num_proj_idx ON company_project_stats (role, type_name, num_proj);
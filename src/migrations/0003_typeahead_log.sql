@@ -0,0 +1,75 @@
+-- Change log of company names and street names for the in-process typeahead indexes.
+--
+-- Statement-level triggers append one row per name added ('I') or removed ('D'), reading the
+-- transition tables, so a bulk COPY costs one INSERT ... SELECT rather than a trigger call per row.
+-- Updates only log the names that actually changed. Every app process polls the log past the
+-- last id it applied (typeahead.py) and prunes entries older than a day.
+
+CREATE TABLE IF NOT EXISTS typeahead_log (
+  id bigserial primary key,
+  kind char(1) not null,
+  name varchar(64) not null,
+  op char(1) not null,
+  logged_at timestamptz not null default now(),
+  CONSTRAINT typeahead_kind_constraint CHECK (kind in ('c', 's')),
+  CONSTRAINT typeahead_op_constraint CHECK (op in ('I', 'D'))
+);
+
+CREATE INDEX IF NOT EXISTS typeahead_log_logged_at ON typeahead_log (logged_at);
+
+CREATE OR REPLACE FUNCTION log_company_names() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO typeahead_log (kind, name, op) SELECT 'c', N.name, 'I' FROM new_rows N;
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO typeahead_log (kind, name, op) SELECT 'c', O.name, 'D' FROM old_rows O;
+  ELSE
+    INSERT INTO typeahead_log (kind, name, op)
+    SELECT 'c', O.name, 'D' FROM old_rows O
+    WHERE NOT EXISTS (SELECT 1 FROM new_rows N WHERE N.fed_id = O.fed_id AND N.name = O.name)
+    UNION ALL
+    SELECT 'c', N.name, 'I' FROM new_rows N
+    WHERE NOT EXISTS (SELECT 1 FROM old_rows O WHERE O.fed_id = N.fed_id AND O.name = N.name);
+  END IF;
+  RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION log_street_names() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO typeahead_log (kind, name, op) SELECT 's', N.street_name, 'I' FROM new_rows N;
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO typeahead_log (kind, name, op) SELECT 's', O.street_name, 'D' FROM old_rows O;
+  ELSE
+    INSERT INTO typeahead_log (kind, name, op)
+    SELECT 's', O.street_name, 'D' FROM old_rows O
+    WHERE NOT EXISTS (SELECT 1 FROM new_rows N
+                      WHERE N.building_id = O.building_id AND N.street_name = O.street_name)
+    UNION ALL
+    SELECT 's', N.street_name, 'I' FROM new_rows N
+    WHERE NOT EXISTS (SELECT 1 FROM old_rows O
+                      WHERE O.building_id = N.building_id AND O.street_name = N.street_name);
+  END IF;
+  RETURN NULL;
+END $$;
+
+-- Transition tables allow a single event per trigger, hence three triggers per table
+DROP TRIGGER IF EXISTS companies_typeahead_insert ON Companies;
+DROP TRIGGER IF EXISTS companies_typeahead_update ON Companies;
+DROP TRIGGER IF EXISTS companies_typeahead_delete ON Companies;
+CREATE TRIGGER companies_typeahead_insert AFTER INSERT ON Companies
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_company_names();
+CREATE TRIGGER companies_typeahead_update AFTER UPDATE ON Companies
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_company_names();
+CREATE TRIGGER companies_typeahead_delete AFTER DELETE ON Companies
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION log_company_names();
+
+DROP TRIGGER IF EXISTS buildings_typeahead_insert ON Buildings;
+DROP TRIGGER IF EXISTS buildings_typeahead_update ON Buildings;
+DROP TRIGGER IF EXISTS buildings_typeahead_delete ON Buildings;
+CREATE TRIGGER buildings_typeahead_insert AFTER INSERT ON Buildings
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_street_names();
+CREATE TRIGGER buildings_typeahead_update AFTER UPDATE ON Buildings
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION log_street_names();
+CREATE TRIGGER buildings_typeahead_delete AFTER DELETE ON Buildings
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION log_street_names();
@@ -0,0 +1,36 @@
+-- Building coordinates for the radius and map viewport searches.
+--
+-- Radius searches use earthdistance over cube: earth_box(ll_to_earth(lat, lon), meters) is served
+-- by a GiST index on ll_to_earth(latitude, longitude), then earth_distance trims the box to a
+-- circle. Viewport searches use a GiST index on point(longitude, latitude).
+--
+-- Coordinates are filled in offline by geocode.py, from geocode_cache (geocoded addresses, keyed
+-- like Buildings' unique address) or, failing that, from the ZIP code centroids in zip_centroids.
+
+CREATE EXTENSION IF NOT EXISTS cube;
+CREATE EXTENSION IF NOT EXISTS earthdistance;
+
+ALTER TABLE Buildings ADD COLUMN IF NOT EXISTS latitude double precision;
+ALTER TABLE Buildings ADD COLUMN IF NOT EXISTS longitude double precision;
+
+CREATE INDEX IF NOT EXISTS buildings_earth ON Buildings USING gist (ll_to_earth(latitude, longitude))
+  WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
+CREATE INDEX IF NOT EXISTS buildings_point ON Buildings USING gist (point(longitude, latitude))
+  WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS geocode_cache (
+  street_num integer not null,
+  street_name varchar(64) not null,
+  zip integer not null,
+  latitude double precision not null,
+  longitude double precision not null,
+  source varchar(32),
+  geocoded_at timestamp not null default now(),
+  PRIMARY KEY (street_num, street_name, zip)
+);
+
+CREATE TABLE IF NOT EXISTS zip_centroids (
+  zip integer primary key,
+  latitude double precision not null,
+  longitude double precision not null
+);
@@ -0,0 +1,11 @@
+-- Per-table change counter, bumped in the same transaction as every incremental load (ingest.py),
+-- geocoding pass (geocode.py) and company_project_stats refresh (stats.py).
+--
+-- Every app process polls it (watermarks.py) and drops only the cached results read from the
+-- tables whose version moved, instead of clearing the whole cache after a load.
+
+CREATE TABLE IF NOT EXISTS change_watermarks (
+  table_name varchar(64) primary key,
+  version bigint not null,
+  changed_at timestamptz not null default now()
+);
@@ -0,0 +1,27 @@
+-- Buildings per property type, property class and status in every city (zip 0) and ZIP code, for
+-- the counts shown next to the Projects search filters.
+--
+-- Only buildings with a property type and a property class are counted, as the Projects search
+-- only lists those. A mixed-use building counts once under each of its types. Refresh with
+-- stats.refresh() after loading buildings; the unique index allows CONCURRENTLY and serves the lookups.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS project_facets AS
+WITH listed AS (
+  SELECT B.building_id, B.state, LOWER(B.city) AS city, B.zip, B.property_class, B.status
+  FROM Buildings B
+  WHERE B.property_class IS NOT NULL AND EXISTS (SELECT 1 FROM Used_as U WHERE U.b_id = B.building_id)
+),
+facets AS (
+  SELECT L.state, L.city, L.zip, 'type' AS facet, U.type_name AS value, L.building_id
+  FROM listed L INNER JOIN Used_as U ON U.b_id = L.building_id
+  UNION ALL
+  SELECT state, city, zip, 'class', property_class, building_id FROM listed
+  UNION ALL
+  SELECT state, city, zip, 'status', status, building_id FROM listed
+)
+SELECT state, city::varchar(32) AS city, (CASE WHEN GROUPING(zip) = 1 THEN 0 ELSE zip END) AS zip,
+       facet::varchar(6) AS facet, value::varchar(64) AS value, COUNT(DISTINCT building_id) AS buildings
+FROM facets
+GROUP BY GROUPING SETS ((state, city, facet, value), (state, city, zip, facet, value));
+
+CREATE UNIQUE INDEX IF NOT EXISTS project_facets_pkey ON project_facets (state, city, zip, facet, value);
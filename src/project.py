@@ -3,418 +3,326 @@ Implementation of web front-end for database application
 
 Functions:
 
-    get_config(file, string)
-    query_db(string)
+    company_names(string)
+    facet_labels(dictionary)
+    typeahead_input(string, function)
+    search_form(string)
+    submit_button()
+    run_submitted(string, bool, function, string, function)
+    run_search(Search)
+    run_projects(Search)
+    run_team(dictionary)
+    export_results(Search)
 """
 
-import pandas as pd
-import psycopg2
 import streamlit as st
-from configparser import ConfigParser
-import re
+import contextlib
+import tempfile
+import time
+import engine
 import helper
+import limits
+import metrics
+import refdata
+import stats
+import typeahead
+import warmup
+import watermarks
+from queries import family
 from constants import (
     OPTIONS,
-    STATES,
-    PROPERTY_TYPES,
-    PROPERTY_CLASSES,
-    STATUSES,
-    REGIONS,
-    DESIGNER_TYPES,
     SIZES,
+    PAGE_SIZES,
+    DEBOUNCE_SECONDS,
+    MAP_MODES,
 )
 
-
 '# Project Demo'
 
-
-@st.cache
-def get_config(filename='database.ini', section='postgresql'):
-    parser = ConfigParser()
-    parser.read(filename)
-    return {k: v for k, v in parser.items(section)}
-
-
-@st.cache
-def query_db(sql: str):
-    # print(f'Running query_db(): {sql}')
-
-    db_info = get_config()
-
-    # Connect to an existing database
-    conn = psycopg2.connect(**db_info)
-
-    # Open a cursor to perform database operations
-    cur = conn.cursor()
-
-    # Execute a command: this creates a new table
-    cur.execute(sql)
-
-    # Obtain data
-    data = cur.fetchall()
-
-    column_names = [desc[0] for desc in cur.description]
-
-    # Make the changes to the database persistent
-    conn.commit()
-
-    # Close communication with the database
-    cur.close()
-    conn.close()
-
-    df = pd.DataFrame(data=data, columns=column_names)
-
-    return df
-
+stats.start_schedule()
+refdata.start_schedule()
+typeahead.start()
+watermarks.start()
+warmup.start()
+ref = refdata.get()
+
+
+def company_names(text):
+    return typeahead.suggest('company', text)
+
+
+def facet_labels(counts: dict):
+    # Each option followed by the number of buildings it has in the area of the Projects search shown
+    if not counts:
+        return str
+    return lambda value: f"{value} ({counts.get(value, 0):,})"
+
+
+def typeahead_input(label: str, suggest):
+    # Drawn above its search form rather than in it, so suggestions appear as soon as the text is entered,
+    # before the search is submitted
+    text = st.text_input(label)
+    suggestions = suggest(text) if text else []
+    if suggestions and text.strip().lower() not in [s.lower() for s in suggestions]:
+        text = st.selectbox('Did you mean:', [text] + suggestions, key=f'typeahead-{label}')
+    return text
+
+
+def search_form(key: str):
+    return contextlib.nullcontext() if live else st.form(key)
+
+
+def submit_button():
+    return live or st.form_submit_button('Search')
+
+
+def run_submitted(key: str, submitted: bool, build, error: str, run=None):
+    # The submitted search is kept in the session, so paging and exporting rerun it without another submit
+    state_key = f'search-{key}'
+    try:
+        if submitted:
+            search = build()
+            if live and search != st.session_state.get(state_key):
+                # Debounce: a widget change during the pause makes Streamlit abandon this run at its next element
+                time.sleep(DEBOUNCE_SECONDS)
+                st.empty()
+            st.session_state[state_key] = search
+        (run or run_search)(st.session_state.get(state_key))
+    except (engine.InvalidSearch, limits.SearchTooBroad) as e:
+        st.session_state[state_key] = None
+        st.write(str(e))
+    except Exception:
+        st.write(error)
+
+
+def run_search(search: engine.Search):
+    if search is None:
+        return
+    with metrics.search(family(search.name), search.params):
+        if not engine.paged(search):
+            records = engine.records(search)
+            helper.display(records, search.cat)
+            found = bool(records)
+        else:
+            # Count every entry up front so the header stays accurate, then fetch and render only the visible page
+            total = engine.count(search)
+            found = total > 0
+            if not found:
+                st.write(f"No search results.")
+            else:
+                if engine.mapped(search):
+                    # One point per grid cell of results, however many properties were found
+                    st.map(engine.clusters(search), latitude='latitude', longitude='longitude', size='size')
+                page_size = st.selectbox('Results per page:', PAGE_SIZES)
+                pages = -(-total // page_size)
+                # The cursor is keyed on the search so it resets to the first page whenever the filters change
+                page = st.number_input(f'Page (of {pages}):', min_value=1, max_value=pages, value=1, step=1,
+                                       key=f'page-{search.name}-{search.params}-{page_size}')
+
+                helper.display(engine.records(search, page, page_size), search.cat, total)
+    if found:
+        export_results(search)
+
+
+def run_projects(search: engine.Search):
+    run_search(search)
+    try:
+        # Read from the result cache, as the page's total was fetched with them
+        counts = engine.facets(search) if search is not None else {}
+    except Exception:
+        # The counts are a guide only
+        counts = {}
+    if counts != st.session_state.get('facets-projects', {}):
+        # The filters above were drawn with the previous area's counts; draw them again with these
+        st.session_state['facets-projects'] = counts
+        st.rerun()
+
+
+def run_team(searches: dict):
+    if searches is None:
+        return
+    # The roles run concurrently, each timed under its own search family; this times the team as a whole
+    with metrics.search('team', tuple(search.params for search in searches.values())):
+        team = engine.build_team(searches)
+        helper.display_team(team)
+
+
+def export_results(search: engine.Search):
+    # The admin panel and exports are imported where they are used, keeping them out of every cold start
+    import export
+
+    with st.expander('Export all results'):
+        fmt = st.selectbox('Format:', export.formats())
+        if st.button('Prepare export'):
+            # The export is written to a temporary file, but the download button keeps the whole file in memory
+            with tempfile.TemporaryFile() as f:
+                try:
+                    export.write(search, fmt, f)
+                except limits.SearchTooBroad as e:
+                    st.write(str(e))
+                    return
+                size = f.tell()
+                if size > export.max_bytes():
+                    st.error(f"The export is {size / 2 ** 20:.0f} MB, over the {export.max_bytes() // 2 ** 20} MB "
+                             f"limit. Narrow the search to export it.")
+                    return
+                f.seek(0)
+                data = f.read()
+            extension, mime = export.FORMATS[fmt]
+            st.download_button(f'Download {fmt}', data, file_name=f'{family(search.name)}.{extension}', mime=mime)
+
+
+# The performance panel is only reachable by URL, e.g. http://localhost:8501/?admin=1
+if 'admin' in st.query_params:
+    import admin
+    admin.render_panel()
+    st.stop()
 
 '## How can we help you?'
+# Searches normally run when their form is submitted; live mode reruns them as the filters change
+live = st.sidebar.checkbox('Live search', help='Search as you change the filters instead of on submit')
 search_choice = st.selectbox('What can we help you find today?', OPTIONS)
 if search_choice:
     if search_choice == 'Select an option':
         st.write(f"Select an option to get started")
 
     if search_choice == 'Projects':
-        state = st.selectbox('State (required):', STATES)
-        city = st.text_input('City (required):')
-        zipcode = st.text_input("ZIP Code (optional):", max_chars=5)
-        property_type = st.multiselect('Property Type (any):', PROPERTY_TYPES, default=PROPERTY_TYPES)
-        property_class = st.multiselect('Property Class (any):', PROPERTY_CLASSES, default=PROPERTY_CLASSES)
-        status = st.multiselect('Status (any):', STATUSES, default=STATUSES)
-
-        type_tuple = tuple(property_type)
-        class_tuple = tuple(property_class)
-        status_tuple = tuple(status)
-
-        if len(property_type) < 2:
-            if len(property_type) < 1:
-                type_tuple = ('######', '######')
-            else:
-                type_tuple = (property_type[0], '######')
-        if len(property_class) < 2:
-            if len(property_class) < 1:
-                class_tuple = ('######', '######')
-            else:
-                class_tuple = (property_class[0], '######')
-        if len(status) < 2:
-            if len(status) < 1:
-                status_tuple = ('######', '######')
-            else:
-                status_tuple = (status[0], '######')
-
-        try:
-            if state and city:
-                city = city.strip().lower()
-                if zipcode:
-                    zipcode = zipcode.strip()
-                    if len(zipcode) < 5:
-                        raise ValueError("zipcode")
-                    zipcode = int(zipcode)
-                    sql_building = f"""SELECT DISTINCT B.*, U2.* FROM Buildings B INNER JOIN Used_as U 
-                                        ON B.building_id = U.b_id LEFT OUTER JOIN Used_as U2 
-                                        ON B.building_id = U2.b_id
-                                        WHERE B.state = '{state}' 
-                                        AND LOWER(B.city) = '{city}' AND B.zip = {zipcode}
-                                        AND U.type_name IN {type_tuple}
-                                        AND B.property_class IN {class_tuple}
-                                        AND B.status IN {status_tuple};"""
-                else:
-                    sql_building = f"""SELECT DISTINCT B.*, U2.* FROM Buildings B INNER JOIN Used_as U 
-                                        ON B.building_id = U.b_id LEFT OUTER JOIN Used_as U2
-                                        ON B.building_id = U2.b_id
-                                        WHERE B.state = '{state}' 
-                                        AND LOWER(B.city) = '{city}'
-                                        AND U.type_name IN {type_tuple}
-                                        AND B.property_class IN {class_tuple}
-                                        AND B.status IN {status_tuple};"""
-                building_info = query_db(sql_building)
-                helper.transform(building_info, 'p')
-        except (KeyError, ValueError) as e:
-            if 'zipcode' in str(e) or 'invalid literal for int() with base 10' in str(e):
-                st.write(f"zipcode must be 5 numeric digits.")
+        with search_form('projects'):
+            state = st.selectbox('State (required):', ref.states)
+            city = st.text_input('City (required):')
+            zipcode = st.text_input("ZIP Code (optional):", max_chars=5)
+            # Buildings per option in the area of the search shown below
+            facets = st.session_state.get('facets-projects', {})
+            property_type = st.multiselect('Property Type (any):', ref.property_types, default=ref.property_types,
+                                           format_func=facet_labels(facets.get('type')))
+            property_class = st.multiselect('Property Class (any):', ref.property_classes,
+                                            default=ref.property_classes,
+                                            format_func=facet_labels(facets.get('class')))
+            status = st.multiselect('Status (any):', ref.statuses, default=ref.statuses,
+                                    format_func=facet_labels(facets.get('status')))
+            submitted = submit_button()
+
+        run_submitted('projects', submitted,
+                      lambda: engine.projects(state, city, zipcode, property_type, property_class, status),
+                      f"an error occured", run_projects)
+    elif search_choice == 'Projects on a map':
+        map_mode = st.radio('Find projects:', MAP_MODES, horizontal=True)
+        with search_form('projects_map'):
+            if map_mode == 'Near a location':
+                center = st.text_input("Address and ZIP Code, ZIP Code, or 'latitude, longitude' (required):")
+                miles = st.slider('Within (miles):', min_value=1, max_value=engine.MAX_MILES, value=5)
             else:
-                st.write(f"an error occured")
+                north_col, south_col = st.columns(2)
+                north = north_col.number_input('North (latitude):', min_value=-90.0, max_value=90.0, value=40.92)
+                south = south_col.number_input('South (latitude):', min_value=-90.0, max_value=90.0, value=40.49)
+                west_col, east_col = st.columns(2)
+                west = west_col.number_input('West (longitude):', min_value=-180.0, max_value=180.0, value=-74.26)
+                east = east_col.number_input('East (longitude):', min_value=-180.0, max_value=180.0, value=-73.69)
+            property_type = st.multiselect('Property Type (any):', ref.property_types, default=ref.property_types)
+            property_class = st.multiselect('Property Class (any):', ref.property_classes,
+                                            default=ref.property_classes)
+            status = st.multiselect('Status (any):', ref.statuses, default=ref.statuses)
+            submitted = submit_button()
+
+        if map_mode == 'Near a location':
+            run_submitted('projects_near', submitted,
+                          lambda: engine.nearby(center, miles, property_type, property_class, status),
+                          f"an error occured")
+        else:
+            run_submitted('projects_in_box', submitted,
+                          lambda: engine.in_box(south, west, north, east, property_type, property_class, status),
+                          f"an error occured")
     elif search_choice == 'Project details':
-        street_address = st.text_input('Street Address (required):')
-        city = st.text_input('City (required):')
-        state = st.selectbox('State (required):', STATES)
-        zipcode = st.text_input('ZIP Code (required):', max_chars=5)
-
-        try:
-            if street_address and city and state and zipcode:
-                st_num, st_name = street_address.strip().split(" ", 1)
-                st_name = ' '.join(st_name.strip().split())
-                st_name = re.sub(r'[^\w\s]', '', st_name)
-                st_name = st_name.lower()
-                city = city.strip().lower()
-                zipcode = zipcode.strip()
-                st_num = int(st_num)
-                if len(zipcode) < 5:
-                    raise ValueError("zipcode")
-                zipcode = int(zipcode)
-                sql_building_details = f"""SELECT DISTINCT C5.name as owner, C4.name as developer, C1.name as designer,
-                                            C2.name as contractor, C3.name as lender, B.status, P.completion_date, 
-                                            COALESCE(A.award_name, 'No Awards') as a_name, 
-                                            COALESCE(A.award_org, 'No Awards') as a_org, 
-                                            COALESCE(A.award_year, 0) as a_year
-                                            FROM BUILDINGS B, PROJECTS P, COMPANIES C1, COMPANIES C2, 
-                                            COMPANIES C3, COMPANIES C4, COMPANIES C5, Owned_by O,  
-                                            (SELECT DISTINCT B2.building_id, R.award_name, R.award_org, R.award_year 
-                                            FROM BUILDINGS B2 LEFT OUTER JOIN Recieved_award R 
-                                            ON B2.building_id = R.b_id) as A
-                                            WHERE B.building_id = P.b_id AND B.building_id = O.b_id 
-                                            AND B.street_num = {st_num} AND LOWER(B.street_name) LIKE '%{st_name}%'
-                                            AND LOWER(B.city) = '{city}' AND B.state = '{state}' AND B.zip = {zipcode}
-                                            AND P.designer_id = C1.fed_id AND P.contractor_id = C2.fed_id
-                                            AND P.lender_id = C3.fed_id AND P.developer_id = C4.fed_id
-                                            AND O.fed_id = C5.fed_id AND B.building_id = A.building_id;"""
-
-                building_details = query_db(sql_building_details)
-                helper.transform(building_details, 'pd')
-        except (Exception, ValueError) as e:
-            is_other = True
-            if 'zipcode' in str(e):
-                st.write(f"zipcode must be 5 numeric digits.")
-                is_other = False
-            if 'invalid literal for int() with base 10' in str(e):
-                st.write(f"Invalid street address format. Street number must be numeric.")
-                is_other = False
-            if is_other is True:
-                st.write(f"an error occured")
+        street_address = typeahead_input('Street Address (required):', typeahead.suggest_address)
+        with search_form('project_details'):
+            city = st.text_input('City (required):')
+            state = st.selectbox('State (required):', ref.states)
+            zipcode = st.text_input('ZIP Code (required):', max_chars=5)
+            submitted = submit_button()
+
+        run_submitted('project_details', submitted,
+                      lambda: engine.project_details(street_address, city, state, zipcode), f"an error occured")
     elif search_choice == 'Lead Generation':
-        lead_options = ['Developers', 'Architects', 'Engineers', 'Contractors', 'Lenders']
+        lead_options = ['Developers', 'Architects', 'Engineers', 'Contractors', 'Lenders', 'Project team']
         lead_search_options = st.selectbox('What kind of companies are you interested in learning more about?',
                                            lead_options)
         if lead_search_options == 'Developers':
-            property_type = st.multiselect('Property Type (any):', PROPERTY_TYPES)
-            region = st.multiselect('Regional Focus (any):', REGIONS)
-            num_of_projects = st.number_input('Minimum number of projects in database:', value=0, min_value=0, step=1)
-            developer_name = st.text_input('Developer Name:')
-            type_tuple = tuple(property_type)
-            if len(property_type) == 1:
-                type_tuple = (property_type[0], property_type[0])
-            region_tuple = tuple(region)
-            if len(region_tuple) < 2:
-                if len(region_tuple) < 1:
-                    regions_sql = "SELECT DISTINCT regional_focus FROM Developers;"
-                    regions = query_db(regions_sql)['regional_focus'].tolist()
-                    region_tuple = tuple(regions)
-                else:
-                    region_tuple = (region[0], region[0])
-            if len(developer_name) == 0:
-                developer_name = '_'
-            else:
-                developer_name = developer_name.strip().lower()
-
-            try:
-                if not property_type:
-                    sql_developers = f"""SELECT DISTINCT CO.fed_id, CO.name, CO.email, CO.phone_number,  
-                                            COALESCE(CO.num_of_employees, -1) num_employees, 
-                                            COALESCE(CO.revenue_$mm, -1) as revenue, D.regional_focus, 
-                                            COALESCE(S2.type_name,'None') as type_name, 
-                                            P3.num_proj 
-                                            FROM Developers D INNER JOIN Companies CO ON D.fed_id = CO.fed_id 
-                                            LEFT OUTER JOIN Projects P ON D.fed_id = P.developer_id
-                                            LEFT OUTER JOIN Specializes_in S ON D.fed_id = S.fed_id 
-                                            LEFT OUTER JOIN Specializes_in S2 ON D.fed_id = S2.fed_id
-                                            LEFT OUTER JOIN
-                                            (SELECT D2.fed_id, COALESCE(COUNT(DISTINCT P2.b_id),0) as num_proj 
-                                            FROM Developers D2 LEFT OUTER JOIN Projects P2 
-                                            ON P2.developer_id = D2.fed_id 
-                                            GROUP BY D2.fed_id) P3 ON D.fed_id = P3.fed_id
-                                            WHERE LOWER(CO.name) LIKE '%{developer_name}%'
-                                            AND D.regional_focus IN {region_tuple} 
-                                            AND P3.num_proj >= {num_of_projects};"""
-                else:
-                    sql_developers = f"""SELECT DISTINCT CO.fed_id, CO.name, CO.email, CO.phone_number, 
-                                            COALESCE(CO.num_of_employees, -1) num_employees, 
-                                            COALESCE(CO.revenue_$mm, -1) as revenue, D.regional_focus, 
-                                            COALESCE(S2.type_name,'None') as type_name, 
-                                            P3.num_proj 
-                                            FROM Developers D INNER JOIN Companies CO ON D.fed_id = CO.fed_id 
-                                            LEFT OUTER JOIN Projects P ON D.fed_id = P.developer_id
-                                            LEFT OUTER JOIN 
-                                            (SELECT D2.fed_id, COALESCE(COUNT(DISTINCT P2.b_id),0) as num_proj 
-                                            FROM Developers D2 LEFT OUTER JOIN Projects P2 
-                                            ON P2.developer_id = D2.fed_id 
-                                            GROUP BY D2.fed_id) P3 ON D.fed_id = P3.fed_id
-                                            LEFT OUTER JOIN Specializes_in S ON D.fed_id = S.fed_id 
-                                            LEFT OUTER JOIN Specializes_in S2 ON D.fed_id = S2.fed_id
-                                            WHERE D.regional_focus IN {region_tuple} AND S.type_name IN {type_tuple} 
-                                            AND LOWER(CO.name) LIKE '%{developer_name}%' 
-                                            AND P3.num_proj >= {num_of_projects};"""
-                developers = query_db(sql_developers)
-                helper.transform(developers, 'd')
-            except Exception as e:
-                st.write(f"An error occurred.")
+            developer_name = typeahead_input('Developer Name:', company_names)
+            with search_form('developers'):
+                property_type = st.multiselect('Property Type (any):', ref.property_types)
+                region = st.multiselect('Regional Focus (any):', ref.regions)
+                num_of_projects = st.number_input('Minimum number of projects in database:', value=0, min_value=0,
+                                                  step=1)
+                submitted = submit_button()
+
+            run_submitted('developers', submitted,
+                          lambda: engine.developers(region or engine.regions(), property_type, num_of_projects,
+                                                    developer_name),
+                          f"An error occurred.")
         elif lead_search_options == 'Architects':
-            property_type = st.multiselect('Property Type Specialization (any):', PROPERTY_TYPES)
-            num_of_projects = st.number_input('Minimum number of projects in database:', value=0, min_value=0, step=1)
-            arch_name = st.text_input('Architect Name :')
-            type_tuple = tuple(property_type)
-            if len(property_type) == 1:
-                type_tuple = (property_type[0], property_type[0])
-            if len(arch_name) == 0:
-                arch_name = '_'
-            else:
-                arch_name = arch_name.strip().lower()
-
-            try:
-                if not property_type:
-                    sql_archs = f"""SELECT DISTINCT CO.fed_id, CO.name, CO.email, CO.phone_number, 
-                                    COALESCE(CO.num_of_employees, -1) num_employees, 
-                                    COALESCE(CO.revenue_$mm, -1) as revenue, D.type, S2.type_name, 
-                                    P3.num_proj 
-                                    FROM Designers D INNER JOIN Companies CO 
-                                    ON (D.fed_id = CO.fed_id AND 
-                                    (D.type = 'Architect' OR D.type = 'Architect-Engineer')) 
-                                    INNER JOIN Specializes_in S ON D.fed_id = S.fed_id 
-                                    LEFT OUTER JOIN Projects P ON D.fed_id = P.designer_id
-                                    LEFT OUTER JOIN 
-                                    (SELECT D2.fed_id, COALESCE(COUNT(DISTINCT P2.b_id),0) as num_proj 
-                                    FROM Designers D2 LEFT OUTER JOIN Projects P2 ON P2.designer_id = D2.fed_id 
-                                    GROUP BY D2.fed_id) P3 ON D.fed_id = P3.fed_id
-                                    INNER JOIN Specializes_in S2 ON D.fed_id = S2.fed_id 
-                                    WHERE LOWER(CO.name) LIKE '%{arch_name}%' AND P3.num_proj >= {num_of_projects};"""
-                else:
-                    sql_archs = f"""SELECT DISTINCT CO.fed_id, CO.name, CO.email, CO.phone_number, 
-                                    COALESCE(CO.num_of_employees, -1) num_employees, 
-                                    COALESCE(CO.revenue_$mm, -1) as revenue, D.type, S2.type_name, 
-                                    P3.num_proj 
-                                    FROM Designers D INNER JOIN Companies CO 
-                                    ON (D.fed_id = CO.fed_id AND 
-                                    (D.type = 'Architect' OR D.type = 'Architect-Engineer')) 
-                                    INNER JOIN Specializes_in S ON (D.fed_id = S.fed_id 
-                                    AND S.type_name IN {type_tuple}) 
-                                    LEFT OUTER JOIN Projects P ON D.fed_id = P.designer_id
-                                    LEFT OUTER JOIN 
-                                    (SELECT D2.fed_id, COALESCE(COUNT(DISTINCT P2.b_id),0) as num_proj 
-                                    FROM Designers D2 LEFT OUTER JOIN Projects P2 ON P2.designer_id = D2.fed_id 
-                                    GROUP BY D2.fed_id) P3 ON D.fed_id = P3.fed_id
-                                    INNER JOIN Specializes_in S2 ON D.fed_id = S2.fed_id 
-                                    WHERE LOWER(CO.name) LIKE '%{arch_name}%' AND P3.num_proj >= {num_of_projects};"""
-                archs = query_db(sql_archs)
-                helper.transform(archs, 'a')
-            except Exception as e:
-                st.write(f"An error occurred.")
+            arch_name = typeahead_input('Architect Name :', company_names)
+            with search_form('architects'):
+                property_type = st.multiselect('Property Type Specialization (any):', ref.property_types)
+                num_of_projects = st.number_input('Minimum number of projects in database:', value=0, min_value=0,
+                                                  step=1)
+                submitted = submit_button()
+
+            run_submitted('architects', submitted,
+                          lambda: engine.architects(property_type, num_of_projects, arch_name), f"An error occurred.")
         elif lead_search_options == 'Engineers':
-            property_type = st.multiselect('Engineers who have experience with any of the following:', PROPERTY_TYPES)
-            num_of_projects = st.number_input('Minimum number of projects in database:', value=0, min_value=0, step=1)
-            eng_name = st.text_input('Engineering Company Name :')
-            type_tuple = tuple(property_type)
-            if len(property_type) == 1:
-                type_tuple = (property_type[0], property_type[0])
-            if len(eng_name) == 0:
-                eng_name = '_'
-            else:
-                eng_name = eng_name.strip().lower()
-
-            try:
-                if not property_type:
-                    sql_engineers = f"""SELECT DISTINCT CO.fed_id, CO.name, CO.email, CO.phone_number,  
-                                    COALESCE(CO.num_of_employees, -1) num_employees, 
-                                    COALESCE(CO.revenue_$mm, -1) as revenue, D.type, U.type_name, 
-                                    P3.num_proj 
-                                    FROM Designers D INNER JOIN Companies CO 
-                                    ON (D.fed_id = CO.fed_id AND 
-                                    (D.type = 'Engineer' OR D.type = 'Architect-Engineer'))
-                                    LEFT OUTER JOIN Projects P ON D.fed_id = P.designer_id
-                                    LEFT OUTER JOIN 
-                                    (SELECT D2.fed_id, COALESCE(COUNT(DISTINCT P2.b_id),0) as num_proj 
-                                    FROM Designers D2 LEFT OUTER JOIN Projects P2 ON P2.designer_id = D2.fed_id 
-                                    GROUP BY D2.fed_id) P3 ON D.fed_id = P3.fed_id 
-                                    INNER JOIN Used_as U ON P.b_id = U.b_id
-                                    WHERE LOWER(CO.name) LIKE '%{eng_name}%' AND P3.num_proj >= {num_of_projects};"""
-                else:
-                    sql_engineers = f"""SELECT DISTINCT CO.fed_id, CO.name, CO.email, CO.phone_number,  
-                                    COALESCE(CO.num_of_employees, -1) num_employees, 
-                                    COALESCE(CO.revenue_$mm, -1) as revenue, D.type, U4.type_name, 
-                                    P3.num_proj 
-                                    FROM Designers D INNER JOIN Companies CO 
-                                    ON (D.fed_id = CO.fed_id AND 
-                                    (D.type = 'Engineer' OR D.type = 'Architect-Engineer')) 
-                                    LEFT OUTER JOIN Projects P ON D.fed_id = P.designer_id
-                                    LEFT OUTER JOIN
-                                    (SELECT D2.fed_id, COALESCE(COUNT(DISTINCT P2.b_id),0) as num_proj 
-                                    FROM Designers D2 LEFT OUTER JOIN Projects P2 ON P2.designer_id = D2.fed_id 
-                                    GROUP BY D2.fed_id) P3 ON D.fed_id = P3.fed_id
-                                    INNER JOIN Used_as U ON P.b_id = U.b_id
-                                    INNER JOIN (SELECT D3.fed_id, U3.type_name FROM Used_as U3, Designers D3, 
-                                    Projects P4 WHERE U3.b_id = P4.b_id AND D3.fed_id = P4.designer_id) U4 
-                                    ON D.fed_id = U4.fed_id
-                                    WHERE LOWER(CO.name) LIKE '%{eng_name}%' 
-                                    AND U.type_name IN {type_tuple} 
-                                    AND P3.num_proj >= {num_of_projects};"""
-                engs = query_db(sql_engineers)
-                helper.transform(engs, 'e')
-            except Exception as e:
-                st.write(f"An error occurred.")
+            eng_name = typeahead_input('Engineering Company Name :', company_names)
+            with search_form('engineers'):
+                property_type = st.multiselect('Engineers who have experience with any of the following:',
+                                               ref.property_types)
+                num_of_projects = st.number_input('Minimum number of projects in database:', value=0, min_value=0,
+                                                  step=1)
+                submitted = submit_button()
+
+            run_submitted('engineers', submitted,
+                          lambda: engine.engineers(property_type, num_of_projects, eng_name), f"An error occurred.")
         elif lead_search_options == 'Contractors':
-            space = st.selectbox('Space completed over the previous 5 years (millions):', SIZES)
-            num_of_projects = st.number_input('Minimum number of projects in database:', value=0, min_value=0, step=1)
-            contractor_name = st.text_input('Contractor Name:')
+            contractor_name = typeahead_input('Contractor Name:', company_names)
+            with search_form('contractors'):
+                space = st.selectbox('Space completed over the previous 5 years (millions):', SIZES)
+                num_of_projects = st.number_input('Minimum number of projects in database:', value=0, min_value=0,
+                                                  step=1)
+                submitted = submit_button()
             if space:
                 space = space.split(" ")[1]
                 if space == 'Any':
                     space = 0.0
                 else:
                     space = int(space)
-            if len(contractor_name) == 0:
-                contractor_name = '_'
-            else:
-                contractor_name = contractor_name.strip().lower()
-
-            try:
-                sql_contractors = f"""SELECT CO.fed_id, CO.name, CO.email, CO.phone_number, 
-                                        COALESCE(CO.num_of_employees, -1) num_employees, 
-                                        COALESCE(CO.revenue_$mm, -1) as revenue, 
-                                        COALESCE(CC.sqft_completed_5yrs, -1) as sqft_completed_5yrs,
-                                        COALESCE(CC.sqft_under_construction, -1) as sqft_under_construction,
-                                        COALESCE(COUNT(DISTINCT P.b_id),0) as num_proj
-                                        FROM Contractors CC INNER JOIN Companies CO ON CC.fed_id = CO.fed_id 
-                                        LEFT OUTER JOIN Projects P ON CC.fed_id = P.contractor_id 
-                                        WHERE CC.sqft_completed_5yrs >= {space} 
-                                        AND LOWER(CO.name) LIKE '%{contractor_name}%' 
-                                        GROUP BY CO.fed_id, CO.name, CO.email, CO.phone_number, CO.num_of_employees, 
-                                        CO.revenue_$mm, CC.sqft_completed_5yrs, CC.sqft_under_construction 
-                                        HAVING COALESCE(COUNT(DISTINCT P.b_id),0) >= {num_of_projects};"""
-                contractors = query_db(sql_contractors)
-                helper.transform(contractors, 'c')
-            except Exception:
-                st.write(f"An error occurred")
+
+            run_submitted('contractors', submitted,
+                          lambda: engine.contractors(space, num_of_projects, contractor_name), f"An error occurred")
         elif lead_search_options == 'Lenders':
-            loan_amt = st.number_input('How much are you looking to raise? (in $mm):', min_value=0.0, step=5.0)
-            loan_rate = st.number_input('What rate are you willing to pay? (in %)', min_value=0.0,
-                                        max_value=100.0, step=0.25)
-            loan_ltc = st.number_input('How much of the construction cost will you be financing (in %)?',
-                                       min_value=0.0, max_value=100.0, step=5.0)
-            num_of_projects = st.number_input('Minimum number of projects in database:', value=0, min_value=0, step=1)
-            lender_name = st.text_input('Lender Name: ')
-            if len(lender_name) == 0:
-                lender_name = '_'
-            else:
-                lender_name = lender_name.strip().lower()
-
-            try:
-                if loan_amt or loan_rate or loan_ltc:
-                    sql_lenders = f"""SELECT CO.fed_id, CO.name, CO.email, CO.phone_number, 
-                                        COALESCE(CO.num_of_employees, -1) num_employees, 
-                                        COALESCE(CO.revenue_$mm, -1) as revenue, 
-                                        COALESCE(L.min_loan_size_$mm, -1) as min_loan,
-                                        COALESCE(L.max_loan_size_$mm, -1) as max_loan, 
-                                        COALESCE(L.min_rate, -1) as min_rate,
-                                        COALESCE(L.max_rate, -1) as max_rate,
-                                        COALESCE(L.max_ltc, -1) as max_ltc,
-                                        COALESCE(COUNT(DISTINCT P.b_id),0) as num_proj
-                                        FROM Lenders L INNER JOIN Companies CO ON L.fed_id = CO.fed_id
-                                        LEFT OUTER JOIN Projects P ON L.fed_id = P.lender_id 
-                                        WHERE L.min_loan_size_$mm <= {loan_amt} AND L.max_loan_size_$mm >= {loan_amt} 
-                                        AND L.min_rate <= {loan_rate} AND L.max_rate >= {loan_rate} 
-                                        AND L.max_ltc >= {loan_ltc} AND LOWER(CO.name) LIKE '%{lender_name}%' 
-                                        GROUP BY CO.fed_id, CO.name, CO.email, CO.phone_number, 
-                                        CO.num_of_employees, CO.revenue_$mm, 
-                                        L.min_loan_size_$mm, L.max_loan_size_$mm, L.min_rate, L.max_rate, L.max_ltc 
-                                        HAVING COALESCE(COUNT(DISTINCT P.b_id),0) >= {num_of_projects};"""
-                    lenders = query_db(sql_lenders)
-                    helper.transform(lenders, 'l')
-            except Exception:
-                st.write(f"An error occurred.")
+            lender_name = typeahead_input('Lender Name: ', company_names)
+            with search_form('lenders'):
+                # Criteria left at 0 match any lender; the best fitting lenders are listed first
+                loan_amt = st.number_input('How much are you looking to raise? (in $mm):', min_value=0.0, step=5.0,
+                                           help='0 matches any loan size')
+                loan_rate = st.number_input('What rate are you willing to pay? (in %)', min_value=0.0,
+                                            max_value=100.0, step=0.25, help='0 matches any rate')
+                loan_ltc = st.number_input('How much of the construction cost will you be financing (in %)?',
+                                           min_value=0.0, max_value=100.0, step=5.0, help='0 matches any LTC')
+                num_of_projects = st.number_input('Minimum number of projects in database:', value=0, min_value=0,
+                                                  step=1)
+                submitted = submit_button()
+
+            run_submitted('lenders', submitted,
+                          lambda: engine.lenders(loan_amt, loan_rate, loan_ltc, num_of_projects, lender_name),
+                          f"An error occurred.")
+        elif lead_search_options == 'Project team':
+            # A developer, architect, engineer, contractor and lender, searched for at once
+            company_name = typeahead_input('Company Name:', company_names)
+            with search_form('team'):
+                property_type = st.multiselect('Property Type (any):', ref.property_types)
+                region = st.multiselect("Developer's Regional Focus (any):", ref.regions)
+                num_of_projects = st.number_input('Minimum number of projects in database:', value=0, min_value=0,
+                                                  step=1)
+                submitted = submit_button()
+
+            run_submitted('team', submitted,
+                          lambda: engine.team(property_type, region, num_of_projects, company_name),
+                          f"An error occurred.", run_team)
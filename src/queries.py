@@ -0,0 +1,521 @@
+"""
+Named, parameterized SQL statements behind every search in the web front-end
+
+Each statement is prepared server-side (PREPARE ... AS) the first time it runs on a pooled
+connection and executed by name afterwards, so repeat searches skip parsing and planning.
+List filters are bound as arrays and matched with `= ANY($n)`.
+
+Searches that list properties or companies also get a `<name>_page` variant, taking LIMIT and
+OFFSET as two extra trailing parameters and returning every row of the entries on that page,
+and a `<name>_count` variant returning the total number of entries. Searches by location also get a
+`<name>_clusters` variant that groups the properties found into a grid for the results map, and
+company searches a `<name>_top` variant listing the companies with the most projects. Projects
+searches get a `<name>_summary` variant returning their total with the building counts of their area.
+
+Results are cached by statement name and parameters in the process-wide result cache, under the
+statement's family (its name without the _zip/_by_type/_page/_count/_top/_summary suffixes) and its tables.
+
+Function:
+
+    family(string)
+    prepare(connection, string)
+    execute(connection, string, tuple)
+    explain(connection, string, tuple)
+    typed_sql(string, bool)
+    fetch_db(string, tuple)
+    query_db(string, tuple)
+"""
+
+import re
+import time
+from collections import namedtuple
+
+from psycopg2.extensions import QueryCanceledError
+
+import cache
+import db
+import limits
+import metrics
+
+# key/order name the column identifying one result entry (a property or a company) and the column
+# entries are listed by; statements that have them also get paged (_page) and counted (_count) variants.
+# tables lists what the statement reads, so cached results can be invalidated when those tables change.
+Statement = namedtuple('Statement', ['arg_types', 'sql', 'key', 'order', 'tables'], defaults=(None, None, ()))
+# Property searches with a location also get a _clusters variant, taking the grid cell size in degrees as
+# an extra trailing parameter and returning one row per occupied cell, for drawing results on a map.
+MAPPED = ('projects_near', 'projects_in_box')
+# Company searches also get a _top variant, taking a LIMIT as an extra trailing parameter and returning every row
+# of that many companies with the most projects (num_proj), most first, for the project team search.
+RANKED = ('developers', 'developers_by_type', 'architects', 'architects_by_type', 'engineers', 'engineers_by_type',
+          'contractors', 'lenders')
+# Projects searches also get a _summary variant returning their total ('total' row) together with the buildings
+# per property type, class and status of their city or ZIP code (project_facets rows), in one round trip.
+# Each maps to the expression of the ZIP code it searches, 0 for a whole city.
+SUMMARIZED = {'projects': '0', 'projects_zip': '$6'}
+
+STATEMENTS = {
+    'projects': Statement(
+        ('char(2)', 'text', 'text[]', 'text[]', 'text[]'),
+        """SELECT DISTINCT B.*, U2.* FROM Buildings B INNER JOIN Used_as U
+           ON B.building_id = U.b_id LEFT OUTER JOIN Used_as U2
+           ON B.building_id = U2.b_id
+           WHERE B.state = $1
+           AND LOWER(B.city) = $2
+           AND U.type_name = ANY($3)
+           AND B.property_class = ANY($4)
+           AND B.status = ANY($5)""",
+        'building_id', 'building_id', tables=('Buildings', 'Used_as')),
+    'projects_zip': Statement(
+        ('char(2)', 'text', 'text[]', 'text[]', 'text[]', 'integer'),
+        """SELECT DISTINCT B.*, U2.* FROM Buildings B INNER JOIN Used_as U
+           ON B.building_id = U.b_id LEFT OUTER JOIN Used_as U2
+           ON B.building_id = U2.b_id
+           WHERE B.state = $1
+           AND LOWER(B.city) = $2 AND B.zip = $6
+           AND U.type_name = ANY($3)
+           AND B.property_class = ANY($4)
+           AND B.status = ANY($5)""",
+        'building_id', 'building_id', tables=('Buildings', 'Used_as')),
+    'project_facets': Statement(
+        # Buildings per property type, class and status in a city (zip 0) or ZIP code, from the rollup
+        ('char(2)', 'text', 'integer'),
+        """SELECT facet, value, buildings FROM project_facets
+           WHERE state = $1 AND city = $2 AND zip = $3""",
+        tables=('project_facets',)),
+    'projects_near': Statement(
+        ('float8', 'float8', 'float8', 'text[]', 'text[]', 'text[]'),
+        """SELECT DISTINCT B.*, U2.*,
+           earth_distance(ll_to_earth($1, $2), ll_to_earth(B.latitude, B.longitude)) / 1609.344 AS miles
+           FROM Buildings B INNER JOIN Used_as U
+           ON B.building_id = U.b_id LEFT OUTER JOIN Used_as U2
+           ON B.building_id = U2.b_id
+           WHERE B.latitude IS NOT NULL AND B.longitude IS NOT NULL
+           AND earth_box(ll_to_earth($1, $2), $3) @> ll_to_earth(B.latitude, B.longitude)
+           AND earth_distance(ll_to_earth($1, $2), ll_to_earth(B.latitude, B.longitude)) <= $3
+           AND U.type_name = ANY($4)
+           AND B.property_class = ANY($5)
+           AND B.status = ANY($6)""",
+        'building_id', 'miles', tables=('Buildings', 'Used_as')),
+    'projects_in_box': Statement(
+        ('float8', 'float8', 'float8', 'float8', 'text[]', 'text[]', 'text[]'),
+        """SELECT DISTINCT B.*, U2.* FROM Buildings B INNER JOIN Used_as U
+           ON B.building_id = U.b_id LEFT OUTER JOIN Used_as U2
+           ON B.building_id = U2.b_id
+           WHERE B.latitude IS NOT NULL AND B.longitude IS NOT NULL
+           AND point(B.longitude, B.latitude) <@ box(point($2, $1), point($4, $3))
+           AND U.type_name = ANY($5)
+           AND B.property_class = ANY($6)
+           AND B.status = ANY($7)""",
+        'building_id', 'building_id', tables=('Buildings', 'Used_as')),
+    'address_location': Statement(
+        # A geocoded address, else a located building at that address, else the ZIP code's centroid
+        ('integer', 'text', 'integer'),
+        """SELECT latitude, longitude FROM (
+             SELECT G.latitude, G.longitude, 0 AS rank FROM geocode_cache G
+             WHERE G.street_num = $1 AND LOWER(G.street_name) LIKE $2 AND G.zip = $3
+             UNION ALL
+             SELECT B.latitude, B.longitude, 1 FROM Buildings B
+             WHERE B.street_num = $1 AND LOWER(B.street_name) LIKE $2 AND B.zip = $3
+             AND B.latitude IS NOT NULL AND B.longitude IS NOT NULL
+             UNION ALL
+             SELECT Z.latitude, Z.longitude, 2 FROM zip_centroids Z WHERE Z.zip = $3) found
+           ORDER BY rank LIMIT 1""",
+        tables=('geocode_cache', 'Buildings', 'zip_centroids')),
+    'project_details': Statement(
+        ('integer', 'text', 'text', 'char(2)', 'integer'),
+        """WITH building AS (
+             SELECT B.building_id, B.status FROM Buildings B
+             WHERE B.street_num = $1 AND LOWER(B.street_name) LIKE $2
+             AND LOWER(B.city) = $3 AND B.state = $4 AND B.zip = $5),
+           owners AS (
+             SELECT O.b_id, array_agg(DISTINCT C.name) as owners
+             FROM building B INNER JOIN Owned_by O ON B.building_id = O.b_id
+             INNER JOIN Companies C ON O.fed_id = C.fed_id
+             GROUP BY O.b_id),
+           awards AS (
+             SELECT R.b_id, array_agg(DISTINCT R.award_name || ', ' || R.award_org || '(' || R.award_year || ')')
+             as awards
+             FROM building B INNER JOIN Recieved_award R ON B.building_id = R.b_id
+             GROUP BY R.b_id)
+           SELECT B.building_id, C4.name as developer, B.status, MAX(P.completion_date) as completion_date,
+           array_agg(DISTINCT C1.name) as designers, array_agg(DISTINCT C2.name) as contractors,
+           array_agg(DISTINCT C3.name) as lenders, O.owners, COALESCE(A.awards, '{}') as awards
+           FROM building B INNER JOIN Projects P ON B.building_id = P.b_id
+           INNER JOIN Companies C1 ON P.designer_id = C1.fed_id
+           INNER JOIN Companies C2 ON P.contractor_id = C2.fed_id
+           INNER JOIN Companies C3 ON P.lender_id = C3.fed_id
+           INNER JOIN Companies C4 ON P.developer_id = C4.fed_id
+           INNER JOIN owners O ON B.building_id = O.b_id
+           LEFT OUTER JOIN awards A ON B.building_id = A.b_id
+           GROUP BY B.building_id, C4.name, B.status, O.owners, A.awards""",
+        tables=('Buildings', 'Projects', 'Companies', 'Owned_by', 'Recieved_award')),
+    'developer_regions': Statement(
+        (),
+        """SELECT DISTINCT regional_focus FROM Developers""",
+        tables=('Developers',)),
+    'developers': Statement(
+        ('text[]', 'text', 'integer'),
+        """SELECT DISTINCT CO.fed_id, CO.name, CO.email, CO.phone_number,
+           COALESCE(CO.num_of_employees, -1) num_employees,
+           COALESCE(CO.revenue_$mm, -1) as revenue, D.regional_focus,
+           COALESCE(S2.type_name,'None') as type_name,
+           PS.num_proj
+           FROM Developers D INNER JOIN Companies CO ON D.fed_id = CO.fed_id
+           INNER JOIN company_project_stats PS
+           ON (PS.fed_id = D.fed_id AND PS.role = 'developer' AND PS.type_name = '*')
+           LEFT OUTER JOIN Specializes_in S2 ON D.fed_id = S2.fed_id
+           WHERE LOWER(CO.name) LIKE $2
+           AND D.regional_focus = ANY($1)
+           AND PS.num_proj >= $3""",
+        'fed_id', 'name', tables=('Developers', 'Companies', 'company_project_stats', 'Specializes_in')),
+    'developers_by_type': Statement(
+        ('text[]', 'text', 'integer', 'text[]'),
+        """SELECT DISTINCT CO.fed_id, CO.name, CO.email, CO.phone_number,
+           COALESCE(CO.num_of_employees, -1) num_employees,
+           COALESCE(CO.revenue_$mm, -1) as revenue, D.regional_focus,
+           COALESCE(S2.type_name,'None') as type_name,
+           PS.num_proj
+           FROM Developers D INNER JOIN Companies CO ON D.fed_id = CO.fed_id
+           INNER JOIN company_project_stats PS
+           ON (PS.fed_id = D.fed_id AND PS.role = 'developer' AND PS.type_name = '*')
+           INNER JOIN Specializes_in S ON D.fed_id = S.fed_id
+           LEFT OUTER JOIN Specializes_in S2 ON D.fed_id = S2.fed_id
+           WHERE D.regional_focus = ANY($1) AND S.type_name = ANY($4)
+           AND LOWER(CO.name) LIKE $2
+           AND PS.num_proj >= $3""",
+        'fed_id', 'name', tables=('Developers', 'Companies', 'company_project_stats', 'Specializes_in')),
+    'architects': Statement(
+        ('text', 'integer'),
+        """SELECT DISTINCT CO.fed_id, CO.name, CO.email, CO.phone_number,
+           COALESCE(CO.num_of_employees, -1) num_employees,
+           COALESCE(CO.revenue_$mm, -1) as revenue, D.type, S2.type_name,
+           PS.num_proj
+           FROM Designers D INNER JOIN Companies CO
+           ON (D.fed_id = CO.fed_id AND
+           (D.type = 'Architect' OR D.type = 'Architect-Engineer'))
+           INNER JOIN company_project_stats PS
+           ON (PS.fed_id = D.fed_id AND PS.role = 'designer' AND PS.type_name = '*')
+           INNER JOIN Specializes_in S2 ON D.fed_id = S2.fed_id
+           WHERE LOWER(CO.name) LIKE $1 AND PS.num_proj >= $2""",
+        'fed_id', 'name', tables=('Designers', 'Companies', 'company_project_stats', 'Specializes_in')),
+    'architects_by_type': Statement(
+        ('text', 'integer', 'text[]'),
+        """SELECT DISTINCT CO.fed_id, CO.name, CO.email, CO.phone_number,
+           COALESCE(CO.num_of_employees, -1) num_employees,
+           COALESCE(CO.revenue_$mm, -1) as revenue, D.type, S2.type_name,
+           PS.num_proj
+           FROM Designers D INNER JOIN Companies CO
+           ON (D.fed_id = CO.fed_id AND
+           (D.type = 'Architect' OR D.type = 'Architect-Engineer'))
+           INNER JOIN Specializes_in S ON (D.fed_id = S.fed_id
+           AND S.type_name = ANY($3))
+           INNER JOIN company_project_stats PS
+           ON (PS.fed_id = D.fed_id AND PS.role = 'designer' AND PS.type_name = '*')
+           INNER JOIN Specializes_in S2 ON D.fed_id = S2.fed_id
+           WHERE LOWER(CO.name) LIKE $1 AND PS.num_proj >= $2""",
+        'fed_id', 'name', tables=('Designers', 'Companies', 'company_project_stats', 'Specializes_in')),
+    'engineers': Statement(
+        ('text', 'integer'),
+        """SELECT DISTINCT CO.fed_id, CO.name, CO.email, CO.phone_number,
+           COALESCE(CO.num_of_employees, -1) num_employees,
+           COALESCE(CO.revenue_$mm, -1) as revenue, D.type, T.type_name,
+           PS.num_proj
+           FROM Designers D INNER JOIN Companies CO
+           ON (D.fed_id = CO.fed_id AND
+           (D.type = 'Engineer' OR D.type = 'Architect-Engineer'))
+           INNER JOIN company_project_stats PS
+           ON (PS.fed_id = D.fed_id AND PS.role = 'designer' AND PS.type_name = '*')
+           INNER JOIN company_project_stats T
+           ON (T.fed_id = D.fed_id AND T.role = 'designer' AND T.type_name <> '*')
+           WHERE LOWER(CO.name) LIKE $1 AND PS.num_proj >= $2""",
+        'fed_id', 'name', tables=('Designers', 'Companies', 'company_project_stats')),
+    'engineers_by_type': Statement(
+        ('text', 'integer', 'text[]'),
+        """SELECT DISTINCT CO.fed_id, CO.name, CO.email, CO.phone_number,
+           COALESCE(CO.num_of_employees, -1) num_employees,
+           COALESCE(CO.revenue_$mm, -1) as revenue, D.type, T.type_name,
+           PS.num_proj
+           FROM Designers D INNER JOIN Companies CO
+           ON (D.fed_id = CO.fed_id AND
+           (D.type = 'Engineer' OR D.type = 'Architect-Engineer'))
+           INNER JOIN company_project_stats PS
+           ON (PS.fed_id = D.fed_id AND PS.role = 'designer' AND PS.type_name = '*')
+           INNER JOIN company_project_stats T
+           ON (T.fed_id = D.fed_id AND T.role = 'designer' AND T.type_name <> '*')
+           WHERE LOWER(CO.name) LIKE $1
+           AND EXISTS (SELECT 1 FROM company_project_stats F
+           WHERE F.fed_id = D.fed_id AND F.role = 'designer' AND F.type_name = ANY($3))
+           AND PS.num_proj >= $2""",
+        'fed_id', 'name', tables=('Designers', 'Companies', 'company_project_stats')),
+    'contractors': Statement(
+        ('numeric', 'text', 'integer'),
+        """SELECT CO.fed_id, CO.name, CO.email, CO.phone_number,
+           COALESCE(CO.num_of_employees, -1) num_employees,
+           COALESCE(CO.revenue_$mm, -1) as revenue,
+           COALESCE(CC.sqft_completed_5yrs, -1) as sqft_completed_5yrs,
+           COALESCE(CC.sqft_under_construction, -1) as sqft_under_construction,
+           PS.num_proj
+           FROM Contractors CC INNER JOIN Companies CO ON CC.fed_id = CO.fed_id
+           INNER JOIN company_project_stats PS
+           ON (PS.fed_id = CC.fed_id AND PS.role = 'contractor' AND PS.type_name = '*')
+           WHERE CC.sqft_completed_5yrs >= $1
+           AND LOWER(CO.name) LIKE $2
+           AND PS.num_proj >= $3""",
+        'fed_id', 'name', tables=('Contractors', 'Companies', 'company_project_stats')),
+    'lenders': Statement(
+        # A criterion left at 0 matches any lender. closeness ranks the matches: how far the asked amount, rate
+        # and LTC sit from the middle of the lender's ranges (LTC's being 0 to max_ltc), 0 at the middle and 1
+        # at an edge, averaged over the criteria given. lending.py answers the same search from memory.
+        ('numeric', 'numeric', 'numeric', 'text', 'integer'),
+        """SELECT CO.fed_id, CO.name, CO.email, CO.phone_number,
+           COALESCE(CO.num_of_employees, -1) num_employees,
+           COALESCE(CO.revenue_$mm, -1) as revenue,
+           COALESCE(L.min_loan_size_$mm, -1) as min_loan,
+           COALESCE(L.max_loan_size_$mm, -1) as max_loan,
+           COALESCE(L.min_rate, -1) as min_rate,
+           COALESCE(L.max_rate, -1) as max_rate,
+           COALESCE(L.max_ltc, -1) as max_ltc,
+           PS.num_proj,
+           (CASE WHEN $1 = 0 THEN 0 ELSE COALESCE(ABS($1 - (L.min_loan_size_$mm + L.max_loan_size_$mm) / 2)
+              / NULLIF((L.max_loan_size_$mm - L.min_loan_size_$mm) / 2, 0), 0) END
+            + CASE WHEN $2 = 0 THEN 0 ELSE COALESCE(ABS($2 - (L.min_rate + L.max_rate) / 2)
+              / NULLIF((L.max_rate - L.min_rate) / 2, 0), 0) END
+            + CASE WHEN $3 = 0 THEN 0 ELSE COALESCE(ABS($3 - L.max_ltc / 2) / NULLIF(L.max_ltc / 2, 0), 0) END)
+           / GREATEST(($1 <> 0)::integer + ($2 <> 0)::integer + ($3 <> 0)::integer, 1)::float8 as closeness
+           FROM Lenders L INNER JOIN Companies CO ON L.fed_id = CO.fed_id
+           INNER JOIN company_project_stats PS
+           ON (PS.fed_id = L.fed_id AND PS.role = 'lender' AND PS.type_name = '*')
+           WHERE ($1 = 0 OR (L.min_loan_size_$mm <= $1 AND L.max_loan_size_$mm >= $1))
+           AND ($2 = 0 OR (L.min_rate <= $2 AND L.max_rate >= $2))
+           AND ($3 = 0 OR L.max_ltc >= $3) AND LOWER(CO.name) LIKE $4
+           AND PS.num_proj >= $5""",
+        'fed_id', 'closeness', tables=('Lenders', 'Companies', 'company_project_stats')),
+    'lender_terms': Statement(
+        # Every lender's terms, for the in-memory matching index of lending.py; missing terms stay NULL
+        (),
+        """SELECT CO.fed_id, CO.name, CO.email, CO.phone_number,
+           COALESCE(CO.num_of_employees, -1) num_employees,
+           COALESCE(CO.revenue_$mm, -1) as revenue,
+           L.min_loan_size_$mm::float8 as min_loan, L.max_loan_size_$mm::float8 as max_loan,
+           L.min_rate::float8 as min_rate, L.max_rate::float8 as max_rate, L.max_ltc::float8 as max_ltc,
+           PS.num_proj
+           FROM Lenders L INNER JOIN Companies CO ON L.fed_id = CO.fed_id
+           INNER JOIN company_project_stats PS
+           ON (PS.fed_id = L.fed_id AND PS.role = 'lender' AND PS.type_name = '*')""",
+        tables=('Lenders', 'Companies', 'company_project_stats')),
+}
+
+
+
+def _paged(statement):
+    n = len(statement.arg_types)
+    return statement._replace(
+        arg_types=statement.arg_types + ('integer', 'integer'),
+        sql=f"""WITH results AS ({statement.sql}),
+           page AS (SELECT {statement.key} FROM results GROUP BY {statement.key}
+           ORDER BY MIN({statement.order}), {statement.key} LIMIT ${n + 1} OFFSET ${n + 2})
+           SELECT results.* FROM results INNER JOIN page USING ({statement.key})
+           ORDER BY results.{statement.order}, results.{statement.key}""",
+        key=None, order=None)
+
+
+def _counted(statement):
+    return statement._replace(
+        sql=f"""SELECT COUNT(DISTINCT {statement.key}) AS total FROM ({statement.sql}) results""",
+        key=None, order=None)
+
+
+def _clustered(statement):
+    n = len(statement.arg_types)
+    return statement._replace(
+        arg_types=statement.arg_types + ('float8',),
+        sql=f"""WITH results AS ({statement.sql}),
+           located AS (SELECT DISTINCT {statement.key}, latitude, longitude FROM results)
+           SELECT AVG(latitude) AS latitude, AVG(longitude) AS longitude, COUNT(*) AS buildings
+           FROM located GROUP BY FLOOR(latitude / ${n + 1}), FLOOR(longitude / ${n + 1})""",
+        key=None, order=None)
+
+
+def _ranked(statement):
+    n = len(statement.arg_types)
+    return statement._replace(
+        arg_types=statement.arg_types + ('integer',),
+        sql=f"""WITH results AS ({statement.sql}),
+           top AS (SELECT {statement.key} FROM results GROUP BY {statement.key}
+           ORDER BY MAX(num_proj) DESC, {statement.key} LIMIT ${n + 1})
+           SELECT results.* FROM results INNER JOIN top USING ({statement.key})
+           ORDER BY results.num_proj DESC, results.{statement.key}""",
+        key=None, order=None)
+
+
+for _name, _statement in list(STATEMENTS.items()):
+    if _statement.key:
+        STATEMENTS[f'{_name}_page'] = _paged(_statement)
+        STATEMENTS[f'{_name}_count'] = _counted(_statement)
+for _name in MAPPED:
+    STATEMENTS[f'{_name}_clusters'] = _clustered(STATEMENTS[_name])
+def _summarized(statement, zipcode):
+    return statement._replace(
+        sql=f"""SELECT 'total'::varchar(6) AS facet, NULL::varchar(64) AS value,
+           COUNT(DISTINCT {statement.key}) AS buildings FROM ({statement.sql}) results
+           UNION ALL
+           SELECT facet, value, buildings FROM project_facets WHERE state = $1 AND city = $2 AND zip = {zipcode}""",
+        key=None, order=None, tables=statement.tables + ('project_facets',))
+
+
+for _name in RANKED:
+    STATEMENTS[f'{_name}_top'] = _ranked(STATEMENTS[_name])
+for _name, _zipcode in SUMMARIZED.items():
+    STATEMENTS[f'{_name}_summary'] = _summarized(STATEMENTS[_name], _zipcode)
+
+
+def prepare(conn, name):
+    """
+    Prepares a named statement on a connection unless it has already been prepared there.
+
+    :param conn: A PooledConnection object
+    :param name: A string object naming an entry of STATEMENTS
+    :return: void
+    """
+    if name in conn.prepared:
+        return
+    statement = STATEMENTS[name]
+    arg_types = f" ({', '.join(statement.arg_types)})" if statement.arg_types else ''
+    with conn.cursor() as cur:
+        cur.execute(f"PREPARE {name}{arg_types} AS {statement.sql};")
+    conn.prepared.add(name)
+
+
+def execute(conn, name, params=()):
+    """
+    Runs a named statement and fetches its result.
+
+    :param conn: A PooledConnection object
+    :param name: A string object naming an entry of STATEMENTS
+    :param params: A tuple of parameter values in $1..$n order; tuples are bound as arrays
+    :return: A (list of row tuples, list of column names) pair
+    """
+    prepare(conn, name)
+    with conn.cursor() as cur:
+        start = time.perf_counter()
+        cur.execute(*_execute_command(name, params))
+        fetched = time.perf_counter()
+        rows = cur.fetchall()
+        metrics.add('db', fetched - start)
+        metrics.add('fetch', time.perf_counter() - fetched)
+        return rows, [desc[0] for desc in cur.description]
+
+
+def explain(conn, name, params=()):
+    """
+    Fetches the plan Postgres would use to run a named statement with the given parameters.
+
+    :param conn: A PooledConnection object
+    :param name: A string object naming an entry of STATEMENTS
+    :param params: A tuple of parameter values in $1..$n order
+    :return: A dictionary object holding the top-level 'Plan' node of EXPLAIN (FORMAT JSON)
+    """
+    prepare(conn, name)
+    command, values = _execute_command(name, params)
+    with conn.cursor() as cur:
+        cur.execute(f"EXPLAIN (FORMAT JSON) {command}", values)
+        return cur.fetchone()[0][0]['Plan']
+
+
+def typed_sql(name, pyformat=False):
+    """
+    The SQL of a named statement with every parameter cast to its declared type, for clients that
+    run it without PREPARE (asyncpg, server-side cursors, COPY).
+
+    :param name: A string object naming an entry of STATEMENTS
+    :param pyformat: A boolean object; True writes $n as psycopg2's %(pn)s and doubles literal '%'
+    :return: A string object
+    """
+    statement = STATEMENTS[name]
+    sql = statement.sql.replace('%', '%%') if pyformat else statement.sql
+
+    def cast(match):
+        n = int(match.group(1))
+        return f"{f'%(p{n})s' if pyformat else match.group(0)}::{statement.arg_types[n - 1]}"
+
+    return re.sub(r'\$(\d+)(?!\d)', cast, sql)
+
+
+def _execute_command(name, params):
+    statement = STATEMENTS[name]
+    if len(params) != len(statement.arg_types):
+        raise ValueError(f"{name} expects {len(statement.arg_types)} parameter(s), got {len(params)}")
+    values = [list(p) if isinstance(p, tuple) else p for p in params]
+    if not values:
+        return f"EXECUTE {name}", None
+    return f"EXECUTE {name} ({', '.join(['%s'] * len(values))})", values
+
+
+def family(name):
+    """
+    :param name: A string object naming an entry of STATEMENTS
+    :return: A string object naming the search the statement belongs to, e.g. 'projects' for 'projects_zip_page'
+    """
+    return re.sub(r'(_zip|_by_type)?(_page|_count|_clusters|_top|_summary)?$', '', name)
+
+
+def fetch_db(name: str, params: tuple = ()):
+    """
+    Runs a named statement on a pooled connection, bypassing the result cache.
+
+    The statement runs on a read replica when any is configured, under its family's statement
+    timeout (see limits.py). A search that times out raises SearchTooBroad, as does running it
+    again while the circuit breaker refuses it.
+
+    :param name: A string object naming an entry of STATEMENTS
+    :param params: A tuple of parameter values in $1..$n order
+    :return: A pandas DataFrame object
+    """
+    search_family = family(name)
+    limits.check(search_family, params)
+    # A connection dropped by the server is only noticed once it is used, so retry once on a fresh one
+    for attempt in range(2):
+        try:
+            # Borrow a long-lived connection from the shared pool of a replica, or of the primary
+            with db.connection(read_only=True) as conn:
+                limits.apply(conn, search_family)
+                # Run the named statement, preparing it first if this connection has not seen it yet
+                data, column_names = execute(conn, name, params)
+            break
+        except db.ConnectionLost:
+            if attempt:
+                raise
+        except QueryCanceledError as e:
+            limits.record_timeout(search_family, params)
+            raise limits.SearchTooBroad() from e
+
+    # pandas is imported by the first query rather than at startup (see warmup.py)
+    import pandas as pd
+
+    start = time.perf_counter()
+    df = pd.DataFrame(data=data, columns=column_names)
+    metrics.add('fetch', time.perf_counter() - start)
+    return df
+
+
+def query_db(name: str, params: tuple = ()):
+    """
+    Runs a named statement like fetch_db(), serving repeat calls from the result cache and sharing
+    one database call between concurrent identical calls.
+
+    The returned DataFrame may be shared with other sessions and must not be modified.
+
+    :param name: A string object naming an entry of STATEMENTS
+    :param params: A tuple of parameter values in $1..$n order
+    :return: A pandas DataFrame object
+    """
+    def load():
+        metrics.add('cache_misses', 1)
+        return fetch_db(name, params)
+
+    # Identical searches arriving while this one runs wait for its result rather than querying again
+    df, outcome = cache.get_cache().load((name, params), load, family(name), STATEMENTS[name].tables)
+    if outcome != 'miss':
+        metrics.add('cache_hits', 1)
+    metrics.add('rows', len(df))
+    return df
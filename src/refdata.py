@@ -0,0 +1,165 @@
+"""
+Process-wide snapshot of the lookup values behind the search widgets
+
+Regions, property types, property classes, statuses, designer types and the states that have
+buildings are loaded from the database in one round trip on first use, then kept in memory for
+every session. Classes and statuses come from the table constraints that define them, and states
+are found with a loose index scan, so loading stays cheap on large tables. A background thread
+checks pg_stat_user_tables write counters for the source tables and reloads the snapshot only
+when they have changed. Until the database has been reached, or for a domain it has no values
+for, the lists in constants.py are used; a failed load is retried by the next change check or,
+at most every retry_interval seconds, by the next get(). Both intervals are set in an optional
+[refdata] section of database.ini:
+
+    [refdata]
+    refresh_interval = 60         ; seconds between change checks, 0 disables them
+    retry_interval = 30           ; seconds before get() retries a failed load
+
+Functions:
+
+    get()
+    load()
+    version()
+    start_schedule()
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+
+import db
+from constants import STATES, PROPERTY_TYPES, PROPERTY_CLASSES, STATUSES, REGIONS, DESIGNER_TYPES
+
+REFDATA_DEFAULTS = {'refresh_interval': 60.0, 'retry_interval': 30.0}
+SOURCE_TABLES = ('buildings', 'developers', 'designers', 'property_types')
+
+RefData = namedtuple('RefData', ['regions', 'property_types', 'property_classes', 'statuses', 'designer_types',
+                                 'states', 'version'])
+
+# The snapshot while the database cannot be reached; its version matches no database version, so the change
+# check replaces it as soon as a load succeeds
+FALLBACK = RefData(REGIONS, PROPERTY_TYPES, PROPERTY_CLASSES, STATUSES, DESIGNER_TYPES, STATES, None)
+
+LOAD_SQL = """
+    WITH RECURSIVE states AS (
+      (SELECT state FROM Buildings ORDER BY state LIMIT 1)
+      UNION ALL
+      SELECT (SELECT B.state FROM Buildings B WHERE B.state > S.state ORDER BY B.state LIMIT 1)
+      FROM states S WHERE S.state IS NOT NULL)
+    SELECT ARRAY(SELECT DISTINCT regional_focus FROM Developers WHERE regional_focus IS NOT NULL),
+           ARRAY(SELECT name FROM Property_types),
+           (SELECT pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = 'buildings'::regclass AND conname = 'class_constraint'),
+           (SELECT pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = 'buildings'::regclass AND conname = 'status_contraint'),
+           ARRAY(SELECT DISTINCT type FROM Designers),
+           ARRAY(SELECT state FROM states WHERE state IS NOT NULL)"""
+
+VERSION_SQL = """SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0)::bigint FROM pg_stat_user_tables
+                 WHERE relname = ANY(%s)"""
+
+logger = logging.getLogger(__name__)
+
+_snapshot = None
+_failed_at = None
+_lock = threading.Lock()
+_schedule = None
+
+
+def _ordered(values, preferred):
+    # Keep the familiar order of constants.py, with values it does not know appended
+    if not values:
+        return list(preferred)
+    return [v for v in preferred if v in values] + sorted(v for v in values if v not in preferred)
+
+
+def _check_values(definition):
+    # e.g. CHECK (((status)::text = ANY ((ARRAY['completed'::character varying, ...])::text[])))
+    return [v.replace("''", "'") for v in re.findall(r"'((?:[^']|'')*)'", definition or '')]
+
+
+def version(conn=None):
+    """
+    :param conn: A psycopg2 connection object, or None to borrow one from the pool
+    :return: An integer object that changes whenever rows of the source tables are written
+    """
+    if conn is None:
+        with db.connection() as conn:
+            return version(conn)
+    with conn.cursor() as cur:
+        cur.execute(VERSION_SQL, (list(SOURCE_TABLES),))
+        return cur.fetchone()[0]
+
+
+def load():
+    """
+    Loads every lookup domain in one round trip and makes it the current snapshot.
+
+    :return: A RefData object
+    """
+    global _snapshot
+    with db.connection() as conn:
+        current = version(conn)
+        with conn.cursor() as cur:
+            cur.execute(LOAD_SQL)
+            regions, types, class_check, status_check, designer_types, states = cur.fetchone()
+    snapshot = RefData(_ordered(regions, REGIONS), _ordered(types, PROPERTY_TYPES),
+                       _ordered(_check_values(class_check), PROPERTY_CLASSES),
+                       _ordered(_check_values(status_check), STATUSES), _ordered(designer_types, DESIGNER_TYPES),
+                       _ordered(states, STATES), current)
+    _snapshot = snapshot
+    return snapshot
+
+
+def _due():
+    # Nothing loaded yet, or the fallback has been served for retry_interval seconds
+    return _snapshot is None or (_snapshot is FALLBACK and time.monotonic() - _failed_at
+                                 >= db.get_settings('refdata', REFDATA_DEFAULTS)['retry_interval'])
+
+
+def get():
+    """
+    :return: A RefData object, the current snapshot; loaded on first use, or FALLBACK while loading fails
+    """
+    global _snapshot, _failed_at
+    if _due():
+        with _lock:
+            if _due():
+                try:
+                    load()
+                except Exception:
+                    logger.exception("reference data could not be loaded, using constants")
+                    # Kept, so the sessions rerunning in the meantime do not each wait on the database again
+                    _snapshot, _failed_at = FALLBACK, time.monotonic()
+    return _snapshot
+
+
+def _run_schedule(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            if _snapshot is None or version() != _snapshot.version:
+                load()
+                logger.info("reloaded reference data")
+        except Exception:
+            logger.exception("reference data refresh failed")
+
+
+def start_schedule():
+    """
+    Starts the background change check if [refdata] refresh_interval is set. Safe to call on every rerun.
+
+    :return: void
+    """
+    global _schedule
+    with _lock:
+        if _schedule is not None:
+            return
+        interval = db.get_settings('refdata', REFDATA_DEFAULTS)['refresh_interval']
+        if interval <= 0:
+            _schedule = False
+            return
+        _schedule = threading.Thread(target=_run_schedule, args=(interval,), name='refdata-refresh', daemon=True)
+        _schedule.start()
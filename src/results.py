@@ -0,0 +1,257 @@
+"""
+Compact, typed records of search results and the formatter that renders them
+
+collect() turns a query result into one record per property, developer or company, holding raw
+values (numbers stay numbers, missing values are None) with the repeated category values (property
+types, statuses, property classes, regions, designer types, states) interned, so cached results
+share one copy of each. Records use __slots__ and carry no per-instance dictionary. Nothing is
+formatted until a page is rendered, by describe() per record or format_page() for a whole page.
+
+Functions:
+
+    collect(pd.DataFrame, string)
+    describe(Record)
+    format_page(list, string, int)
+    team_table(list)
+"""
+
+import sys
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _known(value):
+    # The lead generation statements use -1 for missing numbers
+    return None if value is None or value == -1 else value
+
+
+class Record:
+    """Base of the result records: positional or keyword construction, equality, repr and as_dict()."""
+
+    __slots__ = ()
+    _fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Inherited fields first, in declaration order
+        cls._fields = cls.__base__._fields + tuple(cls.__dict__.get('__slots__', ()))
+
+    def __init__(self, *args, **kwargs):
+        for name, value in zip(self._fields, args):
+            setattr(self, name, value)
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    def as_dict(self):
+        return {name: getattr(self, name, None) for name in self._fields}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{k}={v!r}' for k, v in self.as_dict().items())})"
+
+
+class PropertyResult(Record):
+    __slots__ = ('building_id', 'name', 'street_num', 'street_name', 'city', 'state', 'zip', 'size', 'types',
+                 'property_class', 'status', 'miles')
+
+
+class ProjectDetail(Record):
+    __slots__ = ('developer', 'status', 'completion_date', 'designers', 'contractors', 'lenders', 'owners', 'awards')
+
+
+class CompanyLead(Record):
+    __slots__ = ('fed_id', 'name', 'num_employees', 'revenue', 'num_projects', 'email', 'phone_number')
+
+
+class DeveloperLead(CompanyLead):
+    __slots__ = ('region', 'property_types')
+
+
+class DesignerLead(CompanyLead):
+    __slots__ = ('designer_type', 'property_types')
+
+
+class ContractorLead(CompanyLead):
+    __slots__ = ('sqft_completed_5yrs', 'sqft_under_construction')
+
+
+class LenderLead(CompanyLead):
+    __slots__ = ('min_loan', 'max_loan', 'min_rate', 'max_rate', 'max_ltc')
+
+
+def _text(value):
+    # Missing text may arrive as None, NaN or ''
+    return value if isinstance(value, str) and value else None
+
+
+def _types(data, key):
+    # The rows of one entry come in no particular order, so its types are sorted to read the same on every run
+    return data.groupby(key, sort=False)['type_name'].agg(lambda t: tuple(sorted(_intern(v) for v in t)))
+
+
+def _properties(data):
+    firsts = data.drop_duplicates('building_id')
+    # mixed-use properties associated with multiple types
+    types = _types(data, 'building_id')
+    miles = firsts['miles'] if 'miles' in firsts else [None] * len(firsts)
+    return [PropertyResult(building_id, _text(name), street_num, street_name, city, _intern(state), zipcode,
+                           float(size), property_types, _intern(_text(property_class)), _intern(status), distance)
+            for building_id, name, street_num, street_name, city, state, zipcode, size, property_types,
+            property_class, status, distance in zip(
+                firsts['building_id'], firsts['name'], firsts['street_num'], firsts['street_name'], firsts['city'],
+                firsts['state'], firsts['zip'], firsts['size_sqf_0000'], types.loc[firsts['building_id']],
+                firsts['property_class'], firsts['status'], miles)]
+
+
+def _project_details(data):
+    # One row per building and developer, with every role, owner and award already aggregated into arrays
+    found = {}
+    for developer, status, date, designers, contractors, lenders, owners, awards in zip(
+            data['developer'], data['status'], data['completion_date'], data['designers'], data['contractors'],
+            data['lenders'], data['owners'], data['awards']):
+        if developer not in found:
+            found[developer] = ProjectDetail(developer, _intern(status), date, {}, {}, {}, {}, {})
+        detail = found[developer]
+        detail.completion_date = date
+        for names, more in ((detail.designers, designers), (detail.contractors, contractors),
+                            (detail.lenders, lenders), (detail.owners, owners), (detail.awards, awards)):
+            names.update(dict.fromkeys(more))
+    for detail in found.values():
+        for field in ('designers', 'contractors', 'lenders', 'owners', 'awards'):
+            setattr(detail, field, tuple(getattr(detail, field)))
+    return list(found.values())
+
+
+def _common(firsts):
+    return zip(firsts['fed_id'], firsts['name'], map(_known, firsts['num_employees']),
+               (None if v is None else float(v) for v in map(_known, firsts['revenue'])), firsts['num_proj'],
+               map(_text, firsts['email']), map(_text, firsts['phone_number']))
+
+
+def _companies(data, cat):
+    firsts = data.drop_duplicates('fed_id')
+    types = _types(data, 'fed_id')
+    focus = firsts['regional_focus' if cat == 'd' else 'type']
+    record = DeveloperLead if cat == 'd' else DesignerLead
+    found = [record(*common, _intern(_text(company_focus)), property_types)
+             for common, company_focus, property_types in zip(_common(firsts), focus, types.loc[firsts['fed_id']])]
+    return sorted(found, key=lambda lead: lead.name)
+
+
+def _leads(data, cat):
+    firsts = data.drop_duplicates('fed_id')
+    if cat == 'c':
+        extra = zip(firsts['sqft_completed_5yrs'], firsts['sqft_under_construction'])
+        record = ContractorLead
+    else:
+        extra = zip(firsts['min_loan'], firsts['max_loan'], firsts['min_rate'], firsts['max_rate'], firsts['max_ltc'])
+        record = LenderLead
+    return [record(*common, *(None if v is None else float(v) for v in map(_known, values)))
+            for common, values in zip(_common(firsts), extra)]
+
+
+def collect(data, cat):
+    """
+    Collapses a query result into one record per property or company.
+
+    :param data: A non-empty pandas Dataframe object to be collected
+    :param cat: a string object denoting processing option
+    :return: A list of PropertyResult ('p'), ProjectDetail ('pd'), DeveloperLead ('d'), DesignerLead ('a', 'e'),
+             ContractorLead ('c') or LenderLead ('l') objects, in display order
+    """
+    if cat == 'p':
+        return _properties(data)
+    if cat == 'pd':
+        return _project_details(data)
+    if cat in {'l', 'c'}:
+        return _leads(data, cat)
+    return _companies(data, cat)
+
+
+def _number(value, fmt):
+    return 'unknown' if value is None else fmt.format(value)
+
+
+def _describe_property(p):
+    kind = p.types[0] if len(p.types) == 1 else 'Mixed-use consisting of ' + ', '.join(p.types)
+    return (f"Name: {p.name or 'None'}  \n Address: {p.street_num} {p.street_name} {p.city} {p.state} {p.zip}"
+            f"  \nSize (sqft): {p.size:,.2f}mm  \nType: {kind}  \nProperty Class: {p.property_class or 'TBD'}"
+            f"  \nStatus: {p.status}.  \n")
+
+
+def _describe_project(d):
+    date = d.completion_date if d.status == 'completed' else f"{d.completion_date.strftime('%Y-%m-%d')} (anticipated)"
+    return (f"Owner(s): {', '.join(d.owners)}  \n" f"Developed by: {d.developer}  \n"
+            f"Designed by: {', '.join(d.designers)}  \n" f"Built by: {', '.join(d.contractors)}  \n"
+            f"Financed by: {', '.join(d.lenders)}  \n" f"Status: {d.status}  \n"
+            f"Completion Date: {date}  \n" f"Awards won: {', '.join(d.awards)}  \n")
+
+
+def _describe_company(c):
+    developer = isinstance(c, DeveloperLead)
+    return (f"Name: {c.name} "
+            f"  \nNumber of Employees: {_number(c.num_employees, '{:,}')} "
+            f"  \nAnnual revenues: {_number(c.revenue, '${:,.2f}mm')}"
+            f"  \n{('Regional Focus: ' if developer else 'Type: ')} "
+            f"{(c.region or 'unknown') if developer else c.designer_type} "
+            f"  \n{('Specialization: ' if developer else 'Associated Property types: ')} {', '.join(c.property_types)} "
+            f"  \nNumber of projects in database: {c.num_projects} "
+            f"  \nContact info (email / phone #): {c.email or 'unknown'} / {c.phone_number or 'unknown'}.  \n")
+
+
+def _describe_lead(c):
+    info = (f"Name: {c.name}   \nNumber of Employees: {_number(c.num_employees, '{:,}')}"
+            f"   \nAnnual Revenues: {_number(c.revenue, '${:,.2f}mm')}")
+    if isinstance(c, ContractorLead):
+        info += (f"  \nSpace Completed over the past 5 years (sqft): {_number(c.sqft_completed_5yrs, '{:,.2f}mm')}"
+                 f"  \nSpace Currently under constructions (sqft): "
+                 f"{_number(c.sqft_under_construction, '{:,.2f}mm')}")
+    else:
+        info += (f"  \nLoan Amounts: {_number(c.min_loan, '${:,.2f}mm')} - {_number(c.max_loan, '${:,.2f}mm')}"
+                 f"  \nLoan Rates: {_number(c.min_rate, '${:,.2f}%')} - {_number(c.max_rate, '${:,.2f}%')} "
+                 f"  \nMaximum Loan-to-cost ratio: {_number(c.max_ltc, '${:,.2f}%')} ")
+    return (f"{info}  \nNumber of projects in database: {c.num_projects} "
+            f"  \nContract info (email / phone #): ({c.email or 'unknown'} / {c.phone_number or 'unknown'}).")
+
+
+def describe(record):
+    """
+    :param record: A record returned by collect()
+    :return: A string object, the record formatted as markdown
+    """
+    if isinstance(record, PropertyResult):
+        return _describe_property(record)
+    if isinstance(record, ProjectDetail):
+        return _describe_project(record)
+    if isinstance(record, (ContractorLead, LenderLead)):
+        return _describe_lead(record)
+    return _describe_company(record)
+
+
+def format_page(records, cat, total=None):
+    """
+    :param records: A list of records returned by collect(), the entries on the page
+    :param cat: a string object denoting processing option
+    :param total: An integer object counting every result when records holds only one page of them
+    :return: A string object, the page formatted as markdown
+    """
+    header = f" {len(records) if total is None else total} result(s):  \n"
+    if cat == 'pd':
+        return '\n'.join(map(describe, records))
+    if cat in {'l', 'c'}:
+        return header + '  \n\n'.join(map(describe, records))
+    return header + '\n'.join(map(describe, records))
+
+
+def team_table(ranked):
+    """
+    :param ranked: A list of (role, CompanyLead) pairs, e.g. engine.Team.ranked
+    :return: A list of dictionary objects, one table row per pair, in the same order
+    """
+    return [{'Role': role, 'Name': lead.name, 'Projects': lead.num_projects,
+             'Employees': _number(lead.num_employees, '{:,}'), 'Revenue': _number(lead.revenue, '${:,.2f}mm'),
+             'Email': lead.email or 'unknown', 'Phone': lead.phone_number or 'unknown'} for role, lead in ranked]
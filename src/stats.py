@@ -0,0 +1,87 @@
+"""
+Refreshes the materialized views the searches read: company_project_stats, which the lead
+generation searches join against, and project_facets, the counts next to the Projects filters
+
+The views are refreshed CONCURRENTLY, so searches keep reading the previous snapshot while they are
+rebuilt. Refresh on demand after loading projects (python stats.py), or set a schedule in an
+optional [stats] section of database.ini:
+
+    [stats]
+    refresh_interval = 900        ; seconds between background refreshes, 0 disables them
+
+Functions:
+
+    refresh(bool, list)
+    start_schedule()
+"""
+
+import logging
+import threading
+import time
+
+import cache
+import db
+import watermarks
+
+STATS_DEFAULTS = {'refresh_interval': 0.0}
+# Every view, with the tables it is computed from
+VIEWS = {
+    'company_project_stats': {'developers', 'designers', 'contractors', 'lenders', 'projects', 'used_as'},
+    'project_facets': {'buildings', 'used_as'},
+}
+
+logger = logging.getLogger(__name__)
+
+_schedule = None
+_schedule_lock = threading.Lock()
+
+
+def refresh(concurrently=True, views=None):
+    """
+    Rebuilds the views and drops the cached searches that read them, in this process and, through
+    their change watermarks, in every other app process.
+
+    :param concurrently: A boolean object; False takes an exclusive lock but also works on a never-populated view
+    :param views: A list of the keys of VIEWS to rebuild, every view if None
+    :return: A float object, the seconds the refresh took
+    """
+    views = list(VIEWS) if views is None else views
+    start = time.perf_counter()
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            for view in views:
+                cur.execute(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if concurrently else ''}{view};")
+            watermarks.bump(cur, views)
+    cache.get_cache().invalidate(*views)
+    return time.perf_counter() - start
+
+
+def _run_schedule(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            logger.info("refreshed %s in %.2fs", ', '.join(VIEWS), refresh())
+        except Exception:
+            logger.exception("materialized view refresh failed")
+
+
+def start_schedule():
+    """
+    Starts the background refresh thread if [stats] refresh_interval is set. Safe to call on every rerun.
+
+    :return: void
+    """
+    global _schedule
+    with _schedule_lock:
+        if _schedule is not None:
+            return
+        interval = db.get_settings('stats', STATS_DEFAULTS)['refresh_interval']
+        if interval <= 0:
+            _schedule = False
+            return
+        _schedule = threading.Thread(target=_run_schedule, args=(interval,), name='stats-refresh', daemon=True)
+        _schedule.start()
+
+
+if __name__ == '__main__':
+    print(f"refreshed {', '.join(VIEWS)} in {refresh():.2f}s")
@@ -0,0 +1,258 @@
+"""
+Synthetic data generator for the ER schema, for benchmarking
+
+Generates a reproducible data set scaled by the number of buildings (10k to 10M) and streams it into
+Postgres with COPY in fixed-size chunks, so memory stays flat at any scale. Enumerated columns use
+the values in constants.py. Companies are split across the developer, designer, contractor and
+lender roles (the rest only own buildings), and city sizes follow a long tail so some searches
+return a handful of properties and others thousands.
+
+Usage (from src/, against the database in database.ini; --reset drops and recreates every table):
+
+    python synthetic.py --buildings 100000 --reset
+
+Functions:
+
+    reset_schema()
+    generate(int, int)
+    load(int, int, bool)
+"""
+
+import argparse
+import datetime
+import io
+import os
+import random
+import time
+
+import db
+import migrate
+import stats
+from constants import STATES, PROPERTY_TYPES, PROPERTY_CLASSES, STATUSES, REGIONS
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+TABLES = ['Used_as', 'Specializes_in', 'Recieved_award', 'Awards', 'Projects', 'Owned_by', 'Mortgage', 'Financed_by',
+          'Built_by', 'Designed_by', 'Lenders', 'Contractors', 'Designers', 'Developers', 'Companies',
+          'Property_types', 'Buildings']
+CHUNK_ROWS = 50000
+
+CITY_NAMES = ['Springfield', 'Franklin', 'Greenville', 'Bristol', 'Clinton', 'Fairview', 'Salem', 'Madison',
+              'Georgetown', 'Arlington', 'Ashland', 'Dover', 'Oxford', 'Jackson', 'Burlington', 'Manchester',
+              'Milton', 'Newport', 'Auburn', 'Dayton']
+STREET_NAMES = ['Main St', 'Broadway', 'Park Ave', 'Oak St', 'Maple Ave', 'Washington St', 'Lake Shore Dr',
+                'Market St', 'Fifth Avenue', 'Elm St', 'Pine St', 'Cedar Ln', 'Hill Rd', 'River Rd', 'Union Sq']
+COMPANY_WORDS = ['Acme', 'Summit', 'Pioneer', 'Harbor', 'Keystone', 'Granite', 'Beacon', 'Meridian', 'Sterling',
+                 'Atlas', 'Crescent', 'Liberty', 'Pinnacle', 'Redwood', 'Vanguard', 'Horizon']
+ROLE_SUFFIXES = {'developer': ['Realty', 'Development', 'Properties'], 'designer': ['Design', 'Architects',
+                 'Engineering'], 'contractor': ['Construction', 'Builders'], 'lender': ['Capital', 'Bank', 'Lending'],
+                 'owner': ['Holdings', 'Partners', 'Trust']}
+# Share of companies per role; the remainder only own buildings
+ROLE_SHARES = [('developer', 0.2), ('designer', 0.25), ('contractor', 0.2), ('lender', 0.15)]
+AWARDS = [(f'{word} Award', org) for word in ('Excellence', 'Innovation', 'Green Building', 'Design', 'Safety')
+          for org in ('AIA', 'USGBC', 'ULI', 'NAIOP')]
+
+
+def reset_schema():
+    """
+    Drops every application table, view and migration record, then recreates the tables from schema.sql.
+
+    :return: void
+    """
+    with open(SCHEMA_FILE) as f:
+        create = '\n'.join(line for line in f.read().splitlines() if not line.upper().startswith('DROP TABLE'))
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DROP MATERIALIZED VIEW IF EXISTS company_project_stats;")
+            cur.execute("DROP MATERIALIZED VIEW IF EXISTS project_facets;")
+            cur.execute("DROP TABLE IF EXISTS schema_migrations;")
+            cur.execute("DROP TABLE IF EXISTS typeahead_log;")
+            for table in TABLES:
+                cur.execute(f"DROP TABLE IF EXISTS {table} CASCADE;")
+            cur.execute(create)
+
+
+def _fed_id(i):
+    return f'{i:010d}'
+
+
+def _roles(num_companies):
+    roles, start = {}, 1
+    for role, share in ROLE_SHARES:
+        count = max(1, int(num_companies * share))
+        roles[role] = range(start, start + count)
+        start += count
+    roles['owner'] = range(start, num_companies + 1)
+    return roles
+
+
+def generate(buildings, seed=0):
+    """
+    Generates every table's rows lazily.
+
+    :param buildings: An integer object, the number of buildings
+    :param seed: An integer object seeding the random generator
+    :return: A list of (table, columns, row iterator) tuples in load order
+    """
+    num_companies = max(200, buildings // 20)
+    roles = _roles(num_companies)
+    # Long-tailed city sizes: weight the k-th city of every state by 1/k
+    cities = [(state, city) for state in STATES for city in CITY_NAMES]
+    weights = [1.0 / (1 + i % len(CITY_NAMES)) for i in range(len(cities))]
+
+    def companies():
+        rng = random.Random(seed)
+        for role, ids in roles.items():
+            for i in ids:
+                yield (_fed_id(i), f"{rng.choice(COMPANY_WORDS)} {rng.choice(ROLE_SUFFIXES[role])} {i}",
+                       rng.choice([None, rng.randint(5, 5000)]), rng.choice([None, round(rng.uniform(1, 900), 2)]),
+                       rng.choice([None, f'info{i}@example.com']), f'555-{i // 10000 % 1000:03d}-{i % 10000:04d}')
+
+    def developers():
+        rng = random.Random(seed + 1)
+        for i in roles['developer']:
+            yield _fed_id(i), rng.choice(REGIONS + [None])
+
+    def designers():
+        rng = random.Random(seed + 2)
+        for i in roles['designer']:
+            yield _fed_id(i), rng.randint(0, 500), rng.choice(['Architect', 'Architect-Engineer', 'Engineer'])
+
+    def contractors():
+        rng = random.Random(seed + 3)
+        for i in roles['contractor']:
+            yield _fed_id(i), rng.choice([None, round(rng.uniform(0, 30), 2)]), round(rng.uniform(0, 10), 2)
+
+    def lenders():
+        rng = random.Random(seed + 4)
+        for i in roles['lender']:
+            low_loan, low_rate = round(rng.uniform(1, 50), 1), round(rng.uniform(2, 7), 2)
+            yield (_fed_id(i), low_loan, round(low_loan + rng.uniform(10, 500), 1), low_rate,
+                   round(low_rate + rng.uniform(0.5, 5), 2), rng.choice([60, 65, 70, 75, 80, 85, 90]))
+
+    def specializes_in():
+        rng = random.Random(seed + 5)
+        for i in range(1, num_companies + 1):
+            for type_name in rng.sample(PROPERTY_TYPES, rng.choice([1, 1, 2])):
+                yield _fed_id(i), type_name
+
+    def buildings_rows():
+        rng = random.Random(seed + 6)
+        for b in range(1, buildings + 1):
+            k = rng.choices(range(len(cities)), weights)[0]
+            state, city = cities[k]
+            # Every city gets its own block of about 20 zip codes
+            yield (b, rng.choice([None, f'{rng.choice(COMPANY_WORDS)} Tower {b}']), round(rng.uniform(0.5, 200), 2),
+                   rng.choice(PROPERTY_CLASSES + [None]), rng.choice(STATUSES), b, rng.choice(STREET_NAMES), city,
+                   state, 1000 + (k * 211) % 98000 + rng.randint(0, 20))
+
+    def used_as():
+        rng = random.Random(seed + 7)
+        for b in range(1, buildings + 1):
+            for type_name in rng.sample(PROPERTY_TYPES, rng.choice([1, 1, 1, 1, 2])):
+                yield b, type_name
+
+    def projects():
+        rng = random.Random(seed + 8)
+        for b in range(1, buildings + 1):
+            if rng.random() < 0.7:
+                yield (b, _fed_id(rng.choice(roles['designer'])), _fed_id(rng.choice(roles['contractor'])),
+                       _fed_id(rng.choice(roles['lender'])), _fed_id(rng.choice(roles['developer'])),
+                       datetime.date(2000, 1, 1) + datetime.timedelta(days=rng.randint(0, 365 * 30)))
+
+    def owned_by():
+        rng = random.Random(seed + 9)
+        for b in range(1, buildings + 1):
+            for owner in rng.sample(range(1, num_companies + 1), rng.choice([1, 1, 2])):
+                yield b, _fed_id(owner), datetime.date(1990, 1, 1) + datetime.timedelta(days=rng.randint(0, 365 * 30))
+
+    def recieved_award():
+        rng = random.Random(seed + 10)
+        for project in projects():
+            if rng.random() < 0.05:
+                name, org = rng.choice(AWARDS)
+                yield project[:5] + (name, org, project[5].year)
+
+    return [
+        ('Property_types', ['name'], ((t,) for t in PROPERTY_TYPES)),
+        ('Companies', ['fed_id', 'name', 'num_of_employees', 'revenue_$mm', 'email', 'phone_number'], companies()),
+        ('Developers', ['fed_id', 'regional_focus'], developers()),
+        ('Designers', ['fed_id', 'projects_completed', 'type'], designers()),
+        ('Contractors', ['fed_id', 'sqft_completed_5yrs', 'sqft_under_construction'], contractors()),
+        ('Lenders', ['fed_id', 'min_loan_size_$mm', 'max_loan_size_$mm', 'min_rate', 'max_rate', 'max_ltc'],
+         lenders()),
+        ('Specializes_in', ['fed_id', 'type_name'], specializes_in()),
+        ('Buildings', ['building_id', 'name', 'size_sqf_0000', 'property_class', 'status', 'street_num',
+                       'street_name', 'city', 'state', 'zip'], buildings_rows()),
+        ('Used_as', ['b_id', 'type_name'], used_as()),
+        ('Projects', ['b_id', 'designer_id', 'contractor_id', 'lender_id', 'developer_id', 'completion_date'],
+         projects()),
+        ('Owned_by', ['b_id', 'fed_id', 'since'], owned_by()),
+        ('Awards', ['name', 'organization'], iter(AWARDS)),
+        ('Recieved_award', ['b_id', 'designer_id', 'contractor_id', 'lender_id', 'developer_id', 'award_name',
+                            'award_org', 'award_year'], recieved_award()),
+    ]
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def _copy(cur, table, columns, rows):
+    count = 0
+    while True:
+        buf = io.StringIO()
+        chunk = 0
+        for row in rows:
+            buf.write('\t'.join(_copy_value(v) for v in row) + '\n')
+            chunk += 1
+            if chunk == CHUNK_ROWS:
+                break
+        if not chunk:
+            return count
+        buf.seek(0)
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+        count += chunk
+
+
+def load(buildings, seed=0, run_migrations=True):
+    """
+    Loads a generated data set, then applies pending migrations and refreshes the project statistics.
+
+    :param buildings: An integer object, the number of buildings
+    :param seed: An integer object seeding the random generator
+    :param run_migrations: A boolean object; False skips migrations (e.g. where pg_trgm is unavailable)
+    :return: A dictionary object mapping table names to rows loaded
+    """
+    counts = {}
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            for table, columns, rows in generate(buildings, seed):
+                counts[table] = _copy(cur, table, columns, rows)
+            cur.execute("SELECT setval('buildings_building_id_seq', %s);", (buildings,))
+    if run_migrations:
+        migrate.migrate()
+        stats.refresh(concurrently=False)
+    with db.connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE;")
+        conn.autocommit = False
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load a synthetic data set for benchmarking.')
+    parser.add_argument('--buildings', type=int, default=10000, help='number of buildings (10k to 10M)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--reset', action='store_true', help='drop and recreate every table first')
+    parser.add_argument('--no-migrate', action='store_true', help='skip migrations and the stats refresh')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.reset:
+        reset_schema()
+    for table, count in load(args.buildings, args.seed, not args.no_migrate).items():
+        print(f"{table:16} {count:>12,}")
+    print(f"loaded in {time.perf_counter() - start:.1f}s")
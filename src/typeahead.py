@@ -0,0 +1,219 @@
+"""
+Typeahead suggestions for company names and street names, served from memory
+
+Each process keeps a sorted index of every word-start suffix of Companies.name and of the
+distinct Buildings.street_name values, so a lookup is a binary search plus a short scan, with no
+database round trip per keystroke. "rea" finds "Acme Realty" as well as "Realty Partners".
+
+The indexes are built in a background thread on first use (suggest() returns nothing until they
+are ready) and kept up to date incrementally from typeahead_log, which triggers on Companies and
+Buildings append to (see migrations/0003_typeahead_log.sql). A log entry committed after a later
+one has been applied could be skipped, so the indexes are also rebuilt from scratch every
+rebuild_interval. Settings come from an optional [typeahead] section of database.ini:
+
+    [typeahead]
+    refresh_interval = 5          ; seconds between polls of typeahead_log, 0 disables updates
+    rebuild_interval = 3600       ; seconds between full rebuilds
+    limit = 10                    ; suggestions returned
+
+Functions:
+
+    suggest(string, string, int)
+    suggest_address(string, int)
+    start()
+"""
+
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+import psycopg2
+
+import db
+
+TYPEAHEAD_DEFAULTS = {'refresh_interval': 5.0, 'rebuild_interval': 3600.0, 'limit': 10}
+KINDS = {'company': 'c', 'street': 's'}
+# Applying more log entries than this at once is slower than rebuilding the sorted list
+BULK_CHANGES = 10000
+LOG_RETENTION = '1 day'
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixIndex:
+    """Sorted (suffix, name) pairs for every word start of every name, with a count per name."""
+
+    def __init__(self, names=()):
+        self.counts = Counter()
+        for name, count in names:
+            self.counts[name] += count
+        self.entries = sorted(entry for name in self.counts for entry in self._suffixes(name))
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _suffixes(name):
+        lowered = name.lower()
+        return [(lowered[m.start():], name) for m in re.finditer(r'\w+', lowered)]
+
+    def apply(self, changes):
+        """
+        :param changes: A list of (name, +1 or -1) pairs
+        :return: void
+        """
+        with self.lock:
+            added, removed = [], []
+            for name, delta in changes:
+                before = self.counts[name]
+                self.counts[name] += delta
+                if self.counts[name] <= 0:
+                    del self.counts[name]
+                    if before > 0:
+                        removed.append(name)
+                elif before <= 0:
+                    added.append(name)
+            if len(added) + len(removed) > BULK_CHANGES:
+                self.entries = sorted(entry for name in self.counts for entry in self._suffixes(name))
+                return
+            for name in removed:
+                for entry in self._suffixes(name):
+                    i = bisect.bisect_left(self.entries, entry)
+                    if i < len(self.entries) and self.entries[i] == entry:
+                        del self.entries[i]
+            for name in added:
+                for entry in self._suffixes(name):
+                    bisect.insort(self.entries, entry)
+
+    def search(self, text, limit):
+        """
+        :param text: A string object, the start of any word of the name, e.g. 'acme re'
+        :param limit: An integer object, the maximum number of names returned
+        :return: A list of distinct names, in the order of the matched text
+        """
+        prefix = ' '.join(text.lower().split())
+        found = []
+        if not prefix:
+            return found
+        with self.lock:
+            i = bisect.bisect_left(self.entries, (prefix,))
+            while i < len(self.entries) and len(found) < limit:
+                suffix, name = self.entries[i]
+                if not suffix.startswith(prefix):
+                    break
+                if name not in found:
+                    found.append(name)
+                i += 1
+        return found
+
+
+_indexes = {}
+_settings = None
+_started = None
+_lock = threading.Lock()
+
+
+def _build(conn):
+    # One snapshot for the names and the log position, so no change is applied twice or missed
+    conn.set_session(isolation_level='REPEATABLE READ')
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COALESCE(MAX(id), 0) FROM typeahead_log;")
+            last_id = cur.fetchone()[0]
+            cur.execute("SELECT name, COUNT(*) FROM Companies GROUP BY name;")
+            companies = PrefixIndex(cur.fetchall())
+            cur.execute("SELECT street_name, COUNT(*) FROM Buildings GROUP BY street_name;")
+            streets = PrefixIndex(cur.fetchall())
+        conn.commit()
+    except Exception:
+        # The session is restored on a best-effort basis, so the error raised is the one that stopped the build
+        try:
+            conn.rollback()
+            conn.set_session(isolation_level='DEFAULT')
+        except psycopg2.Error:
+            pass
+        raise
+    conn.set_session(isolation_level='DEFAULT')
+    _indexes.update({'c': companies, 's': streets})
+    return last_id
+
+
+def _poll(conn, last_id):
+    with conn.cursor() as cur:
+        cur.execute("SELECT MIN(id) FROM typeahead_log;")
+        oldest = cur.fetchone()[0]
+        if oldest is not None and oldest > last_id + 1:
+            # Entries this process had not applied yet have been pruned
+            conn.commit()
+            return _build(conn)
+        cur.execute("SELECT id, kind, name, op FROM typeahead_log WHERE id > %s ORDER BY id;", (last_id,))
+        rows = cur.fetchall()
+        cur.execute(f"DELETE FROM typeahead_log WHERE logged_at < now() - interval '{LOG_RETENTION}';")
+    conn.commit()
+    changes = {'c': [], 's': []}
+    for id_, kind, name, op in rows:
+        changes[kind].append((name, 1 if op == 'I' else -1))
+        last_id = id_
+    for kind, kind_changes in changes.items():
+        if kind_changes:
+            _indexes[kind].apply(kind_changes)
+    return last_id
+
+
+def _run(settings):
+    last_id, built = None, 0.0
+    while True:
+        try:
+            with db.connection() as conn:
+                if last_id is None or time.time() - built >= settings['rebuild_interval']:
+                    last_id, built = _build(conn), time.time()
+                    logger.info("built typeahead indexes")
+                else:
+                    last_id = _poll(conn, last_id)
+        except Exception:
+            logger.exception("typeahead index update failed")
+        if settings['refresh_interval'] <= 0 and last_id is not None:
+            return
+        time.sleep(max(settings['refresh_interval'], 1.0))
+
+
+def start():
+    """
+    Starts building and updating the indexes in a background thread. Safe to call on every rerun.
+
+    :return: void
+    """
+    global _started, _settings
+    with _lock:
+        if _started is not None:
+            return
+        _settings = db.get_settings('typeahead', TYPEAHEAD_DEFAULTS)
+        _started = threading.Thread(target=_run, args=(_settings,), name='typeahead', daemon=True)
+        _started.start()
+
+
+def suggest(kind, text, limit=None):
+    """
+    :param kind: A string object, 'company' or 'street'
+    :param text: A string object, what the user has typed so far
+    :param limit: An integer object, the maximum number of suggestions, [typeahead] limit if None
+    :return: A list of names; empty while the indexes are still being built
+    """
+    start()
+    index = _indexes.get(KINDS[kind])
+    if index is None:
+        return []
+    return index.search(text, limit or _settings['limit'])
+
+
+def suggest_address(text, limit=None):
+    """
+    :param text: A string object, a street number followed by the start of a street name, e.g. '350 fif'
+    :param limit: An integer object, the maximum number of suggestions, [typeahead] limit if None
+    :return: A list of street addresses, e.g. ['350 Fifth Avenue']
+    """
+    match = re.match(r'^\s*(\d+)\s+(.*)$', text)
+    if not match:
+        return []
+    return [f'{match.group(1)} {street}' for street in suggest('street', match.group(2), limit)]
@@ -0,0 +1,164 @@
+"""
+Startup warm-up, so the first searches after a deploy do not pay for a cold process
+
+The app itself starts without importing pandas, opening more than one connection or running any
+search. start() does that work in a background thread instead, while the first page renders, in
+three stages whose times are logged and kept for the performance panel:
+
+    imports        pandas and numpy, which query results and lender matching are built with
+    connections    checks out the connections the pool opens at startup, so they are connected before the
+                   first sessions arrive, and prepares every search statement on each of them
+    searches       runs the most frequent searches into the result cache: the first page of Projects
+                   in the cities with the most buildings, and the lead searches without filters
+
+Settings come from an optional [warmup] section of database.ini:
+
+    [warmup]
+    enabled = 1                   ; 0 skips the warm-up
+    cities = 5                    ; cities whose Projects search is cached
+
+Functions:
+
+    warm_imports()
+    warm_connections()
+    warm_searches(int)
+    run()
+    start()
+    timings()
+"""
+
+import contextlib
+import importlib
+import logging
+import threading
+import time
+
+import psycopg2
+
+import db
+import engine
+import queries
+from constants import PAGE_SIZES
+
+WARMUP_DEFAULTS = {'enabled': 1, 'cities': 5}
+HEAVY_MODULES = ('numpy', 'pandas')
+TOP_CITIES_SQL = "SELECT state, city FROM Buildings GROUP BY state, city ORDER BY COUNT(*) DESC, state, city LIMIT %s;"
+
+logger = logging.getLogger(__name__)
+
+_timings = {}
+_started = None
+_lock = threading.Lock()
+
+
+def warm_imports():
+    """
+    :return: void
+    """
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+
+def warm_connections():
+    """
+    Checks out the connections the pool opens at startup ([pool] minconn) and prepares every statement on them.
+
+    :return: An integer object, the number of statements prepared
+    """
+    count = db.get_settings('pool', db.POOL_DEFAULTS)['minconn']
+    prepared, skipped = 0, {}
+    with contextlib.ExitStack() as stack:
+        # Held together, so each is a different connection
+        for conn in [stack.enter_context(db.connection(read_only=True)) for _ in range(count)]:
+            for name in queries.STATEMENTS:
+                try:
+                    queries.prepare(conn, name)
+                    prepared += 1
+                except psycopg2.Error as e:
+                    # e.g. the map searches without the earthdistance extension; they fail again when run
+                    conn.rollback()
+                    skipped[name] = str(e).splitlines()[0]
+    if skipped:
+        logger.warning("could not prepare %s", '; '.join(f'{name} ({error})' for name, error in skipped.items()))
+    return prepared
+
+
+def _searches(cities):
+    with db.connection(read_only=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute(TOP_CITIES_SQL, (cities,))
+            top = cur.fetchall()
+    found = [(f'projects in {city}, {state}', engine.projects(state, city)) for state, city in top]
+    regions = engine.regions()
+    return found + [('developers', engine.developers(regions)), ('architects', engine.architects()),
+                    ('engineers', engine.engineers()), ('contractors', engine.contractors()),
+                    ('lenders', engine.lenders())]
+
+
+def warm_searches(cities):
+    """
+    Caches the count and first page of the searches most users start with.
+
+    :param cities: An integer object, the number of cities with the most buildings to cache Projects searches for
+    :return: An integer object, the number of searches cached
+    """
+    cached = 0
+    for label, search in _searches(cities):
+        try:
+            if engine.paged(search):
+                engine.count(search)
+                engine.records(search, 1, PAGE_SIZES[0])
+            else:
+                engine.records(search)
+            cached += 1
+        except Exception:
+            logger.exception("could not warm up the %s search", label)
+    return cached
+
+
+def run():
+    """
+    Runs every warm-up stage in turn, logging how long each took.
+
+    :return: A dictionary object mapping stage names to seconds, as timings() returns it afterwards
+    """
+    settings = db.get_settings('warmup', WARMUP_DEFAULTS)
+    start = time.perf_counter()
+    for stage, warm in (('imports', warm_imports),
+                        ('connections', warm_connections),
+                        ('searches', lambda: warm_searches(settings['cities']))):
+        began = time.perf_counter()
+        try:
+            result = warm()
+        except Exception:
+            logger.exception("warm-up stage %s failed", stage)
+            result = None
+        _timings[stage] = time.perf_counter() - began
+        logger.info("warm-up %s in %.2fs%s", stage, _timings[stage], '' if result is None else f" ({result})")
+    _timings['total'] = time.perf_counter() - start
+    logger.info("warm-up finished in %.2fs", _timings['total'])
+    return dict(_timings)
+
+
+def start():
+    """
+    Starts the warm-up in a background thread unless [warmup] disables it. Safe to call on every rerun.
+
+    :return: void
+    """
+    global _started
+    with _lock:
+        if _started is not None:
+            return
+        if not db.get_settings('warmup', WARMUP_DEFAULTS)['enabled']:
+            _started = False
+            return
+        _started = threading.Thread(target=run, name='warmup', daemon=True)
+        _started.start()
+
+
+def timings():
+    """
+    :return: A dictionary object mapping the finished warm-up stages (and 'total' once done) to seconds
+    """
+    return dict(_timings)
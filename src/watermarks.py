@@ -0,0 +1,103 @@
+"""
+Per-table change watermarks, for dropping only the cached results a data load has made stale
+
+Writers record the tables they changed with bump(), in the transaction that changed them, which
+increments each table's version in change_watermarks (see migrations/0005_change_watermarks.sql).
+Every app process polls the versions in a background thread and, for the tables whose version
+moved, invalidates the cached results read from them and reloads the reference data if it reads
+them. Results read from other tables stay cached. The poll interval is set in an optional
+[watermarks] section of database.ini:
+
+    [watermarks]
+    poll_interval = 5             ; seconds between polls, 0 disables them
+
+Functions:
+
+    bump(cursor, list)
+    versions(connection)
+    start()
+"""
+
+import logging
+import threading
+import time
+
+import cache
+import db
+import refdata
+
+WATERMARKS_DEFAULTS = {'poll_interval': 5.0}
+
+logger = logging.getLogger(__name__)
+
+_watcher = None
+_lock = threading.Lock()
+
+
+def bump(cur, tables):
+    """
+    Records a change to each table, visible to the app processes once the transaction commits.
+
+    :param cur: A psycopg2 cursor object, in the transaction that changed the tables
+    :param tables: An iterable of table names, matched case-insensitively
+    :return: void
+    """
+    names = sorted({t.lower() for t in tables})
+    if not names:
+        return
+    # Sorted, so concurrent writers lock the watermark rows in the same order
+    cur.execute("""INSERT INTO change_watermarks (table_name, version)
+                   SELECT name, 1 FROM unnest(%s::varchar[]) name
+                   ON CONFLICT (table_name) DO UPDATE SET version = change_watermarks.version + 1,
+                   changed_at = now();""", (names,))
+
+
+def versions(conn):
+    """
+    :param conn: A psycopg2 connection object
+    :return: A dictionary object mapping lower-case table names to their version
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT table_name, version FROM change_watermarks;")
+        return dict(cur.fetchall())
+
+
+def _changed(before, after):
+    return {table for table, version in after.items() if before.get(table) != version}
+
+
+def _run(interval):
+    seen = None
+    while True:
+        try:
+            with db.connection() as conn:
+                current = versions(conn)
+            if seen is not None:
+                changed = _changed(seen, current)
+                if changed:
+                    dropped = cache.get_cache().invalidate(*changed)
+                    logger.info("tables %s changed, dropped %d cached results", ', '.join(sorted(changed)), dropped)
+                    if changed & set(refdata.SOURCE_TABLES):
+                        refdata.load()
+            seen = current
+        except Exception:
+            logger.exception("change watermark poll failed")
+        time.sleep(interval)
+
+
+def start():
+    """
+    Starts polling the watermarks if [watermarks] poll_interval is set. Safe to call on every rerun.
+
+    :return: void
+    """
+    global _watcher
+    with _lock:
+        if _watcher is not None:
+            return
+        interval = db.get_settings('watermarks', WATERMARKS_DEFAULTS)['poll_interval']
+        if interval <= 0:
+            _watcher = False
+            return
+        _watcher = threading.Thread(target=_run, args=(interval,), name='watermarks', daemon=True)
+        _watcher.start()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app's modules are flat in src/ and import one another by name, as when run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,104 @@
+import threading
+
+import numpy as np
+import pytest
+
+from cache import ResultCache
+
+
+def block(size):
+    # Counted by its nbytes, so sizes are exact
+    return np.zeros(size, dtype='uint8')
+
+
+def test_evicts_least_recently_used_past_byte_budget():
+    cache = ResultCache(30, 60)
+    for key in 'abc':
+        cache.put(key, block(10), 'projects')
+    assert cache.get('a') is not None
+    cache.put('d', block(10), 'projects')
+    assert cache.get('b') is None
+    assert all(cache.get(key) is not None for key in 'acd')
+    assert cache.stats()['bytes'] == 30
+    assert cache.stats()['evictions'] == 1
+
+
+def test_skips_values_larger_than_budget():
+    cache = ResultCache(30, 60)
+    cache.put('a', block(31), 'projects')
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 0
+
+
+def test_expires_per_family():
+    cache = ResultCache(100, 60, {'projects': 0})
+    cache.put('a', block(10), 'projects')
+    cache.put('b', block(10), 'developers')
+    assert cache.get('a') is None
+    assert cache.get('b') is not None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_invalidate_drops_results_of_changed_tables():
+    cache = ResultCache(100, 60)
+    cache.put('a', block(10), 'projects', ('Buildings', 'Used_as'))
+    cache.put('b', block(10), 'developers', ('Developers',))
+    assert cache.invalidate('BUILDINGS') == 1
+    assert cache.get('a') is None
+    assert cache.get('b') is not None
+
+
+def test_load_caches_loader_result():
+    cache = ResultCache(100, 60)
+    assert cache.load('a', lambda: block(10), 'projects')[1] == 'miss'
+    value, outcome = cache.load('a', lambda: pytest.fail('loaded twice'), 'projects')
+    assert outcome == 'hit' and len(value) == 10
+
+
+def test_concurrent_loads_of_a_key_run_once():
+    cache = ResultCache(100, 60)
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return block(10)
+
+    outcomes = []
+    threads = [threading.Thread(target=lambda: outcomes.append(cache.load('a', loader, 'projects')[1]))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    # Every follower is waiting once coalesced counts it
+    while cache.stats()['coalesced'] < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert sorted(outcomes) == ['coalesced'] * 3 + ['miss']
+
+
+def test_failed_load_is_raised_and_not_cached():
+    cache = ResultCache(100, 60)
+
+    def loader():
+        raise RuntimeError('down')
+
+    with pytest.raises(RuntimeError):
+        cache.load('a', loader, 'projects')
+    assert cache.stats()['loading'] == 0
+    assert cache.load('a', lambda: block(10), 'projects')[1] == 'miss'
+
+
+def test_records_are_sized_with_their_values():
+    from cache import _sizeof
+    from results import PropertyResult
+
+    shell = PropertyResult(*[None] * len(PropertyResult._fields))
+    record = PropertyResult(1, 'Tower ' * 100, 10, 'Main St', 'Boston', 'MA', 2110, 1.5, ('Office', 'Retail'),
+                            'A', 'completed', None)
+    assert _sizeof([record]) - _sizeof([shell]) > len('Tower ' * 100)
+    # A value shared by several records is counted once
+    assert _sizeof([record, record]) < 2 * _sizeof([record])
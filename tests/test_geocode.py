@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+import geocode
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    # The address_location parameters each locate() call asks for
+    calls = []
+
+    def query_db(name, params):
+        calls.append(params)
+        return pd.DataFrame({'latitude': [40.75], 'longitude': [-73.99]})
+
+    monkeypatch.setattr(geocode, 'query_db', query_db)
+    return calls
+
+
+@pytest.mark.parametrize('text', ['350 Fifth Avenue 10118', '350 Fifth Avenue, 10118',
+                                  '350 Fifth Avenue, New York, NY 10118', ' 350  Fifth Avenue , New York NY, 10118 '])
+def test_street_address_is_matched_without_city_and_state(lookups, text):
+    assert geocode.locate(text) == (40.75, -73.99)
+    assert lookups == [(350, '%fifth avenue%', 10118)]
+
+
+def test_zip_code_alone(lookups):
+    assert geocode.locate('10118') == (40.75, -73.99)
+    assert lookups == [(None, None, 10118)]
+
+
+def test_coordinates_are_not_looked_up(lookups):
+    assert geocode.locate('40.7484, -73.9857') == (40.7484, -73.9857)
+    assert geocode.locate('91, 0') is None
+    assert lookups == []
+
+
+def test_unknown_input(lookups):
+    assert geocode.locate('New York, NY') is None
+    assert lookups == []
@@ -0,0 +1,99 @@
+import itertools
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import lending
+from lending import LenderIndex
+
+
+def lender_terms(count=300, seed=7):
+    # Shaped like the lender_terms statement's result, with some terms missing and some one-value ranges
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        min_loan = rng.choice([None, 0.5, 1.0, 5.0, 10.0, 25.0])
+        max_loan = None if min_loan is None else min_loan + rng.choice([0.0, 5.0, 20.0, 100.0])
+        min_rate = rng.choice([None, 3.0, 4.5, 6.0])
+        max_rate = None if min_rate is None else min_rate + rng.choice([0.0, 1.5, 4.0])
+        rows.append({'fed_id': f'{rng.randrange(10 ** 9):010d}', 'name': rng.choice(['Eagle', 'Summit', 'Harbor'])
+                     + f' Capital {i}', 'email': None, 'phone_number': None, 'num_employees': -1, 'revenue': -1,
+                     'min_loan': min_loan, 'max_loan': max_loan, 'min_rate': min_rate, 'max_rate': max_rate,
+                     'max_ltc': rng.choice([None, 60.0, 75.0, 90.0]), 'num_proj': rng.randrange(4)})
+    return pd.DataFrame(rows)
+
+
+def fit(value, low, high):
+    half = (high - low) / 2
+    return abs(value - (low + high) / 2) / half if half > 0 else 0.0
+
+
+def sql_lenders(terms, amount, rate, ltc, word, num_of_projects):
+    # The lenders statement, row by row: a criterion at 0 matches any lender, a missing term matches no criterion
+    found = []
+    for row in terms.to_dict('records'):
+        known = {k: None if v is None or v != v else v for k, v in row.items()}
+        if known['num_proj'] < num_of_projects or word not in row['name'].lower():
+            continue
+        if amount and not (known['min_loan'] is not None and known['min_loan'] <= amount <= known['max_loan']):
+            continue
+        if rate and not (known['min_rate'] is not None and known['min_rate'] <= rate <= known['max_rate']):
+            continue
+        if ltc and not (known['max_ltc'] is not None and known['max_ltc'] >= ltc):
+            continue
+        fits = ((fit(amount, known['min_loan'], known['max_loan']) if amount else 0.0)
+                + (fit(rate, known['min_rate'], known['max_rate']) if rate else 0.0)
+                + (fit(ltc, 0.0, known['max_ltc']) if ltc else 0.0))
+        found.append((fits / max(bool(amount) + bool(rate) + bool(ltc), 1), row['fed_id']))
+    return sorted(found)
+
+
+@pytest.fixture(scope='module')
+def terms():
+    return lender_terms()
+
+
+@pytest.mark.parametrize('amount, rate, ltc, word, num_of_projects', [
+    (amount, rate, ltc, word, num) for amount, rate, ltc in itertools.product([0, 0.5, 5, 30], [0, 4.5, 7], [0, 70])
+    for word, num in (('', 0), ('eagle', 0), ('', 2))])
+def test_match_agrees_with_sql_semantics(terms, amount, rate, ltc, word, num_of_projects):
+    index = LenderIndex(terms)
+    positions, closeness = index.match(amount, rate, ltc, f'%{word or "_"}%', num_of_projects)
+    expected = sql_lenders(terms, amount, rate, ltc, word, num_of_projects)
+    assert list(index.output['fed_id'].iloc[positions]) == [fed_id for _, fed_id in expected]
+    assert closeness == pytest.approx([c for c, _ in expected])
+
+
+def test_missing_terms_only_match_open_criteria():
+    terms = lender_terms(2)
+    terms.loc[0, ['min_loan', 'max_loan', 'min_rate', 'max_rate', 'max_ltc']] = [1.0, 10.0, 3.0, 5.0, 80.0]
+    terms.loc[1, ['min_loan', 'max_loan', 'min_rate', 'max_rate', 'max_ltc']] = [None, None, 3.0, 5.0, None]
+    terms['num_proj'] = 0
+    index = LenderIndex(terms)
+    assert len(index.match()[0]) == 2
+    assert len(index.match(rate=4.0)[0]) == 2
+    assert list(index.output['fed_id'].iloc[index.match(amount=5.0)[0]]) == [terms.loc[0, 'fed_id']]
+    # The statement shows missing terms as -1
+    assert (index.output.loc[index.output['fed_id'] == terms.loc[1, 'fed_id'], 'max_ltc'] == -1).all()
+
+
+@pytest.fixture
+def index(monkeypatch, terms):
+    index = LenderIndex(terms)
+    monkeypatch.setattr(lending, 'get_index', lambda: index)
+    return index
+
+
+def test_query_variants_take_the_statements_parameters(index, terms):
+    params = (5.0, 0.0, 0.0, '%_%', 0)
+    found = lending.query('lenders', params)
+    assert list(found.columns) == lending.COLUMNS
+    assert lending.query('lenders_count', params)['total'][0] == len(found)
+    page = lending.query('lenders_page', params + (10, 5))
+    assert list(page['fed_id']) == list(found['fed_id'][5:15])
+    top = lending.query('lenders_top', params + (5,))
+    ranked = found.sort_values(['num_proj', 'fed_id'], ascending=[False, True])
+    assert list(top['fed_id']) == list(ranked['fed_id'][:5])
+    assert np.all(np.diff(found['closeness']) >= 0)
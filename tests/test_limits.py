@@ -0,0 +1,76 @@
+import types
+
+import pytest
+
+import limits
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(limits, 'time', types.SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(limits, '_settings', dict(limits.TIMEOUT_DEFAULTS, engineers=10.0))
+    for state in ('_refused', '_timeouts', '_open_until'):
+        monkeypatch.setattr(limits, state, {})
+    return clock
+
+
+class Cursor:
+    def __init__(self, executed):
+        self.executed = executed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        self.executed.append((sql, params))
+
+
+def test_timeout_per_family(clock):
+    assert limits.timeout('engineers') == 10.0
+    assert limits.timeout('projects') == 30.0
+    assert limits.timeout('export') == 300.0
+
+
+def test_apply_sets_local_timeout_in_milliseconds(clock):
+    executed = []
+    limits.apply(types.SimpleNamespace(cursor=lambda: Cursor(executed)), 'engineers')
+    assert executed == [("SET LOCAL statement_timeout = %s;", (10000,))]
+
+
+def test_timed_out_search_is_refused_until_cooldown(clock):
+    limits.record_timeout('projects', ('NY', 'new york'))
+    with pytest.raises(limits.SearchTooBroad):
+        limits.check('projects', ('NY', 'new york'))
+    # Other searches of the family still run
+    limits.check('projects', ('MA', 'boston'))
+    clock.now += limits.TIMEOUT_DEFAULTS['breaker_cooldown']
+    limits.check('projects', ('NY', 'new york'))
+
+
+def test_repeated_timeouts_open_the_family_circuit(clock):
+    for city in ('a', 'b', 'c'):
+        limits.record_timeout('projects', ('NY', city))
+    with pytest.raises(limits.SearchTooBroad, match='too broad'):
+        limits.check('projects', ('MA', 'boston'))
+    limits.check('developers', ())
+    clock.now += limits.TIMEOUT_DEFAULTS['breaker_cooldown']
+    limits.check('projects', ('MA', 'boston'))
+
+
+def test_timeouts_outside_window_do_not_open_circuit(clock):
+    for city in ('a', 'b', 'c'):
+        limits.record_timeout('projects', ('NY', city))
+        clock.now += limits.TIMEOUT_DEFAULTS['breaker_window']
+    limits.check('projects', ('MA', 'boston'))
@@ -0,0 +1,146 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+import results
+
+# One query result per processing option, shaped like the rows of its statement
+FRAMES = {
+    'p': pd.DataFrame({
+        'building_id': [1, 1, 2], 'name': ['Tower One', 'Tower One', None], 'size_sqf_0000': [12.5, 12.5, 1234.567],
+        'property_class': ['A', 'A', None], 'status': ['completed', 'completed', 'planned'],
+        'street_num': [10, 10, 250], 'street_name': ['Main St', 'Main St', 'Oak Ave'], 'city': ['Boston'] * 3,
+        'state': ['MA'] * 3, 'zip': [2110, 2110, 2116], 'type_name': ['Office', 'Retail', 'Residential']}),
+    'pd': pd.DataFrame({
+        'developer': ['Acme Realty', 'Summit Partners'], 'status': ['completed', 'planned'],
+        'completion_date': [datetime.date(2019, 5, 1), datetime.date(2027, 1, 15)],
+        'designers': [['Blue Design'], ['Core Engineering']], 'contractors': [['Delta Construction'], []],
+        'lenders': [['Eagle Capital'], ['Harbor Capital']], 'owners': [['Tower One LLC'], ['Oak Holdings']],
+        'awards': [['Best Office'], []]}),
+    'd': pd.DataFrame({
+        'fed_id': ['0000000002', '0000000001', '0000000001'], 'name': ['Zenith Realty', 'Acme Realty', 'Acme Realty'],
+        'email': ['z@zenith.com', '', ''], 'phone_number': [None, '555-0100', '555-0100'],
+        'num_employees': [-1, 1200, 1200], 'revenue': [-1, 35.5, 35.5], 'regional_focus': [None, 'West', 'West'],
+        'type_name': ['None', 'Office', 'Retail'], 'num_proj': [0, 12, 12]}),
+    'a': pd.DataFrame({
+        'fed_id': ['0000000003'] * 2, 'name': ['Blue Design'] * 2, 'email': ['info@blue.com'] * 2,
+        'phone_number': ['555-0101'] * 2, 'num_employees': [45] * 2, 'revenue': [2.25] * 2,
+        'type': ['Architect'] * 2, 'type_name': ['Hospitality', 'Office'], 'num_proj': [7] * 2}),
+    'c': pd.DataFrame({
+        'fed_id': ['0000000004', '0000000005'], 'name': ['Delta Construction', 'Echo Builders'],
+        'email': ['d@delta.com', None], 'phone_number': ['555-0102', None], 'num_employees': [300, -1],
+        'revenue': [120.0, -1], 'sqft_completed_5yrs': [1.5, -1], 'sqft_under_construction': [0.75, -1],
+        'num_proj': [12, 0]}),
+    'l': pd.DataFrame({
+        'fed_id': ['0000000006'], 'name': ['Eagle Capital'], 'email': ['e@eagle.com'], 'phone_number': ['555-0103'],
+        'num_employees': [80], 'revenue': [15.0], 'min_loan': [1.0], 'max_loan': [50.0], 'min_rate': [3.5],
+        'max_rate': [6.0], 'max_ltc': [75.0], 'num_proj': [12], 'closeness': [0.25]}),
+}
+
+# Result counts passed for paged searches
+TOTALS = {'p': 40, 'd': 40}
+
+# The pages as the baseline helper.show() wrote them; its lead lists were sets, so their order was arbitrary
+EXPECTED = {
+    'p': (" 40 result(s):  \n"
+          "Name: Tower One  \n"
+          " Address: 10 Main St Boston MA 2110  \n"
+          "Size (sqft): 12.50mm  \n"
+          "Type: Mixed-use consisting of Office, Retail  \n"
+          "Property Class: A  \n"
+          "Status: completed.  \n"
+          "\n"
+          "Name: None  \n"
+          " Address: 250 Oak Ave Boston MA 2116  \n"
+          "Size (sqft): 1,234.57mm  \n"
+          "Type: Residential  \n"
+          "Property Class: TBD  \n"
+          "Status: planned.  \n"),
+    'pd': ("Owner(s): Tower One LLC  \n"
+           "Developed by: Acme Realty  \n"
+           "Designed by: Blue Design  \n"
+           "Built by: Delta Construction  \n"
+           "Financed by: Eagle Capital  \n"
+           "Status: completed  \n"
+           "Completion Date: 2019-05-01  \n"
+           "Awards won: Best Office  \n"
+           "\n"
+           "Owner(s): Oak Holdings  \n"
+           "Developed by: Summit Partners  \n"
+           "Designed by: Core Engineering  \n"
+           "Built by:   \n"
+           "Financed by: Harbor Capital  \n"
+           "Status: planned  \n"
+           "Completion Date: 2027-01-15 (anticipated)  \n"
+           "Awards won:   \n"),
+    'd': (" 40 result(s):  \n"
+          "Name: Acme Realty   \n"
+          "Number of Employees: 1,200   \n"
+          "Annual revenues: $35.50mm  \n"
+          "Regional Focus:  West   \n"
+          "Specialization:  Office, Retail   \n"
+          "Number of projects in database: 12   \n"
+          "Contact info (email / phone #): unknown / 555-0100.  \n"
+          "\n"
+          "Name: Zenith Realty   \n"
+          "Number of Employees: unknown   \n"
+          "Annual revenues: unknown  \n"
+          "Regional Focus:  unknown   \n"
+          "Specialization:  None   \n"
+          "Number of projects in database: 0   \n"
+          "Contact info (email / phone #): z@zenith.com / unknown.  \n"),
+    'a': (" 1 result(s):  \n"
+          "Name: Blue Design   \n"
+          "Number of Employees: 45   \n"
+          "Annual revenues: $2.25mm  \n"
+          "Type:  Architect   \n"
+          "Associated Property types:  Hospitality, Office   \n"
+          "Number of projects in database: 7   \n"
+          "Contact info (email / phone #): info@blue.com / 555-0101.  \n"),
+    'c': (" 2 result(s):  \n"
+          "Name: Delta Construction   \n"
+          "Number of Employees: 300   \n"
+          "Annual Revenues: $120.00mm  \n"
+          "Space Completed over the past 5 years (sqft): 1.50mm  \n"
+          "Space Currently under constructions (sqft): 0.75mm  \n"
+          "Number of projects in database: 12   \n"
+          "Contract info (email / phone #): (d@delta.com / 555-0102).  \n"
+          "\n"
+          "Name: Echo Builders   \n"
+          "Number of Employees: unknown   \n"
+          "Annual Revenues: unknown  \n"
+          "Space Completed over the past 5 years (sqft): unknown  \n"
+          "Space Currently under constructions (sqft): unknown  \n"
+          "Number of projects in database: 0   \n"
+          "Contract info (email / phone #): (unknown / unknown)."),
+    'l': (" 1 result(s):  \n"
+          "Name: Eagle Capital   \n"
+          "Number of Employees: 80   \n"
+          "Annual Revenues: $15.00mm  \n"
+          "Loan Amounts: $1.00mm - $50.00mm  \n"
+          "Loan Rates: $3.50% - $6.00%   \n"
+          "Maximum Loan-to-cost ratio: $75.00%   \n"
+          "Number of projects in database: 12   \n"
+          "Contract info (email / phone #): (e@eagle.com / 555-0103)."),
+}
+
+
+@pytest.mark.parametrize('cat', sorted(FRAMES))
+def test_format_page_matches_baseline(cat):
+    assert results.format_page(results.collect(FRAMES[cat], cat), cat, TOTALS.get(cat)) == EXPECTED[cat]
+
+
+def test_collect_keeps_one_record_per_entry():
+    properties = results.collect(FRAMES['p'], 'p')
+    assert [p.types for p in properties] == [('Office', 'Retail'), ('Residential',)]
+    developers = results.collect(FRAMES['d'], 'd')
+    assert [d.name for d in developers] == ['Acme Realty', 'Zenith Realty']
+    assert developers[1].num_employees is None and developers[1].region is None
+
+
+def test_team_table_rows():
+    lenders = results.collect(FRAMES['l'], 'l')
+    assert results.team_table([('Lender', lenders[0])]) == [
+        {'Role': 'Lender', 'Name': 'Eagle Capital', 'Projects': 12, 'Employees': '80', 'Revenue': '$15.00mm',
+         'Email': 'e@eagle.com', 'Phone': '555-0103'}]
@@ -0,0 +1,60 @@
+import psycopg2
+import pytest
+
+import typeahead
+from typeahead import PrefixIndex
+
+
+def test_search_matches_the_start_of_any_word():
+    index = PrefixIndex([('Acme Realty', 1), ('Blue Design', 1), ('Realty Partners', 2)])
+    assert index.search('real', 10) == ['Acme Realty', 'Realty Partners']
+    assert index.search('acme re', 10) == ['Acme Realty']
+    assert index.search('  ACME   re ', 10) == ['Acme Realty']
+    assert index.search('alty', 10) == []
+    assert index.search('', 10) == []
+
+
+def test_search_lists_each_name_once_up_to_limit():
+    index = PrefixIndex([('Main Main Street', 1), ('Main Avenue', 1), ('Mainland Road', 1)])
+    assert index.search('main', 10) == ['Main Avenue', 'Main Main Street', 'Mainland Road']
+    assert index.search('main', 2) == ['Main Avenue', 'Main Main Street']
+
+
+def test_apply_adds_and_removes_names_as_their_counts_change():
+    index = PrefixIndex([('Acme Realty', 2)])
+    index.apply([('Acme Builders', 1), ('Acme Realty', -1)])
+    assert index.search('acme', 10) == ['Acme Builders', 'Acme Realty']
+    index.apply([('Acme Realty', -1)])
+    assert index.search('acme', 10) == ['Acme Builders']
+    assert 'Acme Realty' not in index.counts
+
+
+def test_apply_bulk_changes_rebuilds_the_same_index(monkeypatch):
+    monkeypatch.setattr(typeahead, 'BULK_CHANGES', 1)
+    names = [('Acme Realty', 1), ('Blue Design', 1)]
+    bulk = PrefixIndex(names)
+    bulk.apply([('Core Engineering', 1), ('Delta Construction', 1), ('Blue Design', -1)])
+    expected = PrefixIndex([('Acme Realty', 1), ('Core Engineering', 1), ('Delta Construction', 1)])
+    assert bulk.entries == expected.entries
+
+
+class BrokenConnection:
+    # The first statement fails, as does everything after it, like a connection the server dropped
+    def __init__(self):
+        self.sessions = []
+
+    def set_session(self, **kwargs):
+        if self.sessions:
+            raise psycopg2.InterfaceError('connection already closed')
+        self.sessions.append(kwargs)
+
+    def cursor(self):
+        raise psycopg2.OperationalError('server closed the connection unexpectedly')
+
+    def rollback(self):
+        raise psycopg2.InterfaceError('connection already closed')
+
+
+def test_build_raises_its_own_error():
+    with pytest.raises(psycopg2.OperationalError, match='server closed'):
+        typeahead._build(BrokenConnection())